@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+import asyncio
+
+
+class WallClock:
+    '''Runs the simulation in real time'''
+
+    def __init__(self, tick_interval: timedelta = timedelta(seconds=0.1)):
+        # The real time waited between each cycle of the os
+        self.__tick_interval = tick_interval
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    async def tick(self) -> None:
+        '''Waits between cycles of the os'''
+        await asyncio.sleep(self.__tick_interval.total_seconds())
+
+    async def sleep(self, duration: timedelta) -> None:
+        await asyncio.sleep(duration.total_seconds())
+
+
+class SimulatedClock:
+    '''Runs the simulation in simulated time, which moves forward a fixed step every cycle of the os rather than with real time'''
+
+    def __init__(self, step: timedelta = timedelta(seconds=0.1), start: datetime = datetime(2000, 1, 1)):
+        self.__step = step
+        self.__start = start
+        self.__now = start
+
+    @property
+    def step(self) -> timedelta:
+        return self.__step
+
+    @property
+    def time_elapsed(self) -> timedelta:
+        return self.__now - self.__start
+
+    def now(self) -> datetime:
+        return self.__now
+
+    def advance(self, duration: timedelta = None) -> None:
+        '''Moves simulated time forward by `duration`, or by one step'''
+        if duration is None:
+            duration = self.__step
+        self.__now += duration
+
+    async def tick(self) -> None:
+        '''Moves to the next step without waiting, letting other tasks run'''
+        self.advance()
+        await asyncio.sleep(0)
+
+    async def sleep(self, duration: timedelta) -> None:
+        '''Waits until `duration` of simulated time has passed'''
+        wake_time = self.__now + duration
+        while self.__now < wake_time:
+            await asyncio.sleep(0)
+
+
+# Shared by processes that have not been added to an os
+wall_clock = WallClock()
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from datetime import timedelta
+from math import ceil, sqrt
+from contextlib import redirect_stdout
+from clock import SimulatedClock
+from simulation import CentralProcessingUnit, OperatingSystem, pygame
+from pygame_functions import get_font, quit_pygame
+from workload import generate_workload, schedule_workload
+import argparse
+import asyncio
+import os
+
+
+class SimulationComparison:
+    '''Runs several operating systems that share one simulated clock on a single event loop, and draws them side by side in one window with shared time controls.
+    Space pauses, the right arrow steps once while paused, and the up and down arrows change how many steps run per frame.'''
+    # The area each os is drawn in before being scaled into its pane
+    PANE_CANVAS_SIZE = (1440, 600)
+    STATUS_BAR_HEIGHT = 30
+
+    def __init__(self, operating_systems: dict[str, OperatingSystem]):
+        clocks = {id(operating_system.clock)
+                  for operating_system in operating_systems.values()}
+        clock = next(iter(operating_systems.values())).clock
+        if len(clocks) != 1 or not isinstance(clock, SimulatedClock):
+            raise ValueError(
+                'Compared operating systems must share one SimulatedClock')
+        # Operating systems by the label drawn above them
+        self.__operating_systems = operating_systems
+        self.__clock: SimulatedClock = clock
+        self.paused = False
+        self.steps_per_frame = 1
+        # Operating systems are drawn to this canvas, then scaled down into their pane
+        self.__canvas = pygame.Surface(SimulationComparison.PANE_CANVAS_SIZE)
+        # Scaled panes by os state signature. Shared by all operating systems, so ones in the same state (or unchanged since the last frame) are not drawn again.
+        self.__pane_cache: OrderedDict[tuple, pygame.Surface] = OrderedDict()
+        self.__pane_cache_size = len(operating_systems) * 2
+        self.panes_drawn = 0
+
+    @property
+    def unfinished_processes(self) -> bool:
+        return any(operating_system.unfinished_processes for operating_system in self.__operating_systems.values())
+
+    def step(self) -> None:
+        '''Runs one cycle of every unfinished os, then moves the shared clock on'''
+        for operating_system in self.__operating_systems.values():
+            if operating_system.unfinished_processes:
+                operating_system.tick()
+        self.__clock.advance()
+
+    def pane_layout(self, screen_size: tuple[int, int]) -> tuple[int, int, tuple[int, int]]:
+        '''The number of columns and rows of panes, and the size of each pane, keeping the canvas aspect ratio'''
+        number_of_panes = len(self.__operating_systems)
+        columns = ceil(sqrt(number_of_panes))
+        rows = ceil(number_of_panes / columns)
+        width = screen_size[0] // columns
+        height = (screen_size[1] - SimulationComparison.STATUS_BAR_HEIGHT) // rows
+        canvas_width, canvas_height = SimulationComparison.PANE_CANVAS_SIZE
+        scale = min(width / canvas_width, height / canvas_height)
+        return columns, rows, (int(canvas_width * scale), int(canvas_height * scale))
+
+    def draw(self, screen: pygame.Surface) -> None:
+        '''Draws each os in its pane with the compact layout, and a status bar with the shared time controls'''
+        screen.fill('white')
+        columns, rows, pane_size = self.pane_layout(screen.get_size())
+        label_font = get_font(30)
+        for index, (label, operating_system) in enumerate(self.__operating_systems.items()):
+            pane_position = ((index % columns) * (screen.get_width() // columns), SimulationComparison.STATUS_BAR_HEIGHT + (
+                index // columns) * ((screen.get_height() - SimulationComparison.STATUS_BAR_HEIGHT) // rows))
+            screen.blit(self.pane(operating_system, pane_size), pane_position)
+            label_text = label_font.render(label, True, 'Black')
+            screen.blit(label_text, (pane_position[0] + pane_size[0] - label_text.get_width() - 5,
+                        pane_position[1] + pane_size[1] - label_text.get_height() - 5))
+            pygame.draw.rect(screen, 'Grey', (*pane_position, *pane_size), 1)
+        status = f'Time {self.__clock.time_elapsed}   {"PAUSED" if self.paused else "RUNNING"}   {self.steps_per_frame} step(s) per frame   [space] pause  [right] step  [up/down] speed'
+        screen.blit(label_font.render(status, True, 'Black'), (5, 5))
+
+    def pane(self, operating_system: OperatingSystem, pane_size: tuple[int, int]) -> pygame.Surface:
+        '''The compact drawing of the os scaled to `pane_size`, taken from the pane cache if an os has been drawn in the same state'''
+        signature = (operating_system.pygame_state_signature(), pane_size)
+        if signature in self.__pane_cache:
+            self.__pane_cache.move_to_end(signature)
+            return self.__pane_cache[signature]
+        self.__canvas.fill('white')
+        operating_system.pygame_create_graphics(self.__canvas, compact=True)
+        pane = pygame.transform.scale(self.__canvas, pane_size)
+        self.panes_drawn += 1
+        self.__pane_cache[signature] = pane
+        if len(self.__pane_cache) > self.__pane_cache_size:
+            self.__pane_cache.popitem(last=False)
+        return pane
+
+    async def run(self):
+        '''The shared run cycle of the compared operating systems'''
+        screen = pygame.display.set_mode(OperatingSystem.SCREEN_SIZE)
+        frame_clock = pygame.time.Clock()
+        pygame.display.set_caption('Process Scheduler Simulator - Comparison')
+        running = True
+        while self.unfinished_processes and running:
+            step_once = False
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        self.paused = not self.paused
+                    elif event.key == pygame.K_RIGHT:
+                        step_once = True
+                    elif event.key == pygame.K_UP:
+                        self.steps_per_frame *= 2
+                    elif event.key == pygame.K_DOWN:
+                        self.steps_per_frame = max(
+                            1, self.steps_per_frame // 2)
+            if not self.paused:
+                for _ in range(self.steps_per_frame):
+                    self.step()
+            elif step_once:
+                self.step()
+
+            self.draw(screen)
+            pygame.display.update()
+            frame_clock.tick(30)
+            await asyncio.sleep(0)
+        quit_pygame()
+
+    def report(self) -> str:
+        '''A line for each os comparing how far it got'''
+        return '\n'.join(f'{label}: {len(operating_system.finished_processes)} processes finished, {operating_system.cpu_efficiency_report()}' for label, operating_system in self.__operating_systems.items())
+
+
+def compare_round_robin_timings(seed: int, round_robin_timings: list[timedelta], number_of_processes: int = 30) -> SimulationComparison:
+    '''Creates a comparison of operating systems with different round robin timings, all given the same seeded workload'''
+    workload = generate_workload(seed, number_of_processes)
+    clock = SimulatedClock()
+    operating_systems = {}
+    for round_robin_timing in round_robin_timings:
+        operating_system = OperatingSystem(CentralProcessingUnit(
+            4000, timedelta(milliseconds=5), timedelta(milliseconds=10)), round_robin_timing, clock=clock)
+        schedule_workload(operating_system, workload)
+        operating_systems[f'Quantum {round_robin_timing.total_seconds()}s'] = operating_system
+    return SimulationComparison(operating_systems)
+
+
+async def main(seed: int, round_robin_timings: list[timedelta]):
+    pygame.init()
+    comparison = compare_round_robin_timings(seed, round_robin_timings)
+    # The operating systems print every cycle, which would be unreadable with several running
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        await comparison.run()
+    print(comparison.report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Runs the same workload with different round robin timings side by side')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--quanta', type=float, nargs='+',
+                        default=[0.05, 0.25, 1], help='round robin timings in seconds')
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.seed, [timedelta(seconds=seconds)
+                for seconds in arguments.quanta]))
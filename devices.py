@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+from enums import DeviceType, DeviceSchedulingDiscipline
+from random import random, randint, expovariate
+from typing import Union
+
+
+def uniform_service_time(minimum: timedelta, maximum: timedelta) -> callable:
+    '''Returns a service time function that picks a time uniformly between `minimum` and `maximum`'''
+    def service_time() -> timedelta:
+        return minimum + (maximum - minimum) * random()
+    return service_time
+
+
+def exponential_service_time(mean: timedelta) -> callable:
+    '''Returns a service time function that picks exponentially distributed times with the given `mean`'''
+    def service_time() -> timedelta:
+        return mean * expovariate(1)
+    return service_time
+
+
+class IORequest:
+    '''IORequest objects are submitted to a device by a blocked process, and are complete once the device has serviced them'''
+
+    def __init__(self, process, time_submitted: datetime, position: int, deadline: datetime):
+        self.__process = process
+        self.__time_submitted = time_submitted
+        # The position on the device (e.g. disk cylinder) the request is for
+        self.__position = position
+        self.__deadline = deadline
+        self.time_started: datetime = None
+        self.time_completed: datetime = None
+
+    def __repr__(self) -> str:
+        return f'{self.process} request at {self.position}'
+
+    @property
+    def process(self):
+        return self.__process
+
+    @property
+    def time_submitted(self) -> datetime:
+        return self.__time_submitted
+
+    @property
+    def position(self) -> int:
+        return self.__position
+
+    @property
+    def deadline(self) -> datetime:
+        return self.__deadline
+
+    @property
+    def is_complete(self) -> bool:
+        return self.time_completed is not None
+
+    @property
+    def queueing_delay(self) -> timedelta:
+        '''The time between the request being submitted and the device starting to service it'''
+        return self.time_started - self.time_submitted
+
+
+class Device:
+    '''An I/O device (disk, NIC) that services requests one at a time from a queue of limited depth'''
+
+    def __init__(self, name: str, device_type: DeviceType, service_time_function: callable, queue_depth: int = 8, discipline: DeviceSchedulingDiscipline = DeviceSchedulingDiscipline.FIFO, deadline: timedelta = timedelta(seconds=0.5), number_of_positions: int = 1000):
+        self.__name = name
+        self.__device_type = device_type
+        # The function that determines how long the device takes to service a request
+        self.__service_time_function = service_time_function
+        self.__queue_depth = queue_depth
+        self.__discipline = discipline
+        # How long a request may wait under the deadline discipline before it is served ahead of others
+        self.__deadline = deadline
+        self.__number_of_positions = number_of_positions
+        self.__queue: list[IORequest] = []
+        self.__request_in_service: IORequest = None
+        self.__time_service_finishes: datetime = None
+        self.__head_position = 0
+        self.__head_moving_up = True
+        self.__time_now: datetime = None
+        self.__time_first_update: datetime = None
+        self.__busy_time = timedelta(seconds=0)
+        self.completed_requests: list[IORequest] = []
+
+    def __repr__(self) -> str:
+        return self.__name
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def device_type(self) -> DeviceType:
+        return self.__device_type
+
+    @property
+    def discipline(self) -> DeviceSchedulingDiscipline:
+        return self.__discipline
+
+    @property
+    def queue(self) -> list[IORequest]:
+        return self.__queue
+
+    @property
+    def request_in_service(self) -> IORequest:
+        return self.__request_in_service
+
+    @property
+    def queue_full(self) -> bool:
+        return len(self.__queue) >= self.__queue_depth
+
+    def submit(self, process) -> Union[IORequest, None]:
+        '''Adds a request for the process to the device queue. Returns `None` if the queue is full.'''
+        if self.queue_full or self.__time_now is None:
+            return None
+        request = IORequest(process, self.__time_now, randint(
+            0, self.__number_of_positions - 1), self.__time_now + self.__deadline)
+        self.__queue.append(request)
+        # Start servicing straight away if the device is idle
+        if self.__request_in_service is None:
+            self.start_next_request(self.__time_now)
+        return request
+
+    def blocked_function(self, process) -> callable:
+        '''Returns a blocked function for a `PreemptReason.BLOCKED` preemption that submits a request to this device, and keeps the process blocked until the request is complete'''
+        def blocked_func():
+            request = self.submit(process)
+            while request is None:
+                # Device queue is full, so wait for space
+                yield True
+                request = self.submit(process)
+            while not request.is_complete:
+                yield True
+            yield False
+        return blocked_func
+
+    def update(self, now: datetime) -> None:
+        '''Completes any requests that have finished service by `now`, and starts servicing the next requests in the queue'''
+        if self.__time_first_update is None:
+            self.__time_first_update = now
+        self.__time_now = now
+        while self.__request_in_service is not None and self.__time_service_finishes <= now:
+            # Complete request at the time it actually finished
+            finished_request = self.__request_in_service
+            finished_request.time_completed = self.__time_service_finishes
+            self.__busy_time += finished_request.time_completed - finished_request.time_started
+            self.completed_requests.append(finished_request)
+            self.__request_in_service = None
+            self.start_next_request(finished_request.time_completed)
+
+    def start_next_request(self, now: datetime) -> None:
+        '''Picks the next request from the queue using the device scheduling discipline, and begins servicing it'''
+        if not self.__queue:
+            return
+        index_of_next_request = 0
+        if self.__discipline == DeviceSchedulingDiscipline.ELEVATOR:
+            index_of_next_request = self.index_of_next_elevator_request()
+        elif self.__discipline == DeviceSchedulingDiscipline.DEADLINE:
+            # Serve the request with the earliest expired deadline, otherwise fall back to elevator order
+            index_of_earliest_deadline = min(
+                range(len(self.__queue)), key=lambda index: self.__queue[index].deadline)
+            if self.__queue[index_of_earliest_deadline].deadline <= now:
+                index_of_next_request = index_of_earliest_deadline
+            else:
+                index_of_next_request = self.index_of_next_elevator_request()
+        request = self.__queue.pop(index_of_next_request)
+        request.time_started = now
+        self.__head_position = request.position
+        self.__request_in_service = request
+        self.__time_service_finishes = now + self.__service_time_function()
+
+    def index_of_next_elevator_request(self) -> int:
+        '''Finds the closest request in the direction the head is moving, reversing direction if there are none'''
+        for _ in range(2):
+            index_of_closest = None
+            closest_distance = None
+            for index, request in enumerate(self.__queue):
+                distance = request.position - self.__head_position
+                if not self.__head_moving_up:
+                    distance = -distance
+                if distance >= 0 and (closest_distance is None or distance < closest_distance):
+                    index_of_closest = index
+                    closest_distance = distance
+            if index_of_closest is not None:
+                return index_of_closest
+            self.__head_moving_up = not self.__head_moving_up
+        return 0
+
+    @property
+    def utilisation(self) -> float:
+        '''The fraction of time since the device was first updated that it has spent servicing requests'''
+        if self.__time_first_update is None or self.__time_now == self.__time_first_update:
+            return 0
+        busy_time = self.__busy_time
+        if self.__request_in_service is not None:
+            busy_time += self.__time_now - self.__request_in_service.time_started
+        return busy_time / (self.__time_now - self.__time_first_update)
+
+    @property
+    def mean_queueing_delay(self) -> timedelta:
+        '''The mean time completed requests spent waiting in the queue before being serviced'''
+        if not self.completed_requests:
+            return timedelta(seconds=0)
+        total_delay = sum([request.queueing_delay for request in self.completed_requests],
+                          timedelta(seconds=0))
+        return total_delay / len(self.completed_requests)
+
+    @property
+    def max_queueing_delay(self) -> timedelta:
+        if not self.completed_requests:
+            return timedelta(seconds=0)
+        return max([request.queueing_delay for request in self.completed_requests])
+
+    def report(self) -> str:
+        '''A summary of the device utilisation and queueing delay'''
+        return f'{self} ({self.device_type.name}, {self.discipline.name}): {len(self.completed_requests)} requests, utilisation {self.utilisation:.1%}, mean queueing delay {self.mean_queueing_delay}, max queueing delay {self.max_queueing_delay}'
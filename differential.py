@@ -0,0 +1,335 @@
+from contextlib import redirect_stdout
+from datetime import timedelta
+from random import Random
+from time import perf_counter
+from typing import TypedDict, Union
+from clock import SimulatedClock
+from engines import ENGINES
+from enums import ProcessPriority, ProcessStatus, ReferenceFix
+from process import Process
+from simulation import CentralProcessingUnit, OperatingSystem
+from workload import ProcessSpecification, generate_workload, schedule_workload
+import argparse
+import math
+import os
+
+# The cpu and os every engine is run with. Memory fits around a thousand typical processes, so queues grow with the workload.
+MEMORY_MB = 100000
+CONTEXT_SWITCH_COST = timedelta(milliseconds=5)
+CACHE_WARMUP_PENALTY = timedelta(milliseconds=10)
+ROUND_ROBIN_TIMING = timedelta(seconds=0.1)
+STEP = timedelta(seconds=0.05)
+
+
+class StepRecord(TypedDict):
+    '''The scheduling decisions an engine made during a step, in the order it made them, and where its processes are at the end of the step.
+    Queues are sorted, as the order an engine keeps them in is only seen through the events.'''
+    events: list[str]
+    running: Union[str, None]
+    new: list[str]
+    ready: dict[str, list[str]]
+    blocked: list[str]
+    finished: list[str]
+
+
+class Mismatch(TypedDict):
+    step: int
+    field: str
+    reference: object
+    engine: object
+
+
+class EquivalenceResult(TypedDict):
+    engine: str
+    seed: int
+    size: int
+    mismatch: Union[Mismatch, None]
+    # The smallest workload found that still gives a mismatch, or `None` if the engine matched
+    shrunk_workload: Union[list[ProcessSpecification], None]
+    shrunk_mismatch: Union[Mismatch, None]
+
+
+class InOrderAdmission(OperatingSystem):
+    '''The reference scheduler with `ReferenceFix.ADMISSION_SKIPS` fixed, in the simplest way'''
+
+    def admit_processes(self):
+        for process in list(self.new_process_queue):
+            if self.process_fits(process):
+                self.new_process_queue.remove(process)
+                self.admit_process(process)
+
+
+class InOrderUnblocking(OperatingSystem):
+    '''The reference scheduler with `ReferenceFix.UNBLOCKING_SKIPS` fixed, in the simplest way'''
+
+    def check_blocked_processes(self):
+        for process in list(self.blocked_processes):
+            if self.check_blocked_process(process):
+                self.blocked_processes.remove(process)
+                process.status = ProcessStatus.READY
+                self.add_process_to_ready_queue(process)
+
+
+class ShortestJobFirst(OperatingSystem):
+    '''The reference scheduler with `ReferenceFix.SHORTEST_JOB` fixed, in the simplest way'''
+
+    def pop_shortest_job(self) -> Process:
+        queue = self.ready_queue_LOW_priority
+        index_of_shortest_job = min(range(len(queue)), key=lambda index: queue[index].time_to_complete -
+                                    queue[index].cpu_time_recieved)
+        return self.ready_queue_LOW_priority_pop(index_of_shortest_job)
+
+
+REFERENCE_FIXES = {
+    ReferenceFix.ADMISSION_SKIPS: InOrderAdmission,
+    ReferenceFix.UNBLOCKING_SKIPS: InOrderUnblocking,
+    ReferenceFix.SHORTEST_JOB: ShortestJobFirst
+}
+
+
+def reference_engine(fixes: frozenset[ReferenceFix]) -> type:
+    '''The reference `OperatingSystem` with the given bugs fixed, for comparing with an engine that deliberately fixes them'''
+    if not fixes:
+        return OperatingSystem
+    return type('FixedOperatingSystem', tuple(REFERENCE_FIXES[fix] for fix in sorted(fixes, key=lambda fix: fix.value)) + (OperatingSystem,), {})
+
+
+def random_workload(seed: int, size: int) -> list[ProcessSpecification]:
+    '''A workload whose arrival rate, mix of priorities and memory sizes are also chosen by the seed, so seeds cover light and overloaded cpus, with and without processes queueing for memory'''
+    random = Random(seed)
+    priority_weights = {priority: random.random() + 0.1 for priority in (
+        ProcessPriority.HIGH, ProcessPriority.IO, ProcessPriority.LOW)}
+    return generate_workload(seed, size, arrivals_per_second=random.uniform(0.3, 3), priority_weights=priority_weights, memory_range_mb=(2, random.choice([200, 2000, 20000])))
+
+
+class EventRecorder:
+    '''Mixed into an engine to record each process it admits, unblocks and dispatches, in order'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events: list[str] = []
+
+    def admit_process(self, process_to_move: Process) -> None:
+        self.events.append(f'admit {process_to_move.identifier}')
+        super().admit_process(process_to_move)
+
+    def check_blocked_process(self, process: Process) -> bool:
+        unblocked = super().check_blocked_process(process)
+        if unblocked:
+            self.events.append(f'unblock {process.identifier}')
+        return unblocked
+
+    def charge_context_switch(self, process: Process) -> None:
+        # Called once for each process dispatched, with the process chosen
+        self.events.append(f'dispatch {process.identifier}')
+        super().charge_context_switch(process)
+
+
+def create_engine(engine_class: type, workload: list[ProcessSpecification], record_events: bool = False) -> OperatingSystem:
+    if record_events:
+        engine_class = type(
+            f'Recorded{engine_class.__name__}', (EventRecorder, engine_class), {})
+    operating_system: OperatingSystem = engine_class(CentralProcessingUnit(
+        MEMORY_MB, CONTEXT_SWITCH_COST, CACHE_WARMUP_PENALTY), ROUND_ROBIN_TIMING, clock=SimulatedClock(STEP))
+    schedule_workload(operating_system, workload)
+    return operating_system
+
+
+def step_record(operating_system: OperatingSystem) -> StepRecord:
+    '''The record of the step just run by an engine created with `record_events`, clearing its events for the next step'''
+    events = operating_system.events[:]
+    operating_system.events.clear()
+    return {
+        'events': events,
+        'running': operating_system.running_process[0].identifier if operating_system.running_process else None,
+        'new': sorted(process.identifier for process in operating_system.new_process_queue),
+        'ready': {priority: sorted(process.identifier for process in queue) for priority, queue in operating_system.ready_queue.items()},
+        'blocked': sorted(process.identifier for process in operating_system.blocked_processes),
+        'finished': sorted(process.identifier for process in operating_system.finished_processes)
+    }
+
+
+def first_mismatch(engine_class: type, workload: list[ProcessSpecification], max_steps: int = 100000) -> Union[Mismatch, None]:
+    '''Runs the engine and the reference (with the engine's deliberate fixes) in lockstep, comparing the events of every step in order, then where their processes are. Returns the first difference, or `None` if they agree until both finish.'''
+    reference_class = reference_engine(
+        getattr(engine_class, 'DELIBERATE_FIXES', frozenset()))
+    # The os prints as it schedules, which is not wanted here
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        reference = create_engine(
+            reference_class, workload, record_events=True)
+        engine = create_engine(engine_class, workload, record_events=True)
+        for step in range(max_steps):
+            if not reference.unfinished_processes and not engine.unfinished_processes:
+                return None
+            reference.tick()
+            engine.tick()
+            reference.clock.advance()
+            engine.clock.advance()
+            reference_record = step_record(reference)
+            engine_record = step_record(engine)
+            for field, reference_value in reference_record.items():
+                if engine_record[field] != reference_value:
+                    return {'step': step, 'field': field, 'reference': reference_value, 'engine': engine_record[field]}
+    return None
+
+
+def simplified_specifications(specification: ProcessSpecification, previous_arrival_time: timedelta) -> list[ProcessSpecification]:
+    '''Simpler versions of a process to try while shrinking: one that never blocks, one needing half the cpu time, one needing half the memory and one arriving half as long after the process before it'''
+    simplified = []
+    if specification['time_to_blocked'] is not None:
+        simplified.append(
+            {**specification, 'time_to_blocked': None, 'turns_blocked': 0})
+    half_time_to_complete = timedelta(milliseconds=round(
+        specification['time_to_complete'].total_seconds() * 500))
+    if half_time_to_complete >= timedelta(milliseconds=1):
+        time_to_blocked = specification['time_to_blocked']
+        if time_to_blocked is not None:
+            time_to_blocked = min(time_to_blocked, half_time_to_complete)
+        simplified.append({**specification, 'time_to_complete': half_time_to_complete,
+                          'time_to_blocked': time_to_blocked})
+    half_memory_mb = round(specification['memory_mb'] / 2, 1)
+    if half_memory_mb >= 1:
+        simplified.append({**specification, 'memory_mb': half_memory_mb})
+    # Arrivals stay in order, as the gap to the process before only gets smaller
+    arrival_time = previous_arrival_time + timedelta(milliseconds=round(
+        (specification['arrival_time'] - previous_arrival_time).total_seconds() * 500))
+    if arrival_time < specification['arrival_time']:
+        simplified.append({**specification, 'arrival_time': arrival_time})
+    return simplified
+
+
+def shrink(workload: list[ProcessSpecification], fails: callable) -> list[ProcessSpecification]:
+    '''The smallest workload found for which `fails` is still True: removes chunks of processes (halving the chunk size when none can be removed), then moves the workload earlier and simplifies the processes left one at a time'''
+    chunk_size = max(1, len(workload) // 2)
+    while True:
+        index = 0
+        removed = False
+        while index < len(workload):
+            candidate = workload[:index] + workload[index + chunk_size:]
+            if candidate and fails(candidate):
+                workload = candidate
+                removed = True
+            else:
+                index += chunk_size
+        if not removed:
+            if chunk_size == 1:
+                break
+            chunk_size //= 2
+    simplified = True
+    while simplified:
+        simplified = False
+        # Moving every arrival earlier together keeps the processes' gaps
+        shift = timedelta(milliseconds=round(
+            workload[0]['arrival_time'].total_seconds() * 500))
+        if shift:
+            candidate = [{**specification, 'arrival_time': specification['arrival_time'] - shift}
+                         for specification in workload]
+            if fails(candidate):
+                workload = candidate
+                simplified = True
+                continue
+        for index, specification in enumerate(workload):
+            previous_arrival_time = workload[index - 1]['arrival_time'] if index else timedelta(
+                seconds=0)
+            for simpler_specification in simplified_specifications(specification, previous_arrival_time):
+                candidate = workload[:index] + \
+                    [simpler_specification] + workload[index + 1:]
+                if fails(candidate):
+                    workload = candidate
+                    simplified = True
+                    break
+    return workload
+
+
+def check_equivalence(engine_name: str, seeds: list[int], sizes: list[int]) -> list[EquivalenceResult]:
+    '''Compares the engine with the reference on a random workload for every seed and size, shrinking any mismatch'''
+    engine_class = ENGINES[engine_name]
+    results: list[EquivalenceResult] = []
+    for size in sizes:
+        for seed in seeds:
+            workload = random_workload(seed, size)
+            mismatch = first_mismatch(engine_class, workload)
+            shrunk_workload = None
+            shrunk_mismatch = None
+            if mismatch is not None:
+                shrunk_workload = shrink(
+                    workload, lambda candidate: first_mismatch(engine_class, candidate) is not None)
+                shrunk_mismatch = first_mismatch(engine_class, shrunk_workload)
+            results.append({'engine': engine_name, 'seed': seed, 'size': size, 'mismatch': mismatch,
+                           'shrunk_workload': shrunk_workload, 'shrunk_mismatch': shrunk_mismatch})
+    return results
+
+
+def time_engine(engine_class: type, workload: list[ProcessSpecification]) -> float:
+    '''The seconds the engine takes to run the workload to the end'''
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        operating_system = create_engine(engine_class, workload)
+        time_started = perf_counter()
+        while operating_system.unfinished_processes:
+            operating_system.tick()
+            operating_system.clock.advance()
+        return perf_counter() - time_started
+
+
+def speed_up_report(engine_names: list[str], sizes: list[int], seed: int, arrivals_per_second: float = 30, repeats: int = 5) -> str:
+    '''A line for each workload size comparing how long the reference and each engine take to run it, with each engine's speed-up. Processes arrive faster than they can be run, so queues grow with the workload size.
+    The reference and engines are run in turn `repeats` times and the fastest run of each is kept, so a machine that is busy for a while slows them alike.'''
+    engine_classes = [OperatingSystem] + \
+        [ENGINES[engine_name] for engine_name in engine_names]
+    lines = []
+    for size in sizes:
+        workload = generate_workload(
+            seed, size, arrivals_per_second=arrivals_per_second)
+        times = [math.inf] * len(engine_classes)
+        for _ in range(repeats):
+            for index, engine_class in enumerate(engine_classes):
+                times[index] = min(
+                    times[index], time_engine(engine_class, workload))
+        reference_time = times[0]
+        engine_times = [f'{engine_name} {engine_time:.3f}s ({reference_time / engine_time:.2f}x)'
+                        for engine_name, engine_time in zip(engine_names, times[1:])]
+        lines.append(
+            f'{size} processes: reference {reference_time:.3f}s, {", ".join(engine_times)}')
+    return '\n'.join(lines)
+
+
+def describe_workload(workload: list[ProcessSpecification]) -> str:
+    return '\n'.join(f"  Process{index + 1}: {specification['priority'].name}, arrives {specification['arrival_time']}, needs {specification['time_to_complete']}, {specification['memory_mb']}MB" + (f", blocks after {specification['time_to_blocked']} for {specification['turns_blocked']} turns" if specification['time_to_blocked'] is not None else '') for index, specification in enumerate(workload))
+
+
+def equivalence_report(results: list[EquivalenceResult]) -> str:
+    lines = []
+    for result in results:
+        if result['mismatch'] is None:
+            continue
+        mismatch = result['shrunk_mismatch'] or result['mismatch']
+        lines.append(
+            f"{result['engine']} differs on seed {result['seed']} with {result['size']} processes, shrunk to {len(result['shrunk_workload'])} processes differing at step {mismatch['step']} in {mismatch['field']}: reference {mismatch['reference']}, engine {mismatch['engine']}")
+        lines.append(describe_workload(result['shrunk_workload']))
+    for engine_name in sorted({result['engine'] for result in results}):
+        engine_results = [
+            result for result in results if result['engine'] == engine_name]
+        matched = sum(result['mismatch'] is None for result in engine_results)
+        fixes = getattr(ENGINES[engine_name], 'DELIBERATE_FIXES', frozenset())
+        lines.append(
+            f"{engine_name}: {matched}/{len(engine_results)} workloads match the reference{' with ' + ', '.join(sorted(fix.name for fix in fixes)) + ' fixed' if fixes else ''}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Checks that optimised engines make the same scheduling decisions as the reference os, and how much faster they are')
+    parser.add_argument('--engines', nargs='+',
+                        default=list(ENGINES.keys()), choices=list(ENGINES.keys()))
+    parser.add_argument('--seeds', type=int, default=20,
+                        help='random workloads checked for each size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--speed-sizes', type=int, nargs='+',
+                        default=[100, 400, 1600], help='workload sizes to time')
+    arguments = parser.parse_args()
+    results = []
+    for engine_name in arguments.engines:
+        results.extend(check_equivalence(
+            engine_name, list(range(arguments.seeds)), arguments.sizes))
+    print(equivalence_report(results))
+    print(speed_up_report(arguments.engines, arguments.speed_sizes, seed=0))
@@ -0,0 +1,217 @@
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Union
+from enums import PreemptReason, ProcessPriority, ProcessStatus, ReferenceFix
+from paging import memory_in_bytes
+from process import Process
+from simulation import OperatingSystem
+from synchronisation import SynchronisationPrimitive
+import heapq
+import math
+
+
+class ProcessQueue:
+    '''A queue of processes in the order they were added, used by engines in place of the os's lists. An ordered set underneath, so adding, removing and checking for any process, and taking the first or last, take O(1) rather than searching the queue.
+    Only the list methods the os uses are provided. Indexing gives the process at a position, as for a list, in O(n).'''
+
+    def __init__(self):
+        self.__processes: OrderedDict[Process, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__processes)
+
+    def __iter__(self):
+        return iter(self.__processes)
+
+    def __contains__(self, process: Process) -> bool:
+        return process in self.__processes
+
+    def __getitem__(self, index: int) -> Process:
+        if index == 0 and self.__processes:
+            return next(iter(self.__processes))
+        return list(self.__processes)[index]
+
+    def __repr__(self) -> str:
+        return repr(list(self.__processes))
+
+    def append(self, process: Process) -> None:
+        self.__processes[process] = None
+
+    def remove(self, process: Process) -> None:
+        if process not in self.__processes:
+            raise ValueError(f'{process} is not in the queue')
+        del self.__processes[process]
+
+    def pop(self, index: int = -1) -> Process:
+        if not self.__processes:
+            raise IndexError('pop from empty queue')
+        if index == 0:
+            return self.__processes.popitem(last=False)[0]
+        if index == -1:
+            return self.__processes.popitem()[0]
+        process = self[index]
+        self.remove(process)
+        return process
+
+
+class MinimumTree:
+    '''Values at positions 0, 1, 2... (infinite until set) that can find the first position from a start with a value below a threshold in O(log n)'''
+
+    def __init__(self):
+        self.__capacity = 1
+        # A segment tree: leaves are at `capacity` onwards and each node holds the minimum of its two children
+        self.__tree = [math.inf, math.inf]
+
+    def set(self, position: int, value: float) -> None:
+        while position >= self.__capacity:
+            self.__grow()
+        tree = self.__tree
+        index = position + self.__capacity
+        tree[index] = value
+        index //= 2
+        while index:
+            tree[index] = min(tree[2 * index], tree[2 * index + 1])
+            index //= 2
+
+    def __grow(self) -> None:
+        leaves = self.__tree[self.__capacity:]
+        self.__capacity *= 2
+        tree = [math.inf] * self.__capacity + leaves + \
+            [math.inf] * (self.__capacity - len(leaves))
+        for index in range(self.__capacity - 1, 0, -1):
+            tree[index] = min(tree[2 * index], tree[2 * index + 1])
+        self.__tree = tree
+
+    def first_below(self, start: int, threshold: float) -> Union[int, None]:
+        return self.__search(1, 0, self.__capacity, start, threshold)
+
+    def __search(self, index: int, low: int, high: int, start: int, threshold: float) -> Union[int, None]:
+        if high <= start or self.__tree[index] >= threshold:
+            return None
+        if high - low == 1:
+            return low
+        middle = (low + high) // 2
+        position = self.__search(2 * index, low, middle, start, threshold)
+        if position is None:
+            position = self.__search(
+                2 * index + 1, middle, high, start, threshold)
+        return position
+
+
+class IndexedOperatingSystem(OperatingSystem):
+    '''An os that makes the same scheduling decisions as `OperatingSystem`, apart from the bugs in `DELIBERATE_FIXES`, with faster data structures:
+    the new process and ready queues are `ProcessQueue`s, so processes are taken from them without searching; the shortest job is taken from a heap rather than found by scanning the low priority queue; new processes are admitted by searching a tree of their memory for the next that fits rather than checking each in turn; and the blocked queue is checked in one pass.
+    Paging, process groups, real time scheduling and synchronisation primitives are not checked against the reference by `differential.py`, so they are refused.'''
+    DELIBERATE_FIXES = frozenset(
+        {ReferenceFix.ADMISSION_SKIPS, ReferenceFix.UNBLOCKING_SKIPS, ReferenceFix.SHORTEST_JOB})
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.memory_manager is not None or self.root_group is not None or self.real_time_scheduler is not None:
+            raise ValueError(
+                'The indexed engine does not support paging, process groups or real time scheduling')
+        self.new_process_queue = ProcessQueue()
+        self.ready_queue = {priority_name: ProcessQueue()
+                            for priority_name in self.ready_queue}
+        # Low priority processes by the cpu time they still need, as a heap of (time needed, order added, process). A process' time needed does not change while it waits.
+        self.__shortest_jobs: list[tuple[timedelta, int, Process]] = []
+        self.__jobs_added = 0
+        # The order the current heap entry of each low priority process was added, so entries left behind when a process moves queue are skipped
+        self.__job_entries: dict[Process, int] = {}
+        # The memory in bytes of each process waiting for admission, by the order it was added to the new process queue
+        self.__waiting_memory = MinimumTree()
+        self.__waiting_processes: list[Process] = []
+        self.__processes_waiting = 0
+        # False once the queue has been changed without the tree, after which the one pass check is always used
+        self.__waiting_indexed = True
+
+    def add_new_processes(self, *new_processes: Process) -> None:
+        for process in new_processes:
+            if any(preemption.preempt_reason in (PreemptReason.ACQUIRE, PreemptReason.RELEASE) for preemption in process.preemptions):
+                raise ValueError(
+                    f'The indexed engine does not support synchronisation primitives, which {process} uses')
+        super().add_new_processes(*new_processes)
+        for process in new_processes:
+            self.__waiting_memory.set(len(self.__waiting_processes),
+                                      memory_in_bytes(process.memory_required))
+            self.__waiting_processes.append(process)
+            self.__processes_waiting += 1
+
+    def add_synchronisation_primitives(self, *new_primitives: SynchronisationPrimitive) -> None:
+        raise ValueError(
+            'The indexed engine does not support synchronisation primitives')
+
+    def add_process_to_ready_queue(self, process_to_move: Process) -> None:
+        super().add_process_to_ready_queue(process_to_move)
+        if process_to_move.priority == ProcessPriority.LOW:
+            heapq.heappush(self.__shortest_jobs, (process_to_move.time_to_complete -
+                           process_to_move.cpu_time_recieved, self.__jobs_added, process_to_move))
+            self.__job_entries[process_to_move] = self.__jobs_added
+            self.__jobs_added += 1
+
+    def pop_shortest_job(self) -> Process:
+        '''Takes the job needing the least cpu time from the low priority queue, the first added between equals'''
+        queue = self.ready_queue_LOW_priority
+        while self.__shortest_jobs:
+            _, order_added, process = heapq.heappop(self.__shortest_jobs)
+            if self.__job_entries.get(process) != order_added:
+                continue
+            del self.__job_entries[process]
+            if process.status == ProcessStatus.READY and process.priority == ProcessPriority.LOW and process in queue:
+                queue.remove(process)
+                return process
+        # Only reached if processes were added to the queue directly
+        return super().pop_shortest_job()
+
+    def admit_processes(self):
+        '''Admits every process from `self.new_process_queue` that fits in memory, in order.
+        Without a paged memory manager or groups (which the engine refuses), whether a process fits depends only on its size, so each process admitted is found from the tree in O(log n) and the queue is not scanned at all when the smallest process does not fit.'''
+        if not self.new_process_queue:
+            return
+        if self.__processes_waiting != len(self.new_process_queue):
+            self.__waiting_indexed = False
+        if not self.__waiting_indexed:
+            return self.check_new_processes()
+        position = 0
+        while self.__processes_waiting:
+            position = self.__waiting_memory.first_below(
+                position, memory_in_bytes(self.CPU.memory_available))
+            if position is None:
+                break
+            process = self.__waiting_processes[position]
+            # The tree only narrows the search: the reference comparison decides
+            if self.process_fits(process):
+                self.__waiting_memory.set(position, math.inf)
+                self.__waiting_processes[position] = None
+                self.__processes_waiting -= 1
+                self.new_process_queue.remove(process)
+                self.admit_process(process)
+            position += 1
+
+    def check_new_processes(self) -> None:
+        '''Checks every process in `self.new_process_queue` in one pass, admitting those that fit in memory'''
+        for process in list(self.new_process_queue):
+            if self.process_fits(process):
+                self.new_process_queue.remove(process)
+                self.admit_process(process)
+        # The tree no longer matches the queue
+        self.__waiting_indexed = False
+
+    def check_blocked_processes(self):
+        '''Checks every blocked process, in order'''
+        if not self.blocked_processes:
+            return
+        processes_still_blocked = []
+        for process in self.blocked_processes:
+            if self.check_blocked_process(process):
+                process.status = ProcessStatus.READY
+                self.add_process_to_ready_queue(process)
+            else:
+                processes_still_blocked.append(process)
+        self.blocked_processes[:] = processes_still_blocked
+
+
+# The optimised engines checked against the reference by `differential.py`, by name
+ENGINES: dict[str, type] = {
+    'indexed': IndexedOperatingSystem
+}
@@ -15,9 +15,13 @@ class ProcessStatus(Enum):
     RUNNING = 3
     FINISHED = 4
     BLOCKED = 5
+    # Killed by the os, such as to break a deadlock
+    TERMINATED = 6
 
 
 class ProcessPriority(Enum):
+    # Periodic and sporadic jobs, dispatched ahead of every other priority
+    REAL_TIME = 0
     HIGH = 1
     IO = 2
     LOW = 3
@@ -26,7 +30,8 @@ class ProcessPriority(Enum):
 priority_colors = {
     ProcessPriority.HIGH: 'Red',
     ProcessPriority.IO: 'Purple',
-    ProcessPriority.LOW: 'Blue'
+    ProcessPriority.LOW: 'Blue',
+    ProcessPriority.REAL_TIME: 'DarkOrange'
 }
 
 
@@ -34,3 +39,61 @@ class PreemptReason(Enum):
     COMPLETION = 1
     ROUND_ROBIN = 2
     BLOCKED = 3
+    # Acquiring a mutex or semaphore, or waiting on a condition. The process blocks if it has to wait.
+    ACQUIRE = 4
+    # Releasing a mutex or semaphore, or signalling a condition. The process carries on running.
+    RELEASE = 5
+    # Creating a child process. The process carries on running.
+    SPAWN = 6
+
+
+class DeviceType(Enum):
+    DISK = 1
+    NIC = 2
+
+
+class DeviceSchedulingDiscipline(Enum):
+    FIFO = 1
+    ELEVATOR = 2
+    DEADLINE = 3
+
+
+class PageReplacementPolicy(Enum):
+    LRU = 1
+    CLOCK = 2
+    WORKING_SET = 3
+
+
+class RealTimePolicy(Enum):
+    EARLIEST_DEADLINE_FIRST = 1
+    RATE_MONOTONIC = 2
+
+
+class WaitQueueOrder(Enum):
+    FIFO = 1
+    PRIORITY = 2
+
+
+class LockProtocol(Enum):
+    NONE = 1
+    PRIORITY_INHERITANCE = 2
+    PRIORITY_CEILING = 3
+
+
+class FrequencyGovernor(Enum):
+    # Always the highest frequency
+    PERFORMANCE = 1
+    # Always the lowest frequency
+    POWERSAVE = 2
+    # The frequency follows utilisation
+    ONDEMAND = 3
+
+
+# Known bugs in the reference scheduler that other engines may deliberately fix
+class ReferenceFix(Enum):
+    # `admit_processes` pops from the new process queue while enumerating it, so skips the process after each one admitted
+    ADMISSION_SKIPS = 1
+    # `check_blocked_processes` pops from the blocked queue while enumerating it, so skips checking the process after each one unblocked
+    UNBLOCKING_SKIPS = 2
+    # `pop_shortest_job` compares each job with the first job rather than the shortest so far
+    SHORTEST_JOB = 3
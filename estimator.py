@@ -0,0 +1,413 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import product, repeat
+from math import ceil, exp
+from statistics import median
+from time import perf_counter
+from typing import TypedDict, Union
+from enums import ProcessPriority
+from tuner import DEFAULT_HARDWARE_COSTS, DEFAULT_SEARCH_SPACE, SIMULATION_STEP, HardwareCosts, SimulationResult, TunerConfiguration, simulate
+from workload import ProcessSpecification, generate_workload
+import argparse
+
+# The priorities of the three tier policy, highest first
+THREE_TIERS = [ProcessPriority.HIGH, ProcessPriority.IO, ProcessPriority.LOW]
+# Configuration terms the waiting time estimates do not depend on. Paging and memory change simulated waiting times a lot, so configurations that differ only in these cannot be ranked by estimates.
+UNMODELLED_TERMS = ['memory_mb', 'page_replacement_policy']
+# The median rank correlation between estimated and simulated p99 waiting times a priority needs before configurations are pruned on its estimates
+MINIMUM_RANK_CORRELATION = 0.5
+
+
+class WaitingTimeEstimate(TypedDict):
+    # The fraction of cpu time needed by processes of the priority
+    utilisation: float
+    # Time spent in the new process and ready queues, `None` if processes of the priority would wait forever
+    mean_waiting_us: Union[float, None]
+    p99_waiting_us: Union[float, None]
+
+
+class Estimate(TypedDict):
+    configuration: TunerConfiguration
+    # The fraction of cpu time needed by the whole workload, including context switch and cache warm up overhead
+    utilisation: float
+    stable: bool
+    # The chance that an arriving process finds memory full, `None` when paging
+    memory_full_probability: Union[float, None]
+    waiting_times: dict[ProcessPriority, WaitingTimeEstimate]
+
+
+class CalibrationRecord(TypedDict):
+    estimate: Estimate
+    simulation: SimulationResult
+
+
+def round_up_to_step(time: float, step: float) -> float:
+    '''Processes are only checked once every cycle of the os, so cpu bursts take a whole number of steps'''
+    if step <= 0:
+        return time
+    return ceil(round(time / step, 9)) * step
+
+
+def cpu_bursts(specification: ProcessSpecification) -> list[float]:
+    '''The cpu time, in seconds, of each visit the process makes to the ready queue: before and after it blocks'''
+    time_to_complete = specification['time_to_complete'].total_seconds()
+    if specification['time_to_blocked'] is None:
+        return [time_to_complete]
+    time_to_blocked = specification['time_to_blocked'].total_seconds()
+    return [time_to_blocked, time_to_complete - time_to_blocked]
+
+
+def burst_slices(burst: float, priority: ProcessPriority, configuration: TunerConfiguration, step: float, switch_probability: float, overhead: float) -> list[float]:
+    '''The time the cpu spends on each dispatch of a burst, in seconds. The first dispatch pays the context switch and cold cache `overhead`. High priority bursts are split into round robin slices, which only pay again if another process runs in between, with `switch_probability`.
+    A quantum starts when the process is dispatched, before the overhead is paid, and is only checked at the end of a step, so a slice takes the quantum and its overhead rounded up to a whole step, and its cpu time is what is left after the overhead.'''
+    if priority != ProcessPriority.HIGH:
+        return [round_up_to_step(burst + overhead, step)]
+    quantum = configuration['round_robin_timing'].total_seconds()
+    first_slice = round_up_to_step(quantum + overhead, step)
+    if burst <= first_slice - overhead:
+        return [round_up_to_step(burst + overhead, step)]
+    # The expected length and cpu time of the later slices, which only pay the overhead after a switch
+    slice_time = switch_probability * first_slice + \
+        (1 - switch_probability) * round_up_to_step(quantum, step)
+    slice_cpu_time = slice_time - switch_probability * overhead
+    burst_left = burst - (first_slice - overhead)
+    number_of_later_slices = max(1, ceil(round(burst_left / slice_cpu_time, 9)))
+    burst_left -= slice_cpu_time * (number_of_later_slices - 1)
+    return [first_slice] + [slice_time] * (number_of_later_slices - 1) + [round_up_to_step(burst_left + switch_probability * overhead, step)]
+
+
+def waiting_time_tail(waiting_times: list[tuple[float, float]], busy_probability: float, fraction: float) -> float:
+    '''The `fraction` percentile of a mixture of waiting times, each a fixed delay plus a delay with the given mean that is zero unless the cpu is busy (with `busy_probability`) and exponential otherwise'''
+    def probability_exceeded(time: float) -> float:
+        probability = 0
+        for fixed_delay, mean_delay in waiting_times:
+            if time < fixed_delay:
+                probability += 1
+            elif mean_delay > 0:
+                probability += busy_probability * \
+                    exp(-(time - fixed_delay) * busy_probability / mean_delay)
+        return probability / len(waiting_times)
+
+    low = 0.0
+    high = max(fixed_delay + 50 * mean_delay / busy_probability if busy_probability else fixed_delay
+               for fixed_delay, mean_delay in waiting_times)
+    # Bisection, as the chance of waiting longer than a time falls as the time grows
+    for _ in range(60):
+        middle = (low + high) / 2
+        if probability_exceeded(middle) > 1 - fraction:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def estimate(configuration: TunerConfiguration, workload: list[ProcessSpecification], step: timedelta = SIMULATION_STEP, hardware_costs: HardwareCosts = DEFAULT_HARDWARE_COSTS) -> Estimate:
+    '''Estimates the waiting time of each priority under the three tier policy from the arrival rate, cpu bursts and memory of the workload, without simulating it.
+    New processes are only admitted when the os dispatches, so a running process is never preempted by an arrival: the tiers are modelled as an M/G/1 queue with non-preemptive priorities (Cobham's formula). Processes coming back from being blocked go straight to the ready queue, so preempt lower priorities. Within the high priority tier, processes share the cpu round robin, modelled as processor sharing after the slice in service. The low priority tier runs the shortest job first.
+    When the cpu is overloaded, the higher priorities can still be estimated, as they only wait for the lower priorities' slice in service.
+    Tails assume a process waits with the chance the cpu is busy, and that waits are then exponential. Waiting times do not depend on the `UNMODELLED_TERMS`: page faults, and processes held in the new process queue for memory, are not modelled.'''
+    if len(workload) < 2 or workload[-1]['arrival_time'] <= workload[0]['arrival_time']:
+        raise ValueError('Workload needs arrivals spread over time')
+    if any(specification['priority'] not in THREE_TIERS for specification in workload):
+        raise ValueError(
+            'Only HIGH, IO and LOW priority processes can be estimated')
+    step_seconds = step.total_seconds()
+    overhead = hardware_costs['context_switch_cost'].total_seconds(
+    ) + hardware_costs['cache_warmup_penalty'].total_seconds()
+    # Each process in the workload stands for an equal share of the arrival rate
+    arrival_rate = (len(workload) - 1) / (workload[-1]['arrival_time'] -
+                                          workload[0]['arrival_time']).total_seconds()
+    rate_per_process = arrival_rate / len(workload)
+
+    # The slices of each burst of each process, and the service time of every burst, for each priority
+    burst_slice_times: dict[ProcessPriority, list[list[list[float]]]] = {
+        priority: [] for priority in THREE_TIERS}
+    burst_service_times: dict[ProcessPriority, list[float]] = {
+        priority: [] for priority in THREE_TIERS}
+    # Round robin slices only switch process when another high priority process is ready, taken as the high priority utilisation
+    switch_probability = min(1, rate_per_process * sum(sum(cpu_bursts(specification))
+                             for specification in workload if specification['priority'] == ProcessPriority.HIGH))
+    for specification in workload:
+        priority = specification['priority']
+        process_slices = []
+        for burst in cpu_bursts(specification):
+            slices = burst_slices(
+                burst, priority, configuration, step_seconds, switch_probability, overhead)
+            process_slices.append(slices)
+            burst_service_times[priority].append(sum(slices))
+        burst_slice_times[priority].append(process_slices)
+
+    utilisation = {priority: rate_per_process * sum(burst_service_times[priority])
+                   for priority in THREE_TIERS}
+    total_utilisation = sum(utilisation.values())
+
+    def mean_residual(service_times: list[float], utilisation_served: float) -> float:
+        '''Mean residual time of the service in progress when a process arrives'''
+        if not sum(service_times):
+            return 0.0
+        return utilisation_served * sum(service_time ** 2 for service_time in service_times) / (2 * sum(service_times))
+
+    # Residual time of the burst in service when a process arrives. A high priority process goes back to the cpu after each slice unless another high priority process is ready, so lower priorities wait for the whole burst. When the cpu is overloaded, the lowest priorities only get the cpu time left over.
+    residual: dict[ProcessPriority, float] = {}
+    utilisation_served = 0.0
+    for priority in THREE_TIERS:
+        priority_utilisation_served = min(
+            utilisation[priority], max(0.0, 1 - utilisation_served))
+        utilisation_served += priority_utilisation_served
+        residual[priority] = mean_residual(
+            burst_service_times[priority], priority_utilisation_served)
+    total_residual = sum(residual.values())
+    # A high priority process only waits for the slice of another high priority process in service
+    high_slice_residual = mean_residual([slice_time for process_slices in burst_slice_times[ProcessPriority.HIGH]
+                                        for slices in process_slices for slice_time in slices], min(1.0, utilisation[ProcessPriority.HIGH]))
+    busy_probability = min(1.0, total_utilisation)
+    stable = total_utilisation < 1
+    higher_utilisation = {ProcessPriority.HIGH: 0,
+                          ProcessPriority.IO: utilisation[ProcessPriority.HIGH],
+                          ProcessPriority.LOW: utilisation[ProcessPriority.HIGH] + utilisation[ProcessPriority.IO]}
+    low_service_times = sorted(burst_service_times[ProcessPriority.LOW])
+
+    def burst_waiting_time(priority: ProcessPriority, slices: list[float], after_blocking: bool) -> Union[tuple[float, float], None]:
+        '''The fixed delay, and mean delay when the cpu is busy, of a burst made of `slices`. `None` if bursts like it would wait forever.
+        An arriving process waits in the new process queue for the burst in service, whatever its priority, but a process that has been blocked goes straight to the ready queue and preempts lower priorities, so only waits for the slices of its own priority and above.'''
+        service_time = sum(slices)
+        utilisation_above = higher_utilisation[priority]
+        residual_waited = total_residual
+        if after_blocking:
+            residual_waited = sum(
+                residual[higher_priority] for higher_priority in THREE_TIERS[:THREE_TIERS.index(priority) + 1])
+        if priority == ProcessPriority.HIGH:
+            high_utilisation = utilisation[ProcessPriority.HIGH]
+            if high_utilisation >= 1:
+                return None
+            # Shares the cpu round robin with the other high priority processes (processor sharing), once the slice in service ends. The slice only runs on to the end of the burst when no other high priority process is ready.
+            return service_time * high_utilisation / (1 - high_utilisation), (residual_waited - residual[ProcessPriority.HIGH]) / (1 - high_utilisation) + high_slice_residual
+        if priority == ProcessPriority.IO:
+            utilisation_before = utilisation_above
+            utilisation_including = utilisation_above + utilisation[priority]
+        else:
+            # Shortest job first: waits for the low priority bursts shorter than it
+            utilisation_before = utilisation_above + rate_per_process * \
+                sum(time for time in low_service_times if time < service_time)
+            utilisation_including = utilisation_above + rate_per_process * \
+                sum(time for time in low_service_times if time <= service_time)
+        if utilisation_including >= 1:
+            return None
+        return 0, residual_waited / ((1 - utilisation_before) * (1 - utilisation_including))
+
+    waiting_times: dict[ProcessPriority, WaitingTimeEstimate] = {}
+    mean_time_in_system = 0.0
+    for priority in THREE_TIERS:
+        process_waiting_times = []
+        for process_slices in burst_slice_times[priority]:
+            burst_waits = [burst_waiting_time(priority, slices, burst > 0)
+                           for burst, slices in enumerate(process_slices)]
+            if None in burst_waits:
+                process_waiting_times = None
+                break
+            process_waiting_times.append((sum(fixed_delay for fixed_delay, _ in burst_waits), sum(
+                mean_delay for _, mean_delay in burst_waits)))
+            mean_time_in_system += (process_waiting_times[-1][0] + process_waiting_times[-1][1] + sum(
+                sum(slices) for slices in process_slices)) / len(workload)
+        mean_waiting_time = None
+        p99_waiting_time = None
+        if process_waiting_times:
+            mean_waiting_time = sum(fixed_delay + mean_delay for fixed_delay,
+                                    mean_delay in process_waiting_times) / len(process_waiting_times) * 1e6
+            p99_waiting_time = waiting_time_tail(
+                process_waiting_times, busy_probability, 0.99) * 1e6
+        waiting_times[priority] = {
+            'utilisation': utilisation[priority],
+            'mean_waiting_us': mean_waiting_time,
+            'p99_waiting_us': p99_waiting_time
+        }
+
+    memory_full_probability = None
+    if configuration['page_replacement_policy'] is None:
+        memory_full_probability = 1.0
+        if stable:
+            # The number of processes in memory by Little's law, and how many fit, taking the number in the system as geometric
+            mean_processes_in_system = arrival_rate * mean_time_in_system
+            processes_that_fit = configuration['memory_mb'] / (
+                sum(specification['memory_mb'] for specification in workload) / len(workload))
+            memory_full_probability = (
+                mean_processes_in_system / (1 + mean_processes_in_system)) ** processes_that_fit
+    return {
+        'configuration': configuration,
+        'utilisation': total_utilisation,
+        'stable': stable,
+        'memory_full_probability': memory_full_probability,
+        'waiting_times': waiting_times
+    }
+
+
+def modelled_terms(configuration: TunerConfiguration) -> tuple:
+    '''The terms of a configuration the estimates depend on'''
+    return tuple(value for term, value in configuration.items() if term not in UNMODELLED_TERMS)
+
+
+def unmodelled_terms(configuration: TunerConfiguration) -> tuple:
+    return tuple(configuration[term] for term in UNMODELLED_TERMS)
+
+
+def prune_configurations(workload: list[ProcessSpecification], configurations: list[TunerConfiguration], keep: int, priority: ProcessPriority, calibration: list[CalibrationRecord], step: timedelta = SIMULATION_STEP, tolerance: float = 0.1, hardware_costs: HardwareCosts = DEFAULT_HARDWARE_COSTS) -> list[TunerConfiguration]:
+    '''The configurations whose estimated p99 waiting time for `priority` is among the `keep` lowest, so only they need to be simulated. `step` and `hardware_costs` should be those they will be simulated with.
+    Estimates cannot tell apart configurations that differ only in the `UNMODELLED_TERMS`, so `keep` counts settings of the other terms, and every memory and paging setting of those kept is passed through to simulation.
+    Nor can they reliably order settings whose estimates are close, so settings within `tolerance` (relative) of the last one kept are kept as well. Settings where `priority` is overloaded are ranked last, by utilisation.
+    `calibration` (from `calibrate`, such as on a shorter workload) must show estimates rank the configurations for `priority` with at least the `MINIMUM_RANK_CORRELATION`, otherwise every configuration should be simulated.'''
+    correlation = calibrated_rank_correlation(calibration, priority)
+    if correlation is None or correlation < MINIMUM_RANK_CORRELATION:
+        raise ValueError(
+            f'Estimates do not rank configurations for {priority.name} priority reliably enough to prune them')
+    def rank(configuration_estimate: Estimate) -> tuple:
+        p99_waiting_time = configuration_estimate['waiting_times'][priority]['p99_waiting_us']
+        return (p99_waiting_time is None, p99_waiting_time if p99_waiting_time is not None else configuration_estimate['utilisation'])
+    # One estimate for each setting of the modelled terms
+    estimates: dict[tuple, Estimate] = {}
+    for configuration in configurations:
+        if modelled_terms(configuration) not in estimates:
+            estimates[modelled_terms(configuration)] = estimate(
+                configuration, workload, step, hardware_costs)
+    ranked_terms = sorted(
+        estimates, key=lambda terms: rank(estimates[terms]))
+    terms_kept = ranked_terms[:keep]
+    if terms_kept:
+        last_kept_rank = rank(estimates[terms_kept[-1]])
+        for terms in ranked_terms[keep:]:
+            terms_rank = rank(estimates[terms])
+            if terms_rank[0] != last_kept_rank[0] or terms_rank[1] > last_kept_rank[1] * (1 + tolerance):
+                break
+            terms_kept.append(terms)
+    return [configuration for configuration in configurations if modelled_terms(configuration) in terms_kept]
+
+
+def calibrate(workload: list[ProcessSpecification], configurations: list[TunerConfiguration], horizon: timedelta = None, step: timedelta = SIMULATION_STEP, max_workers: int = None, hardware_costs: HardwareCosts = DEFAULT_HARDWARE_COSTS) -> list[CalibrationRecord]:
+    '''Estimates and simulates each configuration, so the estimates can be compared with simulated results'''
+    if horizon is None:
+        # Long enough for every process to arrive and finish
+        horizon = workload[-1]['arrival_time'] + sum(
+            [specification['time_to_complete'] for specification in workload], timedelta(seconds=0)) * 2
+    estimates = [estimate(configuration, workload, step, hardware_costs)
+                 for configuration in configurations]
+    with ProcessPoolExecutor(max_workers) as executor:
+        simulations = list(executor.map(simulate, configurations, repeat(
+            workload), repeat(horizon), repeat(step), repeat(hardware_costs)))
+    return [{'estimate': configuration_estimate, 'simulation': simulation} for configuration_estimate, simulation in zip(estimates, simulations)]
+
+
+def rank_correlation(first: list[float], second: list[float]) -> Union[float, None]:
+    '''Spearman's rank correlation, giving tied values their mean rank. `None` if either list has no two values that differ, as then there is no ranking to compare.'''
+    def ranks(values: list[float]) -> list[float]:
+        order = sorted(range(len(values)), key=lambda index: values[index])
+        value_ranks = [0.0] * len(values)
+        start = 0
+        while start < len(order):
+            end = start
+            while end + 1 < len(order) and values[order[end + 1]] == values[order[start]]:
+                end += 1
+            for index in order[start:end + 1]:
+                value_ranks[index] = (start + end) / 2
+            start = end + 1
+        return value_ranks
+    first_ranks = ranks(first)
+    second_ranks = ranks(second)
+    mean_rank = (len(first) - 1) / 2
+    covariance = sum((first_rank - mean_rank) * (second_rank - mean_rank)
+                     for first_rank, second_rank in zip(first_ranks, second_ranks))
+    first_variance = sum((rank - mean_rank) ** 2 for rank in first_ranks)
+    second_variance = sum((rank - mean_rank) ** 2 for rank in second_ranks)
+    if not first_variance or not second_variance:
+        return None
+    return covariance / (first_variance * second_variance) ** 0.5
+
+
+def rank_correlations(records: list[CalibrationRecord], priority: ProcessPriority) -> list[Union[float, None]]:
+    '''The rank correlation of the estimated and simulated p99 waiting times of `priority` among the records with each setting of the `UNMODELLED_TERMS` (the rankings `prune_configurations` relies on). `None` for a setting where either ranking is tied throughout.'''
+    records_by_unmodelled_terms: dict[tuple, list[CalibrationRecord]] = {}
+    for record in records:
+        if record['estimate']['waiting_times'][priority]['p99_waiting_us'] is not None and record['simulation']['p99_waiting_times'][priority] is not None:
+            records_by_unmodelled_terms.setdefault(unmodelled_terms(
+                record['estimate']['configuration']), []).append(record)
+    return [rank_correlation([record['estimate']['waiting_times'][priority]['p99_waiting_us'] for record in setting_records], [
+        record['simulation']['p99_waiting_times'][priority].total_seconds() for record in setting_records]) for setting_records in records_by_unmodelled_terms.values()]
+
+
+def calibrated_rank_correlation(records: list[CalibrationRecord], priority: ProcessPriority) -> Union[float, None]:
+    '''The median of the `rank_correlations` of `priority`, counting settings the simulations cannot rank as uncorrelated. `None` if there are no records to compare.'''
+    correlations = rank_correlations(records, priority)
+    if not correlations:
+        return None
+    return median(correlation if correlation is not None else 0.0 for correlation in correlations)
+
+
+def relative_error(estimated: float, simulated: float) -> float:
+    return abs(estimated - simulated) / simulated if simulated else abs(estimated)
+
+
+def calibration_report(records: list[CalibrationRecord]) -> str:
+    '''A line comparing the estimated and simulated waiting times of each priority for each configuration, then the median error of the estimates for each priority, and the median rank correlation among configurations with the same `UNMODELLED_TERMS` (the rankings `prune_configurations` relies on)'''
+    lines = []
+    for record in records:
+        configuration = record['estimate']['configuration']
+        policy = configuration['page_replacement_policy']
+        comparisons = []
+        for priority in THREE_TIERS:
+            estimated = record['estimate']['waiting_times'][priority]
+            simulated_mean = record['simulation']['mean_waiting_times'][priority]
+            simulated_p99 = record['simulation']['p99_waiting_times'][priority]
+            if estimated['mean_waiting_us'] is None or simulated_mean is None:
+                comparisons.append(f'{priority.name} -')
+                continue
+            comparisons.append(
+                f"{priority.name} mean {estimated['mean_waiting_us']:.0f}/{simulated_mean.total_seconds() * 1e6:.0f}us p99 {estimated['p99_waiting_us']:.0f}/{simulated_p99.total_seconds() * 1e6:.0f}us")
+        lines.append(
+            f"quantum {configuration['round_robin_timing']}, memory {configuration['memory_mb']}MB, paging {policy.name if policy is not None else 'off'} (utilisation {record['estimate']['utilisation']:.1%}): estimated/simulated waiting {', '.join(comparisons)}")
+    for priority in THREE_TIERS:
+        compared = [record for record in records if record['estimate']['waiting_times'][priority]['mean_waiting_us']
+                    is not None and record['simulation']['mean_waiting_times'][priority] is not None]
+        if not compared:
+            continue
+        estimated_means = [record['estimate']['waiting_times']
+                           [priority]['mean_waiting_us'] for record in compared]
+        simulated_means = [record['simulation']['mean_waiting_times']
+                           [priority].total_seconds() * 1e6 for record in compared]
+        estimated_p99s = [record['estimate']['waiting_times']
+                          [priority]['p99_waiting_us'] for record in compared]
+        simulated_p99s = [record['simulation']['p99_waiting_times']
+                          [priority].total_seconds() * 1e6 for record in compared]
+        mean_error = median(relative_error(estimated, simulated)
+                            for estimated, simulated in zip(estimated_means, simulated_means))
+        p99_error = median(relative_error(estimated, simulated)
+                           for estimated, simulated in zip(estimated_p99s, simulated_p99s))
+        correlations = rank_correlations(compared, priority)
+        correlation = calibrated_rank_correlation(compared, priority)
+        lines.append(
+            f"{priority.name}: median error mean {mean_error:.1%}, p99 {p99_error:.1%} over {len(compared)} configurations, p99 rank correlation {f'{correlation:.2f}' if correlation is not None else '-'} (median over {len(correlations)} memory and paging settings, {correlations.count(None)} with no simulated ranking)")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compares analytical waiting time estimates with simulations of a generated workload')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=200)
+    parser.add_argument('--arrivals-per-second', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=None)
+    arguments = parser.parse_args()
+    workload = generate_workload(
+        arguments.seed, arguments.processes, arguments.arrivals_per_second)
+    configurations = [dict(zip(DEFAULT_SEARCH_SPACE.keys(), values))
+                      for values in product(*DEFAULT_SEARCH_SPACE.values())]
+    time_started = perf_counter()
+    for configuration in configurations:
+        estimate(configuration, workload)
+    time_estimating = perf_counter() - time_started
+    time_started = perf_counter()
+    records = calibrate(workload, configurations,
+                        max_workers=arguments.workers)
+    time_simulating = perf_counter() - time_started
+    print(calibration_report(records))
+    for priority in THREE_TIERS:
+        correlation = calibrated_rank_correlation(records, priority)
+        print(f"{priority.name}: {'can' if correlation is not None and correlation >= MINIMUM_RANK_CORRELATION else 'cannot'} prune on estimates")
+    print(f'{len(configurations)} configurations estimated in {time_estimating:.3f}s and simulated in {time_simulating:.1f}s')
@@ -0,0 +1,302 @@
+from datetime import datetime, timedelta
+from typing import Union
+from enums import ProcessPriority
+from paging import memory_in_bytes
+from process import Process
+import heapq
+
+# The ready queues groups are scheduled over. Real time jobs are scheduled ahead of groups.
+GROUP_SCHEDULED_QUEUES = [ProcessPriority.HIGH.name,
+                          ProcessPriority.IO.name, ProcessPriority.LOW.name]
+
+
+class ProcessGroup:
+    '''A cgroup-like group of processes. Groups form a tree: within each ready queue, sibling groups share the cpu in proportion to their `shares` (weighted fair queuing on virtual time), and a group may be limited to `cpu_quota` of cpu time every `quota_period` and `memory_limit_mb` of memory, counting every group below it.
+    As with cgroups, processes can only be added to groups without child groups.'''
+
+    def __init__(self, name: str, shares: int = 1024, cpu_quota: timedelta = None, quota_period: timedelta = timedelta(seconds=0.1), memory_limit_mb: float = None, parent: 'ProcessGroup' = None):
+        self.__name = name
+        self.__shares = shares
+        self.__cpu_quota = cpu_quota
+        self.__quota_period = quota_period
+        self.__memory_limit_mb = memory_limit_mb
+        self.__parent = parent
+        self.__children: list[ProcessGroup] = []
+        self.processes: set[Process] = set()
+        # The ready processes of this group (without children) for each ready queue, as a heap of (cpu time needed, order added, process). The cpu time needed is zero outside the shortest job first queue, so those heaps are first in first out.
+        self.__ready_processes: dict[str, list[tuple]] = {
+            queue_name: [] for queue_name in GROUP_SCHEDULED_QUEUES}
+        self.__processes_enqueued = 0
+        # The order the live heap entry of each ready process was added. Entries of processes taken out of the ready queue some other way are skipped.
+        self.__ready_entries: dict[Process, int] = {}
+        if parent is not None:
+            parent.add_child(self)
+        # Ready processes in this group and every group below it, by ready queue
+        self.ready_counts: dict[str, int] = {
+            queue_name: 0 for queue_name in GROUP_SCHEDULED_QUEUES}
+        # Cpu time used divided by shares. The child with the smallest virtual time runs next.
+        self.virtual_time = 0.0
+        # Children with ready processes, as a heap of (virtual time, order pushed, child, version) for each ready queue. Entries whose version is out of date are skipped.
+        self.__ready_children: dict[str, list[tuple]] = {
+            queue_name: [] for queue_name in GROUP_SCHEDULED_QUEUES}
+        self.__children_pushed = 0
+        # The virtual time of the child last selected, given to children that become ready so they cannot bank time while idle
+        self.__minimum_virtual_time = 0.0
+        self.version = 0
+        # The version of this group's live entry in its parent's heap for each ready queue, or `None` if it has none
+        self.queued_version: dict[str, Union[int, None]] = {
+            queue_name: None for queue_name in GROUP_SCHEDULED_QUEUES}
+        # Quota accounting
+        self.__quota_used = timedelta(seconds=0)
+        self.__time_period_started: datetime = None
+        self.throttled = False
+        self.__time_throttled: datetime = None
+        # Throttled groups in the tree, as a heap of (time the quota is refreshed, order throttled, group). Only used by the root.
+        self.__throttled_groups: list[tuple] = []
+        self.__groups_throttled = 0
+        # Usage accounting, including every group below
+        self.cpu_time_used = timedelta(seconds=0)
+        self.memory_used_mb = 0.0
+        self.peak_memory_used_mb = 0.0
+        self.processes_finished = 0
+        self.times_throttled = 0
+        self.time_throttled = timedelta(seconds=0)
+        # Processes that have had to wait for admission because of the memory limit of this group
+        self.__processes_held_back: set[Process] = set()
+
+    def __repr__(self) -> str:
+        return self.__name
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def shares(self) -> int:
+        return self.__shares
+
+    @property
+    def cpu_quota(self) -> timedelta:
+        return self.__cpu_quota
+
+    @property
+    def memory_limit_mb(self) -> float:
+        return self.__memory_limit_mb
+
+    @property
+    def parent(self) -> 'ProcessGroup':
+        return self.__parent
+
+    @property
+    def children(self) -> list['ProcessGroup']:
+        return self.__children
+
+    @property
+    def root(self) -> 'ProcessGroup':
+        group = self
+        while group.parent is not None:
+            group = group.parent
+        return group
+
+    @property
+    def path(self) -> list['ProcessGroup']:
+        '''This group, then each group above it up to the root'''
+        groups = []
+        group = self
+        while group is not None:
+            groups.append(group)
+            group = group.parent
+        return groups
+
+    @property
+    def processes_held_back(self) -> int:
+        return len(self.__processes_held_back)
+
+    def add_child(self, child: 'ProcessGroup') -> None:
+        if self.processes:
+            raise ValueError(
+                f'{self} has processes, so cannot have child groups')
+        self.__children.append(child)
+
+    def add_process(self, process: Process) -> None:
+        if self.__children:
+            raise ValueError(
+                f'{self} has child groups, so processes must be added to one of them')
+        self.processes.add(process)
+        process.group = self
+
+    def default_group(self) -> 'ProcessGroup':
+        '''The group processes are added to when they are not given one: this group if it has no children, otherwise a child named default'''
+        if not self.__children:
+            return self
+        for child in self.__children:
+            if child.name == 'default':
+                return child
+        return ProcessGroup('default', parent=self)
+
+    def all_groups(self) -> list['ProcessGroup']:
+        '''This group and every group below it, parents first'''
+        groups = [self]
+        for child in self.__children:
+            groups.extend(child.all_groups())
+        return groups
+
+    def can_admit(self, process: Process) -> bool:
+        '''True if the process fits within the memory limit of its group and every group above it. Records the groups that held it back.'''
+        memory_mb = memory_in_bytes(process.memory_required) / 1e6
+        process_fits = True
+        for group in self.path:
+            if group.memory_limit_mb is not None and group.memory_used_mb + memory_mb > group.memory_limit_mb:
+                group.__processes_held_back.add(process)
+                process_fits = False
+        return process_fits
+
+    def admit(self, process: Process) -> None:
+        memory_mb = memory_in_bytes(process.memory_required) / 1e6
+        for group in self.path:
+            group.memory_used_mb += memory_mb
+            group.peak_memory_used_mb = max(
+                group.peak_memory_used_mb, group.memory_used_mb)
+
+    def release(self, process: Process, finished: bool) -> None:
+        '''Gives back the memory of a process that has stopped, counting it towards throughput if it `finished`'''
+        memory_mb = memory_in_bytes(process.memory_required) / 1e6
+        for group in self.path:
+            group.memory_used_mb -= memory_mb
+            if finished:
+                group.processes_finished += 1
+        self.processes.discard(process)
+
+    def enqueue(self, queue_name: str, process: Process) -> None:
+        '''Adds a process of this group to its ready heap, counting it in this group and those above it and making them selectable'''
+        time_needed = process.time_to_complete - \
+            process.cpu_time_recieved if queue_name == ProcessPriority.LOW.name else timedelta(seconds=0)
+        heapq.heappush(self.__ready_processes[queue_name], (
+            time_needed, self.__processes_enqueued, process))
+        self.__ready_entries[process] = self.__processes_enqueued
+        self.__processes_enqueued += 1
+        for group in self.path:
+            if group.parent is not None and not any(group.ready_counts.values()):
+                # Becoming ready, so starts from the virtual time its siblings have reached
+                group.virtual_time = max(
+                    group.virtual_time, group.parent.__minimum_virtual_time)
+            group.ready_counts[queue_name] += 1
+            if group.parent is not None and group.queued_version[queue_name] is None:
+                group.parent.push_child(group, queue_name)
+
+    def dequeue(self, queue_name: str, process: Process) -> None:
+        '''Counts a process of this group removed from the ready queue. Its ready heap entry, and groups with no ready processes left, are dropped from heaps lazily.'''
+        del self.__ready_entries[process]
+        for group in self.path:
+            group.ready_counts[queue_name] -= 1
+
+    def pop_ready_process(self, queue_name: str) -> Process:
+        '''Takes the next process of this group (without children) from the ready queue: the first added, or the shortest job for the low priority queue'''
+        heap = self.__ready_processes[queue_name]
+        while True:
+            _, order_added, process = heapq.heappop(heap)
+            if self.__ready_entries.get(process) == order_added:
+                self.dequeue(queue_name, process)
+                return process
+
+    def push_child(self, child: 'ProcessGroup', queue_name: str) -> None:
+        if child.throttled:
+            return
+        heapq.heappush(self.__ready_children[queue_name], (
+            child.virtual_time, self.__children_pushed, child, child.version))
+        self.__children_pushed += 1
+        child.queued_version[queue_name] = child.version
+
+    def select(self, queue_name: str, peek: bool = False) -> Union['ProcessGroup', None]:
+        '''The group (without children) whose process should run next from the ready queue, found by following the child with the smallest virtual time down from this group. `None` if every group with ready processes is throttled.
+        When `peek`, the virtual time reached is not moved on, as no process is being taken.
+        Takes O(log groups) for a balanced tree, as entries skipped were each pushed once before.'''
+        if not self.__children:
+            return self if self.ready_counts[queue_name] and not self.throttled else None
+        heap = self.__ready_children[queue_name]
+        while heap:
+            virtual_time, _, child, version = heap[0]
+            child: ProcessGroup
+            if version == child.queued_version[queue_name] and child.ready_counts[queue_name] and not child.throttled:
+                selected_group = child.select(queue_name, peek)
+                if selected_group is not None:
+                    if not peek:
+                        self.__minimum_virtual_time = virtual_time
+                    return selected_group
+            heapq.heappop(heap)
+            if version == child.queued_version[queue_name]:
+                # Dropped until it has ready processes, or is no longer throttled, again
+                child.queued_version[queue_name] = None
+        return None
+
+    def requeue(self) -> None:
+        '''Pushes this group and those above it back into their parents' heaps wherever they have ready processes but no live entry'''
+        for group in self.path:
+            if group.parent is None or group.throttled:
+                continue
+            for queue_name in GROUP_SCHEDULED_QUEUES:
+                if group.ready_counts[queue_name] and group.queued_version[queue_name] is None:
+                    group.parent.push_child(group, queue_name)
+
+    def charge(self, cpu_time: timedelta, now: datetime) -> None:
+        '''Adds cpu time used by a process of this group to it and every group above, moving their virtual time on and throttling any that use up their quota'''
+        for group in self.path:
+            group.cpu_time_used += cpu_time
+            if group.parent is None:
+                continue
+            group.virtual_time += cpu_time.total_seconds() / group.shares
+            # Replace the heap entries, which now have the old virtual time
+            group.version += 1
+            for queue_name in GROUP_SCHEDULED_QUEUES:
+                if group.queued_version[queue_name] is not None:
+                    group.parent.push_child(group, queue_name)
+            if group.cpu_quota is not None:
+                group.use_quota(cpu_time, now)
+
+    def use_quota(self, cpu_time: timedelta, now: datetime) -> None:
+        if self.__time_period_started is None or now >= self.__time_period_started + self.__quota_period:
+            self.__time_period_started = now
+            self.__quota_used = timedelta(seconds=0)
+        self.__quota_used += cpu_time
+        if self.__quota_used >= self.__cpu_quota and not self.throttled:
+            self.throttled = True
+            self.times_throttled += 1
+            self.__time_throttled = now
+            root = self.root
+            heapq.heappush(root.__throttled_groups, (self.__time_period_started +
+                           self.__quota_period, root.__groups_throttled, self))
+            root.__groups_throttled += 1
+
+    @property
+    def is_throttled(self) -> bool:
+        '''True if this group or any above it is throttled'''
+        return any([group.throttled for group in self.path])
+
+    def update(self, now: datetime) -> None:
+        '''Unthrottles groups whose quota period has ended. Called on the root.'''
+        while self.__throttled_groups and self.__throttled_groups[0][0] <= now:
+            _, _, group = heapq.heappop(self.__throttled_groups)
+            group: ProcessGroup
+            group.throttled = False
+            group.time_throttled += now - group.__time_throttled
+            group.__time_period_started = now
+            group.__quota_used = timedelta(seconds=0)
+            group.requeue()
+
+    def report(self, time_elapsed: timedelta) -> str:
+        '''A line for each group with its throughput, cpu share and throttling, indented by depth'''
+        lines = []
+        total_cpu_time = self.cpu_time_used
+        for group in self.all_groups():
+            depth = len(group.path) - 1
+            throughput = group.processes_finished / \
+                time_elapsed.total_seconds() if time_elapsed else 0
+            cpu_share = group.cpu_time_used / total_cpu_time if total_cpu_time else 0
+            limits = []
+            if group.cpu_quota is not None:
+                limits.append(
+                    f'quota {group.cpu_quota}/{group.__quota_period}')
+            if group.memory_limit_mb is not None:
+                limits.append(f'memory limit {group.memory_limit_mb}MB')
+            lines.append(f"{'  ' * depth}Group {group} (shares {group.shares}{', ' if limits else ''}{', '.join(limits)}): {group.processes_finished} finished, throughput {throughput:.3f}/s, cpu {group.cpu_time_used} ({cpu_share:.1%}), throttled {group.times_throttled} times for {group.time_throttled}, peak memory {group.peak_memory_used_mb:.1f}MB, {group.processes_held_back} processes held back by memory limit")
+        return '\n'.join(lines)
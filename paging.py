@@ -0,0 +1,268 @@
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from math import ceil
+from random import Random
+from enums import PageReplacementPolicy
+from memory import Memory, MemoryUnits
+
+# Marks a frame with no owner, or a page with no frame
+NO_FRAME = -1
+
+
+def memory_in_bytes(memory: Memory) -> float:
+    '''Converts a `Memory` to bytes without changing the unit of the object given'''
+    return memory.size * (1000 ** (memory.unit.value - MemoryUnits.B.value))
+
+
+class PageTable:
+    '''The page table of a single process. Uses arrays rather than per-page objects so large processes stay cheap.'''
+
+    def __init__(self, slot: int, number_of_pages: int, working_set_pages: int, working_set_start: int):
+        # The index of the page table in the memory manager, stored as the owner of each frame
+        self.slot = slot
+        self.number_of_pages = number_of_pages
+        # The frame holding each page, or `NO_FRAME` if the page is not resident
+        self.frames = array('l', [NO_FRAME]) * number_of_pages
+        # Bitmap of pages with an up to date copy in swap
+        self.swapped = bytearray(number_of_pages)
+        self.working_set_pages = working_set_pages
+        self.working_set_start = working_set_start
+        self.resident_pages = 0
+        self.page_faults = 0
+        # Fraction of a reference carried over from the last time the process ran
+        self.reference_carry = 0.0
+
+
+class PagedMemoryManager:
+    '''Splits memory into fixed size frames and pages processes in and out of them, charging page faults as blocking time'''
+
+    def __init__(self, total_memory_mb: int, swap_size_mb: int = 8000, page_size_kb: int = 4, policy: PageReplacementPolicy = PageReplacementPolicy.LRU, page_fault_latency: timedelta = timedelta(milliseconds=2), swap_in_latency: timedelta = timedelta(milliseconds=8), swap_out_latency: timedelta = timedelta(milliseconds=8), references_per_second: int = 2000, working_set_fraction: float = 0.2, locality: float = 0.95, write_fraction: float = 0.3, working_set_window: timedelta = timedelta(seconds=1), seed: int = None):
+        self.__page_size_bytes = page_size_kb * 1000
+        self.__number_of_frames = int(total_memory_mb * 1000 // page_size_kb)
+        self.__swap_pages_total = int(swap_size_mb * 1000 // page_size_kb)
+        self.__policy = policy
+        self.__page_fault_latency = page_fault_latency
+        self.__swap_in_latency = swap_in_latency
+        self.__swap_out_latency = swap_out_latency
+        # How many memory references a running process makes per second of cpu time
+        self.__references_per_second = references_per_second
+        # The fraction of a process' pages it references most of the time
+        self.__working_set_fraction = working_set_fraction
+        # The probability a reference falls inside the working set
+        self.__locality = locality
+        self.__write_fraction = write_fraction
+        # Pages not referenced within this window are outside the working set
+        self.__working_set_window = working_set_window.total_seconds()
+        self.__random = Random(seed)
+
+        # Frame ownership is held in flat arrays indexed by frame number
+        self.__frame_owner = array('l', [NO_FRAME]) * self.__number_of_frames
+        self.__frame_page = array('l', [NO_FRAME]) * self.__number_of_frames
+        self.__frame_last_used = array('d', [0]) * self.__number_of_frames
+        self.__frame_referenced = bytearray(self.__number_of_frames)
+        self.__frame_dirty = bytearray(self.__number_of_frames)
+        self.__free_frames = array(
+            'l', range(self.__number_of_frames - 1, -1, -1))
+        # Frames in least to most recently used order, only used by the LRU policy
+        self.__lru_order: OrderedDict[int, None] = OrderedDict()
+        self.__clock_hand = 0
+
+        self.__page_tables: dict[object, PageTable] = {}
+        self.__page_table_slots: list[PageTable] = []
+        self.__free_slots: list[int] = []
+        self.__virtual_pages_admitted = 0
+
+        self.__time_start: datetime = None
+        self.__time_now: datetime = None
+        self.page_faults = 0
+        self.swap_ins = 0
+        self.swap_outs = 0
+
+    @property
+    def policy(self) -> PageReplacementPolicy:
+        return self.__policy
+
+    @property
+    def total_memory(self) -> Memory:
+        return Memory(self.__number_of_frames * self.__page_size_bytes / 1000000, MemoryUnits.MB)
+
+    @property
+    def memory_available(self) -> Memory:
+        '''The physical memory in free frames'''
+        return Memory(len(self.__free_frames) * self.__page_size_bytes / 1000000, MemoryUnits.MB)
+
+    def number_of_pages(self, process) -> int:
+        return ceil(memory_in_bytes(process.memory_required) / self.__page_size_bytes)
+
+    def can_admit(self, process) -> bool:
+        '''True if the process fits in physical memory plus swap alongside the processes already admitted'''
+        return self.__virtual_pages_admitted + self.number_of_pages(process) <= self.__number_of_frames + self.__swap_pages_total
+
+    def admit(self, process) -> None:
+        '''Creates a page table for the process. No frames are given until the process references its pages.'''
+        number_of_pages = self.number_of_pages(process)
+        working_set_pages = max(
+            1, ceil(number_of_pages * self.__working_set_fraction))
+        working_set_start = self.__random.randint(
+            0, number_of_pages - working_set_pages)
+        if self.__free_slots:
+            slot = self.__free_slots.pop()
+        else:
+            slot = len(self.__page_table_slots)
+            self.__page_table_slots.append(None)
+        page_table = PageTable(slot, number_of_pages,
+                               working_set_pages, working_set_start)
+        self.__page_table_slots[slot] = page_table
+        self.__page_tables[process] = page_table
+        self.__virtual_pages_admitted += number_of_pages
+
+    def release(self, process) -> None:
+        '''Frees all frames and swap used by a finished process'''
+        page_table = self.__page_tables.pop(process)
+        for frame in page_table.frames:
+            if frame != NO_FRAME:
+                self.free_frame(frame)
+        self.__page_table_slots[page_table.slot] = None
+        self.__free_slots.append(page_table.slot)
+        self.__virtual_pages_admitted -= page_table.number_of_pages
+
+    def page_table(self, process) -> PageTable:
+        return self.__page_tables[process]
+
+    def update(self, now: datetime) -> None:
+        '''Sets the time used for working set ages and to decide when page faults have been serviced'''
+        if self.__time_start is None:
+            self.__time_start = now
+        self.__time_now = now
+
+    def reference_pages(self, process, cpu_time: timedelta) -> timedelta:
+        '''Simulates the memory references a process makes in the cpu time given. Returns the total time the process must be blocked for to service its page faults, or `None` if there were no faults.'''
+        page_table = self.__page_tables[process]
+        number_of_references = cpu_time.total_seconds() * \
+            self.__references_per_second + page_table.reference_carry
+        page_table.reference_carry = number_of_references % 1
+        now = (self.__time_now - self.__time_start).total_seconds()
+        total_latency = None
+        for _ in range(int(number_of_references)):
+            if self.__random.random() < self.__locality:
+                page = page_table.working_set_start + \
+                    self.__random.randrange(page_table.working_set_pages)
+            else:
+                page = self.__random.randrange(page_table.number_of_pages)
+            is_write = self.__random.random() < self.__write_fraction
+            frame = page_table.frames[page]
+            if frame == NO_FRAME:
+                latency = self.page_fault(page_table, page, is_write, now)
+                if total_latency is None:
+                    total_latency = latency
+                else:
+                    total_latency += latency
+            else:
+                self.touch_frame(frame, is_write, now)
+        return total_latency
+
+    def touch_frame(self, frame: int, is_write: bool, now: float) -> None:
+        self.__frame_referenced[frame] = 1
+        self.__frame_last_used[frame] = now
+        if is_write and not self.__frame_dirty[frame]:
+            self.__frame_dirty[frame] = 1
+            # The copy in swap no longer matches the page, so it is written out again if evicted
+            self.__page_table_slots[self.__frame_owner[frame]
+                                    ].swapped[self.__frame_page[frame]] = 0
+        if self.__policy == PageReplacementPolicy.LRU:
+            self.__lru_order.move_to_end(frame)
+
+    def page_fault(self, page_table: PageTable, page: int, is_write: bool, now: float) -> timedelta:
+        '''Loads the page into a frame, evicting a page if needed, and returns how long the fault takes to service'''
+        self.page_faults += 1
+        page_table.page_faults += 1
+        latency = self.__page_fault_latency
+        if not self.__free_frames:
+            latency += self.evict_page(now)
+        frame = self.__free_frames.pop()
+        if page_table.swapped[page]:
+            # Page has to be read back in from swap. The swap copy stays valid until the page is written to.
+            self.swap_ins += 1
+            latency += self.__swap_in_latency
+        page_table.frames[page] = frame
+        page_table.resident_pages += 1
+        self.__frame_owner[frame] = page_table.slot
+        self.__frame_page[frame] = page
+        self.__frame_dirty[frame] = 0
+        if self.__policy == PageReplacementPolicy.LRU:
+            self.__lru_order[frame] = None
+        self.touch_frame(frame, is_write, now)
+        return latency
+
+    def evict_page(self, now: float) -> timedelta:
+        '''Frees a frame chosen by the replacement policy. Returns the swap out time if the page was dirty.'''
+        if self.__policy == PageReplacementPolicy.LRU:
+            victim = next(iter(self.__lru_order))
+        elif self.__policy == PageReplacementPolicy.CLOCK:
+            victim = self.clock_victim()
+        else:
+            victim = self.working_set_victim(now)
+        owner = self.__page_table_slots[self.__frame_owner[victim]]
+        latency = timedelta(seconds=0)
+        if self.__frame_dirty[victim]:
+            # Dirty pages have to be written to swap before the frame can be reused
+            owner.swapped[self.__frame_page[victim]] = 1
+            self.swap_outs += 1
+            latency = self.__swap_out_latency
+        self.free_frame(victim)
+        return latency
+
+    def clock_victim(self) -> int:
+        '''Sweeps the clock hand, giving referenced frames a second chance'''
+        while True:
+            frame = self.__clock_hand
+            self.__clock_hand = (self.__clock_hand + 1) % self.__number_of_frames
+            if self.__frame_owner[frame] == NO_FRAME:
+                continue
+            if self.__frame_referenced[frame]:
+                self.__frame_referenced[frame] = 0
+            else:
+                return frame
+
+    def working_set_victim(self, now: float) -> int:
+        '''Sweeps the clock hand looking for a frame that has left its owner's working set (WSClock)'''
+        oldest_frame = None
+        for _ in range(self.__number_of_frames):
+            frame = self.__clock_hand
+            self.__clock_hand = (self.__clock_hand + 1) % self.__number_of_frames
+            if self.__frame_owner[frame] == NO_FRAME:
+                continue
+            if self.__frame_referenced[frame]:
+                self.__frame_referenced[frame] = 0
+                self.__frame_last_used[frame] = now
+            elif now - self.__frame_last_used[frame] > self.__working_set_window:
+                return frame
+            if oldest_frame is None or self.__frame_last_used[frame] < self.__frame_last_used[oldest_frame]:
+                oldest_frame = frame
+        # Every page is in a working set, so evict the least recently used
+        return oldest_frame
+
+    def free_frame(self, frame: int) -> None:
+        owner = self.__page_table_slots[self.__frame_owner[frame]]
+        owner.frames[self.__frame_page[frame]] = NO_FRAME
+        owner.resident_pages -= 1
+        self.__frame_owner[frame] = NO_FRAME
+        self.__frame_page[frame] = NO_FRAME
+        self.__frame_referenced[frame] = 0
+        self.__frame_dirty[frame] = 0
+        if self.__policy == PageReplacementPolicy.LRU:
+            del self.__lru_order[frame]
+        self.__free_frames.append(frame)
+
+    def blocked_function(self, blocked_until: datetime) -> callable:
+        '''Returns a blocked function for a `PreemptReason.BLOCKED` preemption that keeps the process blocked until the page fault has been serviced'''
+        def blocked_func():
+            while self.__time_now < blocked_until:
+                yield True
+            yield False
+        return blocked_func
+
+    def report(self) -> str:
+        '''A summary of paging activity'''
+        return f'Paging ({self.policy.name}): {self.page_faults} page faults, {self.swap_ins} swap ins, {self.swap_outs} swap outs, {self.memory_available} free'
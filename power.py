@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+from typing import TypedDict
+from enums import FrequencyGovernor
+
+
+class FrequencyState(TypedDict):
+    frequency_mhz: float
+    voltage: float
+
+
+class Core:
+    '''A cpu core with dynamic voltage and frequency scaling. Cpu time is measured at the highest frequency, so a process running at a lower frequency takes longer to complete by the ratio of the frequencies.
+    Power is static (leakage, drawn whenever the core is on) plus dynamic (`capacitance_nf` * voltage² * frequency, drawn only while busy). A governor picks the frequency from the core's utilisation, and each change of frequency stalls the core for `transition_latency`.'''
+
+    def __init__(self, name: str, frequency_states: list[FrequencyState], governor: FrequencyGovernor = FrequencyGovernor.ONDEMAND, capacitance_nf: float = 1.0, static_power_watts: float = 0.5, transition_latency: timedelta = timedelta(microseconds=100), sampling_period: timedelta = timedelta(milliseconds=20), up_threshold: float = 0.8):
+        if not frequency_states:
+            raise ValueError(f'{name} needs at least one frequency state')
+        self.__name = name
+        # Slowest first
+        self.__frequency_states = sorted(
+            frequency_states, key=lambda state: state['frequency_mhz'])
+        self.__governor = governor
+        self.__capacitance_nf = capacitance_nf
+        self.__static_power_watts = static_power_watts
+        self.__transition_latency = transition_latency
+        # How often the ondemand governor samples utilisation
+        self.__sampling_period = sampling_period
+        # The utilisation above which the ondemand governor goes straight to the highest frequency
+        self.__up_threshold = up_threshold
+        self.__state_index = self.initial_state_index()
+        # Energy and time accounting
+        self.energy_joules = 0.0
+        self.busy_time = timedelta(seconds=0)
+        self.idle_time = timedelta(seconds=0)
+        self.transitions = 0
+        self.time_in_state: dict[float, timedelta] = {
+            state['frequency_mhz']: timedelta(seconds=0) for state in self.__frequency_states}
+        self.__time_last_accounted: datetime = None
+        # Utilisation over the current sampling period
+        self.__time_sample_started: datetime = None
+        self.__sample_busy_time = timedelta(seconds=0)
+
+    def __repr__(self) -> str:
+        return self.__name
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def governor(self) -> FrequencyGovernor:
+        return self.__governor
+
+    @property
+    def frequency_state(self) -> FrequencyState:
+        return self.__frequency_states[self.__state_index]
+
+    @property
+    def frequency_mhz(self) -> float:
+        return self.frequency_state['frequency_mhz']
+
+    @property
+    def speed(self) -> float:
+        '''The fraction of cpu time done per unit of time at the current frequency'''
+        return self.frequency_mhz / self.__frequency_states[-1]['frequency_mhz']
+
+    @property
+    def transition_latency(self) -> timedelta:
+        return self.__transition_latency
+
+    def initial_state_index(self) -> int:
+        if self.__governor == FrequencyGovernor.POWERSAVE:
+            return 0
+        return len(self.__frequency_states) - 1
+
+    def power_watts(self, busy: bool) -> float:
+        '''The power drawn at the current frequency'''
+        if not busy:
+            return self.__static_power_watts
+        state = self.frequency_state
+        # nF * V² * MHz gives mW
+        dynamic_power_watts = self.__capacitance_nf * \
+            state['voltage'] ** 2 * state['frequency_mhz'] / 1000
+        return self.__static_power_watts + dynamic_power_watts
+
+    def account(self, now: datetime, busy: bool) -> float:
+        '''Adds the energy used since the last call, when the core was `busy` (or idle) throughout at its current frequency. Returns the energy in joules.'''
+        if self.__time_last_accounted is None:
+            self.__time_last_accounted = now
+            self.__time_sample_started = now
+            return 0.0
+        time_elapsed = now - self.__time_last_accounted
+        self.__time_last_accounted = now
+        energy_joules = self.power_watts(busy) * time_elapsed.total_seconds()
+        self.energy_joules += energy_joules
+        self.time_in_state[self.frequency_mhz] += time_elapsed
+        if busy:
+            self.busy_time += time_elapsed
+            self.__sample_busy_time += time_elapsed
+        else:
+            self.idle_time += time_elapsed
+        return energy_joules
+
+    def govern(self, now: datetime) -> bool:
+        '''Lets the governor change the frequency at the end of each sampling period. Returns True if the frequency changed.'''
+        if self.__time_sample_started is None or now - self.__time_sample_started < self.__sampling_period:
+            return False
+        utilisation = self.__sample_busy_time / (now - self.__time_sample_started)
+        self.__time_sample_started = now
+        self.__sample_busy_time = timedelta(seconds=0)
+        if self.__governor == FrequencyGovernor.PERFORMANCE:
+            state_index = len(self.__frequency_states) - 1
+        elif self.__governor == FrequencyGovernor.POWERSAVE:
+            state_index = 0
+        elif utilisation > self.__up_threshold:
+            state_index = len(self.__frequency_states) - 1
+        else:
+            # The slowest frequency that would keep the same work below the up threshold
+            frequency_needed = utilisation * self.frequency_mhz / self.__up_threshold
+            state_index = next(index for index, state in enumerate(self.__frequency_states)
+                               if state['frequency_mhz'] >= frequency_needed or index == len(self.__frequency_states) - 1)
+        if state_index == self.__state_index:
+            return False
+        self.__state_index = state_index
+        self.transitions += 1
+        return True
+
+    @property
+    def utilisation(self) -> float:
+        total_time = self.busy_time + self.idle_time
+        return self.busy_time / total_time if total_time else 0
+
+    def report(self) -> str:
+        '''A summary of energy, utilisation and time spent at each frequency'''
+        total_time = self.busy_time + self.idle_time
+        residency = ', '.join(f'{frequency_mhz:g}MHz {time_in_state / total_time if total_time else 0:.1%}' for frequency_mhz,
+                              time_in_state in self.time_in_state.items())
+        return f'{self} ({self.__governor.name}): energy {self.energy_joules:.3f}J, utilisation {self.utilisation:.1%}, {self.transitions} frequency transitions, residency {residency}'
@@ -1,7 +1,11 @@
-from memory import Memory
+from memory import Memory, MemoryUnits
 from datetime import timedelta, datetime
 from enums import ProcessPriority, ProcessStatus, PreemptReason, priority_colors
 from typing import Union, TypedDict
+from clock import wall_clock
+from functools import lru_cache
+from pygame_functions import get_font, pygame_caches
+import heapq
 import pygame
 
 
@@ -22,7 +26,7 @@ class ProcessSurface:
         self.surface.blit(self.white_inside, (1, 1))
 
         # Create font
-        self.font = pygame.font.Font(None, ProcessSurface.FONT_HEIGHT)
+        self.font = get_font(ProcessSurface.FONT_HEIGHT)
         # Add process name
         self.process_name = self.font.render(process_name, True, 'Black')
         self.process_name_position = (
@@ -92,6 +96,10 @@ class Preemption:
         '''Runs the generator provided that tells the os whether the process can be unblocked. `True` means the process must stay blocked.'''
         return next(self.__blocked_generator)
 
+    def carry_out(self) -> None:
+        '''Runs the blocked function of a preemption that never blocks, such as a release, for what it does'''
+        next(self.__blocked_generator)
+
     @property
     def is_complete(self) -> bool:
         '''Shows if the preemption has occured'''
@@ -104,6 +112,15 @@ class Preemption:
         return f'{self.preempt_reason} at {self.time_of_preemption}'
 
 
+@lru_cache(maxsize=4096)
+def cached_process_surface(process_name: str, progress: float, memory_size: float, memory_unit: MemoryUnits, priority: ProcessPriority) -> ProcessSurface:
+    '''Creates a process surface, shared by every process drawn with the same name, progress, memory and priority (such as the same workload running in several simulations)'''
+    return ProcessSurface(Process.PYGAME_SURFACE_WIDTH, Process.PYGAME_SURFACE_HEIGHT, process_name, progress, Memory(memory_size, memory_unit), priority)
+
+
+pygame_caches.append(cached_process_surface)
+
+
 def default_preemption_blocked_function() -> bool:
     '''Returns `True`'''
     return True
@@ -114,12 +131,53 @@ class BlockingPreemptionWithPosition(TypedDict):
     preemption: Preemption
 
 
+class SpawnSpecification(TypedDict):
+    time_to_complete: timedelta
+    # `None` inherits from the parent
+    memory_required: Union[Memory, None]
+    priority: Union[ProcessPriority, None]
+    # Called with the new child so it can be given its own preemptions, spawns and joins, or `None`
+    configure: Union[callable, None]
+
+
+class PidAllocator:
+    '''Hands out integer process IDs for one simulation. IDs count up, wrapping around at `pid_max` and skipping IDs still in use, so an ID is only reused long after its process has stopped.'''
+
+    def __init__(self, pid_max: int = 4194304):
+        self.__pid_max = pid_max
+        self.__next_pid = 1
+        self.__pids_in_use: set[int] = set()
+
+    @property
+    def pids_in_use(self) -> int:
+        return len(self.__pids_in_use)
+
+    def allocate(self) -> int:
+        if len(self.__pids_in_use) >= self.__pid_max - 1:
+            raise RuntimeError('No process IDs left')
+        while self.__next_pid in self.__pids_in_use:
+            self.advance()
+        pid = self.__next_pid
+        self.__pids_in_use.add(pid)
+        self.advance()
+        return pid
+
+    def advance(self) -> None:
+        self.__next_pid += 1
+        if self.__next_pid >= self.__pid_max:
+            self.__next_pid = 1
+
+    def free(self, pid: int) -> None:
+        self.__pids_in_use.discard(pid)
+
+
 class Process:
-    counter = 1
     PYGAME_SURFACE_WIDTH = 135
     PYGAME_SURFACE_HEIGHT = 180
+    # Progress is rounded to this many steps before drawing, so surfaces can be shared between frames
+    PYGAME_PROGRESS_STEPS = 120
 
-    def __init__(self, time_to_complete: timedelta, memory_required: Memory, priority: ProcessPriority):
+    def __init__(self, time_to_complete: timedelta, memory_required: Memory, priority: ProcessPriority, identifier: str = None):
         self.__time_to_complete: timedelta = time_to_complete
         self.__memory_required: Memory = memory_required
         self.__status = ProcessStatus.NEW
@@ -129,10 +187,42 @@ class Process:
         self.__preemptions = []
         self.__time_at_last_time_check: datetime = None
         self.__running = False
-        self.__identifier = 'Process' + str(Process.counter)
-        Process.counter += 1
-        self.pygame_process_surface = ProcessSurface(
-            Process.PYGAME_SURFACE_WIDTH, Process.PYGAME_SURFACE_HEIGHT, self.__repr__(), 0, self.__memory_required, self.__priority)
+        # Context switch and cache warm up time the process must pay before doing useful work
+        self.__overhead_time_remaining: timedelta = timedelta(seconds=0)
+        self.__overhead_time_recieved: timedelta = timedelta(seconds=0)
+        # When the process last stopped running, used to decide how cold its cache is
+        self.__time_last_ran: datetime = None
+        # Times used to measure response and turnaround times
+        self.time_arrived: datetime = None
+        self.time_first_run: datetime = None
+        self.time_finished: datetime = None
+        # Time spent waiting to run, in the new process queue or the ready queue
+        self.time_waiting = timedelta(seconds=0)
+        self.__time_became_ready: datetime = None
+        # The energy used by the core while running the process, when the cpu has a power model
+        self.energy_joules = 0.0
+        # Given by the os when the process is added to it. Processes without an identifier are named by their ID.
+        self.pid: int = None
+        self.__identifier = identifier
+        # The process that spawned this one, and the children it has spawned
+        self.parent: Process = None
+        self.children_spawned = 0
+        self.unfinished_children = 0
+        # Children still to spawn, as a heap of (cpu time of spawn, order added, specification). Only the earliest has a preemption, so processes that spawn many children stay cheap to check.
+        self.__spawn_points: list[tuple] = []
+        self.__spawn_points_added = 0
+        self.__spawn_preemption: Preemption = None
+        # The clock used to measure cpu time, replaced by the os's clock when the process is added to it
+        self.clock = wall_clock
+        # Priorities given by mutexes through priority inheritance or ceilings, by mutex
+        self.priority_boosts: dict = {}
+        # The synchronisation primitive the process is waiting on, and those it holds
+        self.waiting_on = None
+        self.held_primitives: list = []
+        # The `ProcessGroup` the process belongs to, if the os schedules groups
+        self.group = None
+        # Created when the process is drawn, so simulations that are not rendered do not pay for it
+        self.__pygame_process_surface: ProcessSurface = None
 
     def add_preemption(self, reason: PreemptReason, time_till_preemption: timedelta = None, blocked_function: callable = None) -> None:
         '''Adds a `Preemption` to the `self.__preemptions` list of preemptions'''
@@ -143,15 +233,15 @@ class Process:
         if reason == PreemptReason.COMPLETION:
             # Process should only be preempted when process has finshed running
             time_of_preemption = self.time_to_complete
-        elif reason == PreemptReason.ROUND_ROBIN or reason == PreemptReason.BLOCKED:
+        elif reason in (PreemptReason.ROUND_ROBIN, PreemptReason.BLOCKED, PreemptReason.ACQUIRE, PreemptReason.RELEASE, PreemptReason.SPAWN):
             # Process should be preempted after a given period of time, or when the process completes, whichever comes first
             prospective_time_to_complete = self.cpu_time_recieved + time_till_preemption
             if self.time_to_complete < prospective_time_to_complete:
                 time_of_preemption = self.time_to_complete
             else:
                 time_of_preemption = prospective_time_to_complete
-        if reason == PreemptReason.BLOCKED:
-            # Correct blocked function set
+        if reason in (PreemptReason.BLOCKED, PreemptReason.ACQUIRE, PreemptReason.RELEASE):
+            # Correct blocked function set. Synchronisation operations are carried out by their blocked function.
             blocked_function_arguement = blocked_function
         # Preemption added to list of preemptions
         self.__preemptions.append(Preemption(
@@ -162,20 +252,83 @@ class Process:
         self.__preemptions.pop(index)
         self.__cpu_time_over = False
 
+    def cancel_preemptions(self, reason: PreemptReason) -> None:
+        '''Removes the preemptions for the reason that have not been reached, such as the rest of a round robin quantum when the process stops running early'''
+        self.__preemptions = [preemption for preemption in self.__preemptions if preemption.preempt_reason !=
+                              reason or preemption.is_complete]
+
+    def add_spawn(self, time_till_spawn: timedelta, time_to_complete: timedelta, memory_required: Memory = None, priority: ProcessPriority = None, configure: callable = None) -> None:
+        '''Makes the process spawn a child after `time_till_spawn` of cpu time. The child has the memory and priority of the process unless given.'''
+        heapq.heappush(self.__spawn_points, (self.cpu_time_recieved + time_till_spawn, self.__spawn_points_added, {
+            'time_to_complete': time_to_complete,
+            'memory_required': memory_required,
+            'priority': priority,
+            'configure': configure
+        }))
+        self.__spawn_points_added += 1
+        if self.__spawn_preemption is not None and self.__spawn_preemption in self.__preemptions:
+            if self.__spawn_preemption.time_of_preemption <= self.__spawn_points[0][0]:
+                return
+            # The new spawn comes first, so replaces the current spawn preemption
+            self.__preemptions.remove(self.__spawn_preemption)
+        self.arm_next_spawn()
+
+    def arm_next_spawn(self) -> None:
+        '''Adds a spawn preemption for the earliest spawn point. It goes first in the preemptions so that children are spawned before the process blocks or finishes, when both are reached in the same cycle.'''
+        self.__spawn_preemption = None
+        if not self.__spawn_points:
+            return
+        self.__spawn_preemption = Preemption(PreemptReason.SPAWN, min(
+            self.__spawn_points[0][0], self.time_to_complete), default_preemption_blocked_function)
+        self.__preemptions.insert(0, self.__spawn_preemption)
+
+    def add_join(self, time_till_join: timedelta) -> None:
+        '''Makes the process block after `time_till_join` of cpu time until every child it has spawned by then has finished'''
+        def join():
+            while self.unfinished_children:
+                yield True
+            yield False
+        self.add_preemption(PreemptReason.BLOCKED, time_till_join, join)
+
+    def spawn(self) -> 'Process':
+        '''Creates the child for the spawn point the process has reached, once its spawn preemption has been removed. Children of real time jobs run at `ProcessPriority.HIGH`.'''
+        specification: SpawnSpecification = heapq.heappop(
+            self.__spawn_points)[2]
+        self.arm_next_spawn()
+        memory_required = specification['memory_required']
+        if memory_required is None:
+            memory_required = Memory(
+                self.memory_required.size, self.memory_required.unit)
+        priority = specification['priority']
+        if priority is None:
+            priority = self.base_priority
+        if priority == ProcessPriority.REAL_TIME:
+            priority = ProcessPriority.HIGH
+        child = Process(
+            specification['time_to_complete'], memory_required, priority)
+        child.parent = self
+        self.children_spawned += 1
+        self.unfinished_children += 1
+        if specification['configure'] is not None:
+            specification['configure'](child)
+        return child
+
     def __repr__(self):
-        return self.__identifier
+        return self.identifier
 
     @property
     def identifier(self) -> str:
+        if self.__identifier is None:
+            return f'Process{self.pid}'
         return self.__identifier
 
     @property
     def blocking_preemptions(self) -> list[BlockingPreemptionWithPosition]:
-        '''Returns all preemptions attached to process with preemption reason `PreemptReason.BLOCKED` in dicts in format `dict['index': int, 'preemption': Preemption]`'''
+        '''Returns all preemptions attached to process with preemption reason `PreemptReason.BLOCKED` or `PreemptReason.ACQUIRE` in dicts in format `dict['index': int, 'preemption': Preemption]`'''
         blocking_preemptions_to_return: list[BlockingPreemptionWithPosition] = [
         ]
         for index, preemption in enumerate(self.preemptions):
-            if preemption.preempt_reason == PreemptReason.BLOCKED:
+            if preemption.preempt_reason in (PreemptReason.BLOCKED, PreemptReason.ACQUIRE):
                 blocking_preemptions_to_return.append(
                     {'index': index, 'preemption': preemption})
         return blocking_preemptions_to_return
@@ -188,18 +341,53 @@ class Process:
     def running(self, value: bool) -> None:
         '''Takes a `bool`. If true, begins to run the process, else stops running it'''
         if value:
-            self.__time_at_last_time_check = datetime.now()
+            self.__time_at_last_time_check = self.clock.now()
             self.__running = True
+            if self.time_first_run is None:
+                self.time_first_run = self.__time_at_last_time_check
         else:
+            if self.__running:
+                self.__time_last_ran = self.clock.now()
             self.__time_at_last_time_check = None
             self.__running = False
-
-    def calculate_cpu_time_recieved(self):
-        time_recieved = datetime.now() - self.__time_at_last_time_check
+            # Any overhead not yet paid is lost when the process stops running
+            self.__overhead_time_remaining = timedelta(seconds=0)
+
+    def calculate_cpu_time_recieved(self, speed: float = 1) -> timedelta:
+        '''Adds the useful cpu time recieved since the last check, and returns it. Any outstanding overhead is paid first. Time after the overhead counts at `speed`, the speed of the core relative to its highest frequency.'''
+        now = self.clock.now()
+        time_elapsed = now - self.__time_at_last_time_check
+        overhead_paid = min(time_elapsed, self.__overhead_time_remaining)
+        self.__overhead_time_remaining -= overhead_paid
+        self.__overhead_time_recieved += overhead_paid
+        time_recieved = (time_elapsed - overhead_paid) * speed
         self.increment_cpu_time_recieved(time_recieved)
-        self.__time_at_last_time_check = datetime.now()
-        self.pygame_process_surface = ProcessSurface(
-            Process.PYGAME_SURFACE_WIDTH, Process.PYGAME_SURFACE_HEIGHT, self.__repr__(), self.cpu_time_recieved/self.time_to_complete, self.memory_required, self.priority)
+        self.__time_at_last_time_check = now
+        # Progress has changed so the surface needs to be redrawn
+        self.__pygame_process_surface = None
+        return time_recieved
+
+    @property
+    def pygame_process_surface(self) -> ProcessSurface:
+        if self.__pygame_process_surface is None:
+            progress = round(self.cpu_time_recieved / self.time_to_complete *
+                             Process.PYGAME_PROGRESS_STEPS) / Process.PYGAME_PROGRESS_STEPS
+            self.__pygame_process_surface = cached_process_surface(
+                self.__repr__(), progress, self.memory_required.size, self.memory_required.unit, self.priority)
+        return self.__pygame_process_surface
+
+    def add_overhead(self, overhead: timedelta) -> None:
+        '''Adds time the process must spend on the cpu before its cpu time counts as useful'''
+        self.__overhead_time_remaining += overhead
+
+    @property
+    def overhead_time_recieved(self) -> timedelta:
+        '''The cpu time spent context switching to and warming the cache for the process'''
+        return self.__overhead_time_recieved
+
+    @property
+    def time_last_ran(self) -> datetime:
+        return self.__time_last_ran
 
     @property
     def preemptions(self) -> list[Preemption]:
@@ -216,7 +404,16 @@ class Process:
     @status.setter
     def status(self, new_status: ProcessStatus) -> None:
         '''Changes status to different process status, and changes `self.running` to reflect change in status.'''
+        now = self.clock.now()
+        if self.__status == ProcessStatus.NEW and self.time_arrived is not None:
+            self.time_waiting += now - self.time_arrived
+        elif self.__status == ProcessStatus.READY:
+            self.time_waiting += now - self.__time_became_ready
+        if new_status == ProcessStatus.READY:
+            self.__time_became_ready = now
         self.__status = new_status
+        if new_status == ProcessStatus.FINISHED:
+            self.time_finished = now
         if new_status == ProcessStatus.RUNNING:
             self.running = True
         else:
@@ -228,6 +425,13 @@ class Process:
 
     @property
     def priority(self) -> ProcessPriority:
+        '''The priority the process is scheduled with. This is its base priority, unless raised by a mutex it holds.'''
+        if not self.priority_boosts:
+            return self.__priority
+        return min([self.__priority, *self.priority_boosts.values()], key=lambda priority: priority.value)
+
+    @property
+    def base_priority(self) -> ProcessPriority:
         return self.__priority
 
     @property
@@ -237,7 +441,10 @@ class Process:
     def increment_cpu_time_recieved(self, increment: timedelta) -> None:
         '''Increments `self.__cpu_time_complete` and checks if process needs to be blocked, finsished, or otherwise removed from having cpu time.'''
         self.__cpu_time_recieved += increment
-        # Checks if any preemptions are triggered
+        self.check_preemptions()
+
+    def check_preemptions(self) -> None:
+        '''Sets `self.__cpu_time_over` to the reason of the first preemption the cpu time recieved has reached'''
         for preemption in self.preemptions:
             print(preemption)
             if self.cpu_time_recieved >= preemption.time_of_preemption:
@@ -0,0 +1,19 @@
+from functools import lru_cache
+import pygame
+
+
+@lru_cache(maxsize=None)
+def get_font(size: int) -> pygame.font.Font:
+    '''Returns the default font at the given size. Fonts are loaded once and shared by every simulation being drawn.'''
+    return pygame.font.Font(None, size)
+
+
+# Caches of pygame objects, which must be emptied before pygame quits
+pygame_caches = [get_font]
+
+
+def quit_pygame() -> None:
+    '''Empties the caches of pygame objects, then quits pygame. Fonts and surfaces kept past `pygame.quit()` crash the next simulation run in the same process.'''
+    for cache in pygame_caches:
+        cache.cache_clear()
+    pygame.quit()
@@ -0,0 +1,303 @@
+from datetime import datetime, timedelta
+from math import ceil
+from random import Random
+from typing import TypedDict, Union
+from enums import ProcessPriority, RealTimePolicy
+from memory import Memory, MemoryUnits
+from process import Process
+import heapq
+
+
+class RealTimeTask:
+    '''A task that releases a job every `period`, or at least `period` apart when `sporadic`. Each job runs for up to `worst_case_execution_time`, and must finish within `relative_deadline` of being released.'''
+
+    def __init__(self, name: str, period: timedelta, worst_case_execution_time: timedelta, relative_deadline: timedelta = None, memory_mb: float = 1, sporadic: bool = False, phase: timedelta = timedelta(seconds=0), number_of_jobs: int = 20, best_case_execution_time: timedelta = None):
+        self.__name = name
+        self.__period = period
+        self.__worst_case_execution_time = worst_case_execution_time
+        # Deadlines are implicit (equal to the period) unless given
+        self.__relative_deadline = relative_deadline if relative_deadline is not None else period
+        self.__memory_mb = memory_mb
+        self.__sporadic = sporadic
+        # The delay before the first job is released
+        self.__phase = phase
+        # Jobs stop being released after this many, so simulations can finish
+        self.__number_of_jobs = number_of_jobs
+        # If given, each job runs for a time picked uniformly between this and the worst case
+        self.__best_case_execution_time = best_case_execution_time
+
+    def __repr__(self) -> str:
+        return self.__name
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def period(self) -> timedelta:
+        return self.__period
+
+    @property
+    def worst_case_execution_time(self) -> timedelta:
+        return self.__worst_case_execution_time
+
+    @property
+    def relative_deadline(self) -> timedelta:
+        return self.__relative_deadline
+
+    @property
+    def memory_mb(self) -> float:
+        return self.__memory_mb
+
+    @property
+    def sporadic(self) -> bool:
+        return self.__sporadic
+
+    @property
+    def phase(self) -> timedelta:
+        return self.__phase
+
+    @property
+    def number_of_jobs(self) -> int:
+        return self.__number_of_jobs
+
+    @property
+    def best_case_execution_time(self) -> timedelta:
+        return self.__best_case_execution_time
+
+    @property
+    def utilisation(self) -> float:
+        '''The fraction of the cpu the task needs in the worst case'''
+        return self.__worst_case_execution_time / self.__period
+
+    @property
+    def density(self) -> float:
+        '''The utilisation measured against the deadline when it is shorter than the period'''
+        return self.__worst_case_execution_time / min(self.__period, self.__relative_deadline)
+
+
+class RealTimeJob(Process):
+    '''One release of a real time task. Runs as a `ProcessPriority.REAL_TIME` process.'''
+
+    def __init__(self, task: RealTimeTask, job_number: int, release_time: datetime, execution_time: timedelta):
+        super().__init__(execution_time, Memory(task.memory_mb, MemoryUnits.MB),
+                         ProcessPriority.REAL_TIME, f'{task.name}#{job_number}')
+        self.__task = task
+        self.__release_time = release_time
+        self.__absolute_deadline = release_time + task.relative_deadline
+
+    @property
+    def task(self) -> RealTimeTask:
+        return self.__task
+
+    @property
+    def release_time(self) -> datetime:
+        return self.__release_time
+
+    @property
+    def absolute_deadline(self) -> datetime:
+        return self.__absolute_deadline
+
+    @property
+    def lateness(self) -> Union[timedelta, None]:
+        '''How long after its deadline the job finished (negative if early), or `None` if it has not finished'''
+        if self.time_finished is None:
+            return None
+        return self.time_finished - self.__absolute_deadline
+
+
+class DeadlineRecord(TypedDict):
+    job: str
+    task: str
+    release_time: datetime
+    absolute_deadline: datetime
+    time_finished: datetime
+    lateness: timedelta
+
+
+class SchedulabilityResult(TypedDict):
+    policy: RealTimePolicy
+    # The utilisation, density or hyperbolic product compared with the bound, depending on the test
+    utilisation: float
+    # The utilisation (or density) the task set must be within for the test to pass
+    bound: float
+    # `True` if the task set is guaranteed to meet its deadlines, `False` if it cannot, or `None` if the bounds cannot tell
+    schedulable: Union[bool, None]
+    test: str
+
+
+def schedulability_check(tasks: list[RealTimeTask], policy: RealTimePolicy) -> SchedulabilityResult:
+    '''A fast (linear time) utilisation bound test of whether the tasks can meet their deadlines on one cpu, ignoring context switch costs.
+    EDF uses the exact U <= 1 test for implicit deadlines, and the sufficient density test otherwise.
+    Rate monotonic uses the Liu and Layland bound n(2^(1/n) - 1), then the tighter hyperbolic bound (product of U + 1 <= 2). Both need deadlines no shorter than periods.'''
+    utilisation = sum([task.utilisation for task in tasks])
+    implicit_deadlines = all(
+        [task.relative_deadline >= task.period for task in tasks])
+    if utilisation > 1:
+        return {'policy': policy, 'utilisation': utilisation, 'bound': 1, 'schedulable': False, 'test': 'utilisation above 1'}
+    if policy == RealTimePolicy.EARLIEST_DEADLINE_FIRST:
+        if implicit_deadlines:
+            return {'policy': policy, 'utilisation': utilisation, 'bound': 1, 'schedulable': True, 'test': 'EDF utilisation'}
+        density = sum([task.density for task in tasks])
+        return {'policy': policy, 'utilisation': density, 'bound': 1, 'schedulable': True if density <= 1 else None, 'test': 'EDF density'}
+    liu_layland_bound = len(tasks) * (2 ** (1 / len(tasks)) - 1) if tasks else 1
+    if not implicit_deadlines:
+        return {'policy': policy, 'utilisation': utilisation, 'bound': liu_layland_bound, 'schedulable': None, 'test': 'deadlines shorter than periods'}
+    if utilisation <= liu_layland_bound:
+        return {'policy': policy, 'utilisation': utilisation, 'bound': liu_layland_bound, 'schedulable': True, 'test': 'Liu and Layland bound'}
+    hyperbolic_product = 1
+    for task in tasks:
+        hyperbolic_product *= task.utilisation + 1
+    return {'policy': policy, 'utilisation': hyperbolic_product, 'bound': 2, 'schedulable': True if hyperbolic_product <= 2 else None, 'test': 'hyperbolic bound'}
+
+
+class RealTimeScheduler:
+    '''Releases the jobs of real time tasks and decides which ready job runs next, by earliest absolute deadline or by shortest period (rate monotonic).
+    Ready jobs are kept in a heap ordered by that dispatch key, so the next job is found in O(1) and jobs are added in O(log n).'''
+
+    def __init__(self, tasks: list[RealTimeTask], policy: RealTimePolicy = RealTimePolicy.EARLIEST_DEADLINE_FIRST, seed: int = None):
+        self.__tasks = list(tasks)
+        self.__policy = policy
+        # Picks execution times and sporadic release gaps
+        self.__random = Random(seed)
+        # The next release of each task, as a heap of (release time, order scheduled, task). Filled in when the scheduler is first updated.
+        self.__releases: list[tuple] = []
+        self.__releases_scheduled = 0
+        self.__started = False
+        self.__jobs_released: dict[str, int] = {
+            task.name: 0 for task in self.__tasks}
+        # Ready jobs, as a heap of (dispatch key, order added, job)
+        self.__ready_jobs: list[tuple] = []
+        self.__jobs_added = 0
+        self.deadline_records: list[DeadlineRecord] = []
+
+    @property
+    def tasks(self) -> list[RealTimeTask]:
+        return self.__tasks
+
+    @property
+    def policy(self) -> RealTimePolicy:
+        return self.__policy
+
+    @property
+    def releases_pending(self) -> bool:
+        '''True if any task has jobs still to release'''
+        return not self.__started or bool(self.__releases)
+
+    @property
+    def number_ready_jobs(self) -> int:
+        return len(self.__ready_jobs)
+
+    @property
+    def ready_jobs(self) -> list[RealTimeJob]:
+        '''The ready jobs in the order they will be dispatched'''
+        return [job for _, _, job in sorted(self.__ready_jobs)]
+
+    def schedule_release(self, task: RealTimeTask, release_time: datetime) -> None:
+        heapq.heappush(self.__releases,
+                       (release_time, self.__releases_scheduled, task))
+        self.__releases_scheduled += 1
+
+    def release_jobs(self, now: datetime) -> list[RealTimeJob]:
+        '''Creates the jobs whose release time has been reached, and schedules the next release of their tasks. The first call starts every task, offset by its phase.'''
+        if not self.__started:
+            self.__started = True
+            for task in self.__tasks:
+                if task.number_of_jobs > 0:
+                    self.schedule_release(task, now + task.phase)
+        released_jobs = []
+        while self.__releases and self.__releases[0][0] <= now:
+            release_time, _, task = heapq.heappop(self.__releases)
+            task: RealTimeTask
+            self.__jobs_released[task.name] += 1
+            job_number = self.__jobs_released[task.name]
+            released_jobs.append(RealTimeJob(
+                task, job_number, release_time, self.execution_time(task)))
+            if job_number < task.number_of_jobs:
+                self.schedule_release(
+                    task, release_time + self.time_till_next_release(task))
+        return released_jobs
+
+    def execution_time(self, task: RealTimeTask) -> timedelta:
+        if task.best_case_execution_time is None:
+            return task.worst_case_execution_time
+        return task.best_case_execution_time + (task.worst_case_execution_time - task.best_case_execution_time) * self.__random.random()
+
+    def time_till_next_release(self, task: RealTimeTask) -> timedelta:
+        '''The period, plus an exponentially distributed delay averaging half a period for sporadic tasks'''
+        if not task.sporadic:
+            return task.period
+        return task.period + task.period * self.__random.expovariate(2)
+
+    def dispatch_key(self, job: RealTimeJob) -> tuple:
+        '''Smaller keys run first. Ties are broken by the absolute deadline.'''
+        if self.__policy == RealTimePolicy.RATE_MONOTONIC:
+            return (job.task.period, job.absolute_deadline)
+        return (job.absolute_deadline,)
+
+    def add_ready_job(self, job: RealTimeJob) -> None:
+        heapq.heappush(self.__ready_jobs,
+                       (self.dispatch_key(job), self.__jobs_added, job))
+        self.__jobs_added += 1
+
+    def pop_ready_job(self) -> RealTimeJob:
+        '''Removes and returns the ready job that should run next'''
+        return heapq.heappop(self.__ready_jobs)[2]
+
+    def should_preempt(self, job: RealTimeJob) -> bool:
+        '''True if a ready job should run ahead of the running `job`'''
+        return bool(self.__ready_jobs) and self.__ready_jobs[0][0] < self.dispatch_key(job)
+
+    def record_completion(self, job: RealTimeJob) -> None:
+        self.deadline_records.append({
+            'job': job.identifier,
+            'task': job.task.name,
+            'release_time': job.release_time,
+            'absolute_deadline': job.absolute_deadline,
+            'time_finished': job.time_finished,
+            'lateness': job.lateness
+        })
+
+    def deadline_misses(self, task: RealTimeTask = None) -> int:
+        return len([record for record in self.records_for(task) if record['lateness'] > timedelta(seconds=0)])
+
+    def deadline_miss_ratio(self, task: RealTimeTask = None) -> float:
+        '''The fraction of finished jobs (of `task`, or of every task) that finished after their deadline'''
+        records = self.records_for(task)
+        if not records:
+            return 0
+        return self.deadline_misses(task) / len(records)
+
+    def lateness_percentile(self, fraction: float, task: RealTimeTask = None) -> Union[timedelta, None]:
+        '''Nearest rank percentile of the lateness of finished jobs, or `None` if none have finished'''
+        latenesses = sorted([record['lateness']
+                            for record in self.records_for(task)])
+        if not latenesses:
+            return None
+        return latenesses[max(0, ceil(fraction * len(latenesses)) - 1)]
+
+    def records_for(self, task: RealTimeTask = None) -> list[DeadlineRecord]:
+        if task is None:
+            return self.deadline_records
+        return [record for record in self.deadline_records if record['task'] == task.name]
+
+    def schedulability(self) -> SchedulabilityResult:
+        return schedulability_check(self.__tasks, self.__policy)
+
+    def report(self) -> str:
+        '''A summary of deadline misses and the lateness distribution, overall and for each task, with the schedulability pre-check'''
+        schedulability = self.schedulability()
+        verdict = {True: 'schedulable', False: 'not schedulable',
+                   None: 'inconclusive'}[schedulability['schedulable']]
+        lines = [f"Real time ({self.__policy.name}): {len(self.deadline_records)} jobs, {self.deadline_misses()} deadline misses ({self.deadline_miss_ratio():.1%}), {self.lateness_report()}",
+                 f"  Pre-check ({schedulability['test']}): {schedulability['utilisation']:.3f} against bound {schedulability['bound']:.3f}, {verdict}"]
+        for task in self.__tasks:
+            lines.append(
+                f'  {task} (period {task.period}, WCET {task.worst_case_execution_time}, deadline {task.relative_deadline}): {len(self.records_for(task))} jobs, miss ratio {self.deadline_miss_ratio(task):.1%}, {self.lateness_report(task)}')
+        return '\n'.join(lines)
+
+    def lateness_report(self, task: RealTimeTask = None) -> str:
+        '''Lateness percentiles in seconds, as early jobs have negative lateness'''
+        if not self.records_for(task):
+            return 'no lateness recorded'
+        return 'lateness ' + ', '.join(f'{name} {self.lateness_percentile(fraction, task).total_seconds():+.3f}s' for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1)))
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+from queue import Queue, Full
+from pathlib import Path
+from clock import SimulatedClock
+import struct
+import threading
+import zlib
+import pygame
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    '''Creates a PNG chunk with its length and CRC'''
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def compress_rgb_frame(frame: bytes, width: int) -> bytes:
+    '''Compresses raw RGB pixels into PNG image data. `zlib` releases the GIL while compressing, so this can run on worker threads alongside the simulation.'''
+    row_length = width * 3
+    # Each row is prefixed with filter type 0 (no filter)
+    rows = [b'\x00' + frame[start:start + row_length]
+            for start in range(0, len(frame), row_length)]
+    return zlib.compress(b''.join(rows), 6)
+
+
+def png_header(width: int, height: int) -> bytes:
+    '''The IHDR chunk for an 8 bit RGB image'''
+    return png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+
+def read_png_image_data(path: Path) -> bytes:
+    '''Reads the compressed image data back out of a PNG written by `FrameRecorder`'''
+    data = path.read_bytes()
+    position = len(PNG_SIGNATURE)
+    image_data = []
+    while position < len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        chunk_type = data[position + 4:position + 8]
+        if chunk_type == b'IDAT':
+            image_data.append(data[position + 8:position + 8 + length])
+        position += length + 12
+    return b''.join(image_data)
+
+
+class FrameRecorder:
+    '''Captures the graphics of an os at a fixed simulated time interval into an offscreen surface, and encodes them on worker threads as a PNG sequence (and optionally an animated PNG)'''
+
+    def __init__(self, output_directory: str, frame_interval: timedelta = timedelta(seconds=0.5), screen_size: tuple[int, int] = (1440, 850), max_queued_frames: int = 16, number_of_workers: int = 2, animated: bool = False, frame_duration_ms: int = 100):
+        self.__output_directory = Path(output_directory)
+        self.__output_directory.mkdir(parents=True, exist_ok=True)
+        self.__frame_interval = frame_interval
+        self.__screen_size = screen_size
+        # Frames are drawn here rather than to a window
+        self.__surface = pygame.Surface(screen_size)
+        # Frames waiting to be encoded. When full, new frames are dropped rather than slowing a simulation in real time, while a simulation in simulated time waits for space as it has no deadline to keep.
+        self.__frame_queue: Queue = Queue(max_queued_frames)
+        self.__animated = animated
+        self.__frame_duration_ms = frame_duration_ms
+        self.__time_of_next_frame: datetime = None
+        self.__frames_captured = 0
+        self.frames_dropped = 0
+        self.frame_paths: list[Path] = []
+        self.__workers = [threading.Thread(target=self.encode_frames, daemon=True)
+                          for _ in range(number_of_workers)]
+        for worker in self.__workers:
+            worker.start()
+
+    @property
+    def frames_captured(self) -> int:
+        return self.__frames_captured
+
+    def capture(self, operating_system, now: datetime) -> None:
+        '''Draws a frame of the os if a frame interval has passed since the last one, and queues it for encoding'''
+        if self.__time_of_next_frame is not None and now < self.__time_of_next_frame:
+            return
+        if self.__time_of_next_frame is None:
+            self.__time_of_next_frame = now
+        self.__time_of_next_frame += self.__frame_interval
+        self.__surface.fill('white')
+        operating_system.pygame_create_graphics(self.__surface)
+        frame_path = self.__output_directory / \
+            f'frame_{self.__frames_captured:06d}.png'
+        frame = (frame_path, pygame.image.tobytes(self.__surface, 'RGB'))
+        if isinstance(operating_system.clock, SimulatedClock):
+            self.__frame_queue.put(frame)
+        else:
+            try:
+                self.__frame_queue.put_nowait(frame)
+            except Full:
+                self.frames_dropped += 1
+                return
+        self.__frames_captured += 1
+        self.frame_paths.append(frame_path)
+
+    def encode_frames(self) -> None:
+        '''Run by each worker thread. Encodes queued frames until it recieves `None`.'''
+        width, height = self.__screen_size
+        while True:
+            queued_frame = self.__frame_queue.get()
+            if queued_frame is None:
+                return
+            frame_path, frame = queued_frame
+            frame_path.write_bytes(PNG_SIGNATURE + png_header(width, height) + png_chunk(
+                b'IDAT', compress_rgb_frame(frame, width)) + png_chunk(b'IEND', b''))
+
+    def close(self) -> None:
+        '''Waits for queued frames to be encoded, and writes the animated PNG if one was requested'''
+        for _ in self.__workers:
+            self.__frame_queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        if self.__animated and self.frame_paths:
+            self.write_animated_png(self.__output_directory / 'recording.png')
+        print(
+            f'{self.__frames_captured} frames recorded to {self.__output_directory}, {self.frames_dropped} dropped')
+
+    def write_animated_png(self, path: Path) -> None:
+        '''Joins the encoded frames into a single animated PNG (APNG)'''
+        width, height = self.__screen_size
+        sequence_number = 0
+        chunks = [PNG_SIGNATURE, png_header(width, height), png_chunk(
+            b'acTL', struct.pack('>II', len(self.frame_paths), 0))]
+        for index, frame_path in enumerate(self.frame_paths):
+            frame_control = struct.pack('>IIIIIHHBB', sequence_number, width, height,
+                                        0, 0, self.__frame_duration_ms, 1000, 0, 0)
+            chunks.append(png_chunk(b'fcTL', frame_control))
+            sequence_number += 1
+            image_data = read_png_image_data(frame_path)
+            if index == 0:
+                # The first frame doubles as the still image shown by viewers without APNG support
+                chunks.append(png_chunk(b'IDAT', image_data))
+            else:
+                chunks.append(png_chunk(
+                    b'fdAT', struct.pack('>I', sequence_number) + image_data))
+                sequence_number += 1
+        chunks.append(png_chunk(b'IEND', b''))
+        path.write_bytes(b''.join(chunks))
@@ -1,23 +1,65 @@
 from memory import MemoryUnits, Memory
-from process import Process, ProcessPriority, ProcessStatus, BlockingPreemptionWithPosition, Preemption, pygame, ProcessSurface
+from process import Process, ProcessPriority, ProcessStatus, BlockingPreemptionWithPosition, Preemption, PidAllocator, pygame, ProcessSurface
+from pygame_functions import get_font, quit_pygame
 from datetime import timedelta
+from typing import Union
 from enums import PreemptReason, priority_colors
+from devices import Device
+from paging import PagedMemoryManager
+from clock import WallClock, SimulatedClock
+from recording import FrameRecorder
+from state_stream import StateStreamServer
+from realtime import RealTimeScheduler
+from synchronisation import SynchronisationPrimitive, find_wait_for_cycle
+from groups import ProcessGroup, GROUP_SCHEDULED_QUEUES
+from power import Core
+from math import exp
 import asyncio
+import heapq
 
 
 class CentralProcessingUnit:
-    def __init__(self, total_memory_mb: int):
+    def __init__(self, total_memory_mb: int, context_switch_cost: timedelta = timedelta(seconds=0), cache_warmup_penalty: timedelta = timedelta(seconds=0), cache_decay_time: timedelta = timedelta(seconds=1), cores: list[Core] = None):
         self.__total_memory = Memory(total_memory_mb, MemoryUnits.MB)
         self.memory_available = Memory(total_memory_mb, MemoryUnits.MB)
         self.current_process_executing = None
+        # The time taken to save and restore state when switching to a different process
+        self.__context_switch_cost = context_switch_cost
+        # The time a process with a completely cold cache/TLB takes to warm it up
+        self.__cache_warmup_penalty = cache_warmup_penalty
+        # How quickly a process' cache goes cold while it is away from the cpu
+        self.__cache_decay_time = cache_decay_time
+        # Cores with frequency scaling and a power model. Processes run on the first, as the os runs one process at a time. Without cores, processes run at full speed and energy is not modelled.
+        self.__cores = cores if cores is not None else []
 
     @property
     def total_memory(self):
         return self.__total_memory
 
+    @property
+    def context_switch_cost(self) -> timedelta:
+        return self.__context_switch_cost
+
+    @property
+    def cores(self) -> list[Core]:
+        return self.__cores
+
+    @property
+    def speed(self) -> float:
+        '''The speed processes run at on the core they are scheduled on, relative to its highest frequency'''
+        return self.__cores[0].speed if self.__cores else 1
+
+    def cache_warmup_penalty(self, time_away: timedelta) -> timedelta:
+        '''The cache warm up time for a process that has been off the cpu for `time_away`. A `time_away` of `None` means the cache is completely cold.'''
+        if time_away is None:
+            return self.__cache_warmup_penalty
+        return self.__cache_warmup_penalty * (1 - exp(-(time_away / self.__cache_decay_time)))
+
 
 class OperatingSystem:
-    def __init__(self, cpu: CentralProcessingUnit, round_robin_timing: timedelta = timedelta(seconds=0.25)):
+    SCREEN_SIZE = (1440, 850)
+
+    def __init__(self, cpu: CentralProcessingUnit, round_robin_timing: timedelta = timedelta(seconds=0.25), memory_manager: PagedMemoryManager = None, clock: Union[WallClock, SimulatedClock] = None, real_time_scheduler: RealTimeScheduler = None, root_group: ProcessGroup = None):
         # Initalise queues for different states
         # First in first out queue
         self.new_process_queue: list[Process] = []
@@ -31,36 +73,143 @@ class OperatingSystem:
         self.running_process: list[Process] = []
         # A collection of processes that are finished
         self.finished_processes = []
+        # Processes killed by the os to break deadlocks
+        self.terminated_processes = []
         # A collection of processes waiting for contested resources
         self.blocked_processes = []
+        # The I/O devices blocked processes submit requests to
+        self.devices: list[Device] = []
+        # The mutexes, semaphores and conditions used by processes, kept for reporting
+        self.synchronisation_primitives: list[SynchronisationPrimitive] = []
+        # The processes in each deadlock found, by identifier
+        self.deadlocks: list[list[str]] = []
+        # Processes that started waiting on a primitive as they were unblocked, still to be checked for deadlock
+        self.processes_started_waiting: list[Process] = []
+        # Time spent with a process waiting on a lower priority holder while a process of priority in between runs
+        self.priority_inversions = 0
+        self.priority_inversion_time = timedelta(seconds=0)
+        self.__time_priority_inversion_started = None
+        # Processes that will be added to the new process queue at a later time, as a heap of (arrival time, order scheduled, process)
+        self.scheduled_arrivals: list[tuple] = []
+        self.__arrivals_scheduled = 0
 
         # Assign the cpu that is being used
         self.CPU = cpu
+        # Pages processes in and out of memory. Without one, processes are only admitted if they fit entirely in memory
+        self.memory_manager = memory_manager
+        # Releases periodic and sporadic jobs, and orders the ready ones. Real time jobs run ahead of every other priority.
+        self.real_time_scheduler = real_time_scheduler
+        # The root of the tree of process groups that share the cpu and memory. Without one, all processes of a priority compete in one pool.
+        self.root_group = root_group
 
         # Assign os settings
         self.__round_robin_timing = round_robin_timing
+        # Real time by default, or simulated time for runs that should not wait
+        self.clock = clock if clock is not None else WallClock()
+        # When the first cycle ran, used to calculate throughput
+        self.time_started = None
+        # Gives each process added to the os an ID
+        self.pid_allocator = PidAllocator()
+
+        # Accounting of cpu time spent on processes against time lost to context switching
+        self.context_switches = 0
+        self.useful_cpu_time = timedelta(seconds=0)
+        self.overhead_time = timedelta(seconds=0)
 
     def add_new_processes(self, *new_processes: Process) -> None:
         '''Adds a variable number of processes to `self.new_process_queue`'''
         for process in new_processes:
+            self.assign_pid(process)
+            process.clock = self.clock
+            process.time_arrived = self.clock.now()
+            if self.root_group is not None and process.group is None and process.priority != ProcessPriority.REAL_TIME:
+                self.root_group.default_group().add_process(process)
             self.new_process_queue.append(process)
 
+    def schedule_process(self, process: Process, time_till_arrival: timedelta) -> None:
+        '''Adds the process to the new process queue once `time_till_arrival` has passed'''
+        self.assign_pid(process)
+        heapq.heappush(self.scheduled_arrivals, (self.clock.now(
+        ) + time_till_arrival, self.__arrivals_scheduled, process))
+        self.__arrivals_scheduled += 1
+
+    def assign_pid(self, process: Process) -> None:
+        if process.pid is None:
+            process.pid = self.pid_allocator.allocate()
+
+    def check_arrivals(self) -> None:
+        '''Adds scheduled processes whose arrival time has been reached'''
+        now = self.clock.now()
+        while self.scheduled_arrivals and self.scheduled_arrivals[0][0] <= now:
+            self.add_new_processes(heapq.heappop(self.scheduled_arrivals)[2])
+
+    def update_process_groups(self) -> None:
+        '''Unthrottles process groups whose quota period has ended'''
+        if self.root_group is not None:
+            self.root_group.update(self.clock.now())
+
+    def check_real_time_releases(self) -> None:
+        '''Adds real time jobs whose release time has been reached, and admits each one that fits straight away so it can preempt the running process. Other new processes are left to be admitted as usual.'''
+        if self.real_time_scheduler is None:
+            return
+        for job in self.real_time_scheduler.release_jobs(self.clock.now()):
+            self.add_new_processes(job)
+            if self.process_fits(job):
+                self.new_process_queue.remove(job)
+                self.admit_process(job)
+
+    def add_devices(self, *new_devices: Device) -> None:
+        '''Adds a variable number of I/O devices to `self.devices`'''
+        for device in new_devices:
+            self.devices.append(device)
+
+    def add_synchronisation_primitives(self, *new_primitives: SynchronisationPrimitive) -> None:
+        '''Adds a variable number of mutexes, semaphores and conditions to `self.synchronisation_primitives`'''
+        for primitive in new_primitives:
+            self.synchronisation_primitives.append(primitive)
+
     def admit_processes(self):
-        '''Admits as many processes from `self.new_process_queue` to the `self.ready_queue` as there is space in memory'''
+        '''Admits as many processes from `self.new_process_queue` to the `self.ready_queue` as there is space in memory (or in memory and swap when paging)'''
         for index, process in enumerate(self.new_process_queue):
             # If there is space avaiable in memory
-            if process.memory_required < self.CPU.memory_available:
-                # Change process status, alter available memory and move process to ready
+            if self.process_fits(process):
                 process_to_move = self.new_process_queue.pop(index)
-                process_to_move.status = ProcessStatus.READY
-                self.CPU.memory_available -= process_to_move.memory_required
-                process_to_move.add_preemption(PreemptReason.COMPLETION)
-                self.add_process_to_ready_queue(process_to_move)
+                self.admit_process(process_to_move)
+
+    def process_fits(self, process: Process) -> bool:
+        '''True if there is space in memory (and in its groups' memory limits) to admit the process'''
+        if self.memory_manager is not None:
+            process_fits = self.memory_manager.can_admit(process)
+        else:
+            process_fits = process.memory_required < self.CPU.memory_available
+        if process_fits and process.group is not None:
+            # Must also fit within the memory limits of its groups
+            process_fits = process.group.can_admit(process)
+        return process_fits
+
+    def admit_process(self, process_to_move: Process) -> None:
+        '''Moves a process taken from `self.new_process_queue` to the ready queue'''
+        # Change process status, alter available memory and move process to ready
+        process_to_move.status = ProcessStatus.READY
+        if self.memory_manager is not None:
+            self.memory_manager.admit(process_to_move)
+        else:
+            self.CPU.memory_available -= process_to_move.memory_required
+        if process_to_move.group is not None:
+            process_to_move.group.admit(process_to_move)
+        process_to_move.add_preemption(PreemptReason.COMPLETION)
+        self.add_process_to_ready_queue(process_to_move)
 
     def add_process_to_ready_queue(self, process_to_move: Process) -> None:
-        '''Adds the process to the correct list in the ready queue'''
+        '''Adds the process to the correct list in the ready queue, or to the real time scheduler for real time jobs'''
+        if process_to_move.priority == ProcessPriority.REAL_TIME:
+            self.real_time_scheduler.add_ready_job(process_to_move)
+            return
         self.ready_queue[process_to_move.priority.name].append(
             process_to_move)
+        if process_to_move.group is not None:
+            process_to_move.group.enqueue(
+                process_to_move.priority.name, process_to_move)
 
     def run_process(self):
         '''Moves the next process from ready to running. Sets the time that the process will be preempted at.'''
@@ -73,37 +222,81 @@ class OperatingSystem:
             # Return so blocked processes can be checked during self.run()
             return
         new_running_process = None
-        if self.ready_queue_HIGH_priority:
+        if self.real_time_scheduler is not None and self.real_time_scheduler.number_ready_jobs:
+            # Runs the real time job with the earliest deadline (or shortest period)
+            new_running_process = self.real_time_scheduler.pop_ready_job()
+        elif self.root_group is not None:
+            new_running_process = self.pop_grouped_ready_process()
+            if new_running_process is None:
+                # Every group with ready processes is throttled
+                return
+        elif self.ready_queue_HIGH_priority:
             # Runs the process at the front of the high priority queue
             new_running_process: Process = self.ready_queue_HIGH_priority_pop(
                 0)
-            # Given preemption reason is round robin
-            new_running_process.add_preemption(
-                PreemptReason.ROUND_ROBIN, self.round_robin_timing)
+            # Given preemption reason is round robin
+            self.start_quantum(new_running_process)
 
         elif self.ready_queue_IO_priority:
             # Runs the process at the front of the I/O priority queue (first process to be added to the queue)
             new_running_process: Process = self.ready_queue_IO_priority_pop(
                 0)
         elif self.ready_queue_LOW_priority:
-            # Find shortest job
-            index_of_shortest_job = 0
-            first_process: Process = self.ready_queue_LOW_priority[index_of_shortest_job]
-            time_to_complete_shortest_job = first_process.time_to_complete - \
-                first_process.cpu_time_recieved
-            for index, process in enumerate(self.ready_queue_LOW_priority):
-                current_process: Process = process
-                cpu_time_needed: timedelta = current_process.time_to_complete - \
-                    current_process.cpu_time_recieved
-                if cpu_time_needed < time_to_complete_shortest_job:
-                    index_of_shortest_job = index
-            # Get shortest job
-            new_running_process = self.ready_queue_LOW_priority_pop(
-                index_of_shortest_job)
+            new_running_process = self.pop_shortest_job()
+        self.charge_context_switch(new_running_process)
         new_running_process.status = ProcessStatus.RUNNING
         self.running_process.append(new_running_process)
         return
 
+    def pop_shortest_job(self) -> Process:
+        '''Takes the shortest job from the low priority queue'''
+        # Find shortest job
+        index_of_shortest_job = 0
+        first_process: Process = self.ready_queue_LOW_priority[index_of_shortest_job]
+        time_to_complete_shortest_job = first_process.time_to_complete - \
+            first_process.cpu_time_recieved
+        for index, process in enumerate(self.ready_queue_LOW_priority):
+            current_process: Process = process
+            cpu_time_needed: timedelta = current_process.time_to_complete - \
+                current_process.cpu_time_recieved
+            if cpu_time_needed < time_to_complete_shortest_job:
+                index_of_shortest_job = index
+        # Get shortest job
+        return self.ready_queue_LOW_priority_pop(index_of_shortest_job)
+
+    def pop_grouped_ready_process(self) -> Union[Process, None]:
+        '''Takes the next process from the highest priority ready queue with an unthrottled group, choosing the group by weighted fair queuing, then the process by the queue's usual order'''
+        for queue_name in GROUP_SCHEDULED_QUEUES:
+            group = self.root_group.select(queue_name)
+            if group is None:
+                continue
+            # The group keeps its own ready processes in order, so the ready queue is not searched for them
+            new_running_process = group.pop_ready_process(queue_name)
+            self.ready_queue[queue_name].remove(new_running_process)
+            if queue_name == ProcessPriority.HIGH.name:
+                self.start_quantum(new_running_process)
+            return new_running_process
+        return None
+
+    def start_quantum(self, process: Process) -> None:
+        '''Gives a high priority process being dispatched a full round robin quantum, dropping any left over from a quantum it did not finish'''
+        process.cancel_preemptions(PreemptReason.ROUND_ROBIN)
+        process.add_preemption(
+            PreemptReason.ROUND_ROBIN, self.round_robin_timing)
+
+    def charge_context_switch(self, process: Process) -> None:
+        '''Gives the process about to run the context switch and cache warm up overhead it must pay before doing useful work'''
+        overhead = timedelta(seconds=0)
+        if process is not self.CPU.current_process_executing:
+            self.context_switches += 1
+            overhead += self.CPU.context_switch_cost
+        time_away = None
+        if process.time_last_ran is not None:
+            time_away = self.clock.now() - process.time_last_ran
+        overhead += self.CPU.cache_warmup_penalty(time_away)
+        process.add_overhead(overhead)
+        self.CPU.current_process_executing = process
+
     def check_running_process(self):
         '''Checks to see if currently running process (`self.running_process[0]` is complete). If so moves that process to `self.finished_processes` and moves new process into `self.running_process`'''
         # Runs a process if none are currently running
@@ -117,15 +310,32 @@ class OperatingSystem:
         current_process = self.running_process.pop()
 
         # Calculate cpu time recieved by current process
-        current_process.calculate_cpu_time_recieved()
+        overhead_time_before = current_process.overhead_time_recieved
+        cpu_time_recieved = current_process.calculate_cpu_time_recieved(
+            self.CPU.speed)
+        self.useful_cpu_time += cpu_time_recieved
+        overhead_time_recieved = current_process.overhead_time_recieved - overhead_time_before
+        self.overhead_time += overhead_time_recieved
+        if current_process.group is not None:
+            current_process.group.charge(
+                cpu_time_recieved + overhead_time_recieved, self.clock.now())
+        # Spawning, releasing and acquiring without waiting do not stop the process running, so it passes every such point reached this cycle
+        while current_process.cpu_time_over in (PreemptReason.SPAWN, PreemptReason.ACQUIRE, PreemptReason.RELEASE):
+            if current_process.cpu_time_over == PreemptReason.SPAWN:
+                self.spawn_children(current_process)
+            elif not self.synchronise(current_process):
+                break
+        if not current_process.cpu_time_over and self.memory_manager is not None:
+            self.check_page_faults(current_process, cpu_time_recieved)
         print(
             f'{current_process.cpu_time_recieved}/{current_process.time_to_complete}\t{current_process}')
 
         if not current_process.cpu_time_over:
             # Process has not reached pre-set time to stop
-            if self.process_priority_lower_than_queued_processes(current_process):
-                # Currently running process needs to be relpaced with process of higher priority
-                # Remove process to ready queue
+            if self.process_priority_lower_than_queued_processes(current_process) or (current_process.group is not None and current_process.group.is_throttled):
+                # Currently running process needs to be relpaced with process of higher priority (or its group has used up its cpu quota)
+                # Remove process to ready queue. It gets a new quantum when it next runs.
+                current_process.cancel_preemptions(PreemptReason.ROUND_ROBIN)
                 current_process.status = ProcessStatus.READY
                 self.add_process_to_ready_queue(current_process)
                 # Run higher priority process
@@ -154,49 +364,243 @@ class OperatingSystem:
             # Move process to blocked queue
             current_process.status = ProcessStatus.BLOCKED
             self.blocked_processes.append(current_process)
+        elif current_process.cpu_time_over == PreemptReason.ACQUIRE:
+            print(f'{current_process} waiting on {current_process.waiting_on}')
+            # Move process to blocked queue until it is granted the primitive
+            current_process.status = ProcessStatus.BLOCKED
+            self.blocked_processes.append(current_process)
+            self.requeue_ready_processes()
+            self.check_deadlock(current_process)
 
         # Run a new process
         self.run_process()
 
+    def synchronise(self, process: Process) -> bool:
+        '''Carries out the acquire or release the process has reached, then checks whether it has reached another preemption in the same cycle. Returns False, leaving the acquire preemption in place, if the process has to wait.'''
+        index, preemption = self.reached_preemption(
+            process, process.cpu_time_over)
+        if process.cpu_time_over == PreemptReason.ACQUIRE:
+            if preemption.still_blocked:
+                return False
+        else:
+            # The blocked function carries out the release (or signal), and never blocks
+            preemption.carry_out()
+        process.remove_preemption(index)
+        self.requeue_ready_processes()
+        process.check_preemptions()
+        return True
+
+    def spawn_children(self, process: Process) -> None:
+        '''Spawns every child whose spawn point the process has passed, then checks whether the process has reached any other preemption (such as completing) in the same cycle'''
+        while process.cpu_time_over == PreemptReason.SPAWN:
+            index, _ = self.reached_preemption(process, PreemptReason.SPAWN)
+            process.remove_preemption(index)
+            child = process.spawn()
+            # Children share their parent's group
+            if process.group is not None:
+                process.group.add_process(child)
+            self.add_new_processes(child)
+            print(f'{process} spawned {child}')
+            process.check_preemptions()
+        self.admit_processes()
+
     def complete_process(self, process: Process) -> None:
         '''Takes a process, changes its state to reflect how it is completed, and move to completed collection'''
         process.status = ProcessStatus.FINISHED
         self.finished_processes.append(process)
-        self.CPU.memory_available += process.memory_required
+        if process.priority == ProcessPriority.REAL_TIME:
+            self.real_time_scheduler.record_completion(process)
+        self.free_process_resources(process)
         print(f'process complete')
 
+    def terminate_process(self, process: Process) -> None:
+        '''Kills a blocked process, giving up the synchronisation primitives it holds or waits on'''
+        self.blocked_processes.remove(process)
+        process.status = ProcessStatus.TERMINATED
+        self.terminated_processes.append(process)
+        self.free_process_resources(process)
+        print(f'{process} terminated')
+
+    def free_process_resources(self, process: Process) -> None:
+        '''Frees the memory and ID of a process that has stopped, releases any synchronisation primitives it still holds, and lets its parent know'''
+        self.pid_allocator.free(process.pid)
+        if process.parent is not None:
+            process.parent.unfinished_children -= 1
+        if self.memory_manager is not None:
+            self.memory_manager.release(process)
+        else:
+            self.CPU.memory_available += process.memory_required
+        if process.group is not None:
+            process.group.release(
+                process, process.status == ProcessStatus.FINISHED)
+        if process.waiting_on is not None:
+            process.waiting_on.abandon(process)
+        if process.held_primitives:
+            for primitive in list(process.held_primitives):
+                primitive.abandon(process)
+            self.requeue_ready_processes()
+
+    def reached_preemption(self, process: Process, reason: PreemptReason) -> tuple[int, Preemption]:
+        '''The index and preemption the process has just reached, for the given reason'''
+        for index, preemption in enumerate(process.preemptions):
+            if preemption.preempt_reason == reason and preemption.is_complete:
+                return index, preemption
+
+    def requeue_ready_processes(self) -> None:
+        '''Moves ready processes whose priority has been raised or restored by a mutex to the queue for their new priority'''
+        for priority_name, queue in self.ready_queue.items():
+            for process in [process for process in queue if process.priority.name != priority_name]:
+                queue.remove(process)
+                if process.group is not None:
+                    process.group.dequeue(priority_name, process)
+                self.add_process_to_ready_queue(process)
+
+    def check_deadlock(self, process: Process) -> None:
+        '''Looks for a cycle in the wait-for graph through a process that has just started waiting. A deadlock is broken by terminating the lowest priority process in it.'''
+        cycle = find_wait_for_cycle(process)
+        if cycle is None:
+            return
+        self.deadlocks.append([deadlocked_process.identifier for deadlocked_process in cycle])
+        print(f'Deadlock: {cycle}')
+        victim = max(cycle, key=lambda deadlocked_process: deadlocked_process.base_priority.value)
+        self.terminate_process(victim)
+
+    def check_priority_inversion(self) -> None:
+        '''Measures how often, and for how long, a process waits on a lower priority holder while a process of priority in between runs'''
+        inverted = False
+        if self.running_process:
+            running_process: Process = self.running_process[0]
+            for process in self.blocked_processes:
+                if process.waiting_on is None or process.priority.value >= running_process.priority.value:
+                    continue
+                if any([holder.priority.value >= running_process.priority.value and holder is not running_process for holder in process.waiting_on.holders]):
+                    inverted = True
+                    break
+        now = self.clock.now()
+        if inverted and self.__time_priority_inversion_started is None:
+            self.priority_inversions += 1
+            self.__time_priority_inversion_started = now
+        elif not inverted and self.__time_priority_inversion_started is not None:
+            self.priority_inversion_time += now - self.__time_priority_inversion_started
+            self.__time_priority_inversion_started = None
+
+    def synchronisation_report(self) -> str:
+        '''A summary of lock contention, deadlocks and priority inversion'''
+        lines = [primitive.report() for primitive in self.synchronisation_primitives]
+        deadlocks = '; '.join([' -> '.join(deadlock) for deadlock in self.deadlocks])
+        lines.append(
+            f'Synchronisation: {len(self.deadlocks)} deadlocks{" (" + deadlocks + ")" if deadlocks else ""}, {len(self.terminated_processes)} processes terminated, {self.priority_inversions} priority inversions lasting {self.priority_inversion_time}')
+        return '\n'.join(lines)
+
+    def account_energy(self) -> None:
+        '''Adds the energy each core used since the last cycle, charging the first core's energy to the process that was running on it'''
+        now = self.clock.now()
+        for index, core in enumerate(self.CPU.cores):
+            busy = index == 0 and bool(self.running_process)
+            energy_joules = core.account(now, busy)
+            if busy:
+                self.running_process[0].energy_joules += energy_joules
+
+    def govern_frequencies(self) -> None:
+        '''Lets each core's governor change its frequency. The process about to run on a core that changes frequency is stalled for the transition.'''
+        now = self.clock.now()
+        for index, core in enumerate(self.CPU.cores):
+            if core.govern(now) and index == 0 and self.running_process:
+                self.running_process[0].add_overhead(core.transition_latency)
+
+    def energy_report(self) -> str:
+        '''Energy per core, and the energy and energy-delay product of the finished processes'''
+        lines = [core.report() for core in self.CPU.cores]
+        job_energy_joules = sum(
+            process.energy_joules for process in self.finished_processes)
+        total_energy_joules = sum(core.energy_joules for core in self.CPU.cores)
+        if self.time_started is not None:
+            makespan = (self.clock.now() - self.time_started).total_seconds()
+            lines.append(
+                f'Energy: total {total_energy_joules:.3f}J ({job_energy_joules:.3f}J by finished processes), energy-delay product {total_energy_joules * makespan:.3f}Js over {makespan:.3f}s')
+        return '\n'.join(lines)
+
+    def check_page_faults(self, process: Process, cpu_time_recieved: timedelta) -> None:
+        '''Simulates the memory references made by the running process, and blocks it while any page faults are serviced'''
+        self.update_memory_manager()
+        page_fault_latency = self.memory_manager.reference_pages(
+            process, cpu_time_recieved)
+        if page_fault_latency is None:
+            return
+        process.add_preemption(PreemptReason.BLOCKED, timedelta(seconds=0),
+                               self.memory_manager.blocked_function(self.clock.now() + page_fault_latency))
+        # Triggers the preemption that has just been added so the process is moved to the blocked queue
+        process.increment_cpu_time_recieved(timedelta(seconds=0))
+
+    def update_memory_manager(self) -> None:
+        '''Lets the memory manager know the current time, so serviced page faults can be unblocked'''
+        if self.memory_manager is not None:
+            self.memory_manager.update(self.clock.now())
+
     def check_blocked_processes(self):
         for process_index, process in enumerate(self.blocked_processes):
             process: Process
-            blocking_preemptions: list[dict[str: int,
-                                            str: BlockingPreemptionWithPosition]] = process.blocking_preemptions
-            for blocking_preemption in blocking_preemptions:
-                blocking_preemption_index: int = blocking_preemption['index']
-                preemption: Preemption = blocking_preemption['preemption']
-                if not preemption.still_blocked:
-                    removed_process: Process = self.blocked_processes.pop(
-                        process_index)
-                    removed_process.remove_preemption(
-                        blocking_preemption_index)
-                    removed_process.status = ProcessStatus.READY
-                    self.add_process_to_ready_queue(removed_process)
+            if self.check_blocked_process(process):
+                removed_process: Process = self.blocked_processes.pop(
+                    process_index)
+                removed_process.status = ProcessStatus.READY
+                self.add_process_to_ready_queue(removed_process)
+
+    def check_blocked_process(self, process: Process) -> bool:
+        '''Runs the blocked function of the preemption blocking the process. Returns True, having removed the preemption, if the process is no longer blocked.'''
+        blocking_preemptions: list[dict[str: int,
+                                        str: BlockingPreemptionWithPosition]] = process.blocking_preemptions
+        for blocking_preemption in blocking_preemptions:
+            blocking_preemption_index: int = blocking_preemption['index']
+            preemption: Preemption = blocking_preemption['preemption']
+            if not preemption.is_complete:
+                # Process has not reached this preemption yet, so is not blocked by it
+                continue
+            if not preemption.still_blocked:
+                process.remove_preemption(blocking_preemption_index)
+                # An acquire reached as the process is unblocked (such as reacquiring a condition's mutex) is tried straight away
+                process.check_preemptions()
+                if process.cpu_time_over == PreemptReason.ACQUIRE and not self.synchronise(process):
+                    self.processes_started_waiting.append(process)
+                    return False
+                return True
+        return False
+
+    def check_processes_started_waiting(self) -> None:
+        '''Checks processes that started waiting as they were unblocked for deadlock, once the blocked processes are no longer being iterated over, as breaking a deadlock terminates a blocked process'''
+        while self.processes_started_waiting:
+            process = self.processes_started_waiting.pop(0)
+            if process.status == ProcessStatus.BLOCKED:
+                print(f'{process} waiting on {process.waiting_on}')
+                self.check_deadlock(process)
+
+    def check_devices(self):
+        '''Lets each device complete and start servicing requests up to the current time'''
+        now = self.clock.now()
+        for device in self.devices:
+            device.update(now)
 
     def pygame_create_ready_queue_surfaces(self) -> list[pygame.Surface]:
-        '''Creates the HIGH, IO, LOW ready queue surfaces'''
+        '''Creates the HIGH, IO, LOW ready queue surfaces, after the real time queue if there is one'''
         surfaces = []
         INSET = 5
         BORDER_WIDTH = 2
         FONT_HEIGHT = 35
-        QUEUE_NAMES = ['High', 'IO', 'Low']
-        font = pygame.font.Font(None, FONT_HEIGHT)
+        queues = [('High', ProcessPriority.HIGH, self.ready_queue_HIGH_priority),
+                  ('IO', ProcessPriority.IO, self.ready_queue_IO_priority),
+                  ('Low', ProcessPriority.LOW, self.ready_queue_LOW_priority)]
+        if self.real_time_scheduler is not None:
+            queues.insert(0, ('Real Time', ProcessPriority.REAL_TIME,
+                          self.real_time_scheduler.ready_jobs))
+        font = get_font(FONT_HEIGHT)
         title_height = 0
-        for index, queue in enumerate([self.ready_queue_HIGH_priority, self.ready_queue_IO_priority, self.ready_queue_LOW_priority]):
-            color = priority_colors[list(priority_colors.keys())[index]]
+        for index, (queue_name, priority, queue) in enumerate(queues):
+            color = priority_colors[priority]
             # Calculate width of border box
             width = len(queue) * (Process.PYGAME_SURFACE_WIDTH +
                                   2) + INSET * 2 + BORDER_WIDTH * 2 - 1
             # Create title
-            title = font.render(QUEUE_NAMES[index], True, color)
+            title = font.render(queue_name, True, color)
             if index == 0:
                 title_height = title.get_height()
             title_width = title.get_width()
@@ -236,7 +640,7 @@ class OperatingSystem:
         INSET = 5
         BORDER_WIDTH = 2
         # Create text
-        font = pygame.font.Font(None, 40)
+        font = get_font(40)
         ready_queue_text = font.render('Ready Queue', True, 'Black')
         ready_queue_text_height = ready_queue_text.get_height()
         ready_queue_text_width = ready_queue_text.get_width()
@@ -275,11 +679,11 @@ class OperatingSystem:
         '''Create the text that displays how much available memory the CPU has'''
         GAP = 4
         # Create text
-        memory_text = pygame.font.Font(None, 35)
+        memory_text = get_font(35)
         available_memory_text = memory_text.render(
             'Available Memory:', True, 'Black')
         available_memory_result_text = memory_text.render(
-            self.CPU.memory_available.__repr__(), True, 'Black')
+            self.memory_available.__repr__(), True, 'Black')
         available_memory_text_width = available_memory_text.get_width()
         available_memory_result_text_width = available_memory_result_text.get_width()
         # Calculate dimensions
@@ -318,7 +722,7 @@ class OperatingSystem:
         BORDER_WIDTH = 3
         GAP = 15
         # Create text
-        title_font = pygame.font.Font(None, 40)
+        title_font = get_font(40)
         title = title_font.render('CPU', True, 'Black')
         memory_text = self.pygame_create_memory_text()
         # Calculate dimensions
@@ -360,7 +764,7 @@ class OperatingSystem:
         BORDER_WIDTH = 2
         FONT_SIZE = 40
         # Create text
-        font = pygame.font.Font(None, FONT_SIZE)
+        font = get_font(FONT_SIZE)
         title = font.render(queue_name, True, 'Black')
         title_height = title.get_height()
         title_width = title.get_width()
@@ -405,8 +809,21 @@ class OperatingSystem:
         background.blit(white_inside, (BORDER_WIDTH, BORDER_WIDTH))
         return background
 
-    def pygame_create_graphics(self, screen: pygame.Surface) -> None:
-        '''Add all the components of the graphcis to the screen surface'''
+    def pygame_create_finished_summary_surface(self) -> pygame.Surface:
+        '''Creates a line of text counting the finished processes, used in place of the finished queue in compact layouts'''
+        font = get_font(40)
+        return font.render(f'Finished Processes: {len(self.finished_processes)}', True, 'Black')
+
+    def pygame_state_signature(self) -> tuple:
+        '''Everything drawn by the compact layout. Frames with equal signatures look the same, so can share one drawing.'''
+        return (tuple(tuple(process.pygame_process_surface for process in queue) for queue in self.ready_queue.values()),
+                tuple(process.pygame_process_surface for process in self.running_process),
+                tuple(process.pygame_process_surface for process in self.blocked_processes),
+                len(self.finished_processes), repr(self.memory_available),
+                tuple(job.pygame_process_surface for job in self.real_time_scheduler.ready_jobs) if self.real_time_scheduler is not None else ())
+
+    def pygame_create_graphics(self, screen: pygame.Surface, compact: bool = False) -> None:
+        '''Add all the components of the graphcis to the screen surface. The `compact` layout replaces the finished queue with a count, so it fits in a smaller pane.'''
         # Add ready queue
         y_pos = 5
         x_pos = 5
@@ -425,66 +842,166 @@ class OperatingSystem:
         ) - blocked_processes_surface.get_height()) / 2
         screen.blit(blocked_processes_surface,
                     (x_pos, y_pos + centring_adjustment))
-        # Add finished_processess
+        # Add finished_processess
         x_pos = 5
         y_pos += cpu_surface.get_height() + 8
-        finished_processes_surface = self.pygame_create_process_queue_surface(
-            self.finished_processes, 'Finished Processes')
+        if compact:
+            finished_processes_surface = self.pygame_create_finished_summary_surface()
+        else:
+            finished_processes_surface = self.pygame_create_process_queue_surface(
+                self.finished_processes, 'Finished Processes')
         screen.blit(finished_processes_surface, (x_pos, y_pos))
         y_pos += finished_processes_surface.get_height() + 8
 
-    async def run(self):
-        '''The run cycle of the os process management'''
-        screen = pygame.display.set_mode((1440, 850))
-        clock = pygame.time.Clock()
-        pygame.display.set_caption('Process Scheduler Simulator')
-        # Manual exit of the loop via x on graphics
+    def tick(self) -> None:
+        '''Runs one cycle of the os process management'''
+        if self.time_started is None:
+            self.time_started = self.clock.now()
+        # Checks to see if any processes need to be moved
+        self.check_arrivals()
+        self.update_process_groups()
+        self.check_real_time_releases()
+        self.account_energy()
+        self.check_running_process()
+        self.govern_frequencies()
+        self.check_priority_inversion()
+        self.check_devices()
+        self.update_memory_manager()
+        self.check_blocked_processes()
+        self.check_processes_started_waiting()
+
+    async def run(self, headless: bool = False, frame_recorder: FrameRecorder = None, state_stream: StateStreamServer = None):
+        '''The run cycle of the os process management. When `headless`, no window is opened, and graphics are only drawn for the `frame_recorder`. Changes in state are sent to clients of the `state_stream` each cycle.'''
+        if state_stream is not None:
+            await state_stream.start()
+        if headless:
+            # The caller sets `SDL_VIDEODRIVER` to dummy before `pygame.init()` so no display is needed
+            pygame.font.init()
+        else:
+            screen = pygame.display.set_mode(OperatingSystem.SCREEN_SIZE)
+            frame_clock = pygame.time.Clock()
+            pygame.display.set_caption('Process Scheduler Simulator')
+        # Manual exit of the loop via x on graphics
         running = True
         # Loops until there are no unfinished processes left
         while self.unfinished_processes and running:
-            # Reset screen
-            screen.fill('white')
+            if not headless:
+                # Reset screen
+                screen.fill('white')
+
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
+            self.tick()
 
-            # Checks to see if any processes need to be moved
-            self.check_running_process()
-            self.check_blocked_processes()
+            if frame_recorder is not None:
+                frame_recorder.capture(self, self.clock.now())
+            if state_stream is not None:
+                state_stream.publish(self)
 
-            # Generate grpahics
-            self.pygame_create_graphics(screen)
+            if not headless:
+                # Generate grpahics
+                self.pygame_create_graphics(screen)
 
-            # Render pygame stuff
-            pygame.display.update()
-            clock.tick(60)  # Limits fps to 5
+                # Render pygame stuff
+                pygame.display.update()
+                frame_clock.tick(60)  # Limits fps to 5
 
             # Wait
-            await asyncio.sleep(0.1)
+            await self.clock.tick()
+        if frame_recorder is not None:
+            frame_recorder.close()
+        if state_stream is not None:
+            state_stream.publish(self)
+            await state_stream.close()
         print('All processes complete!')
         for process in self.finished_processes:
             process: Process
-            print(
-                f'{process}: {process.cpu_time_recieved}/{process.time_to_complete}')
+            if self.CPU.cores:
+                # Energy-delay product, with the time from arrival to finishing as the delay
+                delay = (process.time_finished -
+                         process.time_arrived).total_seconds()
+                print(
+                    f'{process}: {process.cpu_time_recieved}/{process.time_to_complete}, energy {process.energy_joules:.3f}J, EDP {process.energy_joules * delay:.3f}Js')
+            else:
+                print(
+                    f'{process}: {process.cpu_time_recieved}/{process.time_to_complete}')
+        print(self.cpu_efficiency_report())
+        if self.CPU.cores:
+            print(self.energy_report())
+        for device in self.devices:
+            device: Device
+            print(device.report())
+        if self.memory_manager is not None:
+            print(self.memory_manager.report())
+        if self.real_time_scheduler is not None:
+            print(self.real_time_scheduler.report())
+        if self.synchronisation_primitives or self.deadlocks:
+            print(self.synchronisation_report())
+        if self.root_group is not None and self.time_started is not None:
+            print(self.root_group.report(
+                self.clock.now() - self.time_started))
 
         # Destroy the pygame window
-        pygame.quit()
+        quit_pygame()
+
+    def state_snapshot(self) -> dict:
+        '''The state of the queues, running process, memory and metrics in a form that can be sent as JSON. `running` is `None` when no process is running, and `real_time` and `groups` are `None` when the os has no real time scheduler or groups.'''
+        return {
+            'time': self.clock.now().isoformat(),
+            'new': [process.identifier for process in self.new_process_queue],
+            'ready': {priority: [process.identifier for process in queue] for priority, queue in self.ready_queue.items()},
+            'running': self.running_process[0].identifier if self.running_process else None,
+            'blocked': [process.identifier for process in self.blocked_processes],
+            'finished': [process.identifier for process in self.finished_processes],
+            'progress': {process.identifier: round(process.cpu_time_recieved / process.time_to_complete, 3) for process in self.running_process},
+            'memory_available': repr(self.memory_available),
+            'real_time': {'ready': [job.identifier for job in self.real_time_scheduler.ready_jobs], 'deadline_misses': self.real_time_scheduler.deadline_misses()} if self.real_time_scheduler is not None else None,
+            'locks': {primitive.name: {'holders': [process.identifier for process in primitive.holders], 'waiting': [process.identifier for process in primitive.wait_queue]} for primitive in self.synchronisation_primitives},
+            'groups': {group.name: {'cpu_seconds': group.cpu_time_used.total_seconds(), 'throttled': group.throttled, 'memory_used_mb': round(group.memory_used_mb, 1)} for group in self.root_group.all_groups()} if self.root_group is not None else None,
+            'cores': {core.name: {'frequency_mhz': core.frequency_mhz, 'energy_joules': round(core.energy_joules, 3)} for core in self.CPU.cores},
+            'devices': {device.name: {'queued': len(device.queue), 'utilisation': round(device.utilisation, 3)} for device in self.devices},
+            'metrics': {
+                'context_switches': self.context_switches,
+                'useful_cpu_seconds': self.useful_cpu_time.total_seconds(),
+                'overhead_seconds': self.overhead_time.total_seconds()
+            }
+        }
+
+    def cpu_efficiency_report(self) -> str:
+        '''A summary of useful cpu time against context switch and cache warm up overhead'''
+        busy_time = self.useful_cpu_time + self.overhead_time
+        efficiency = 1
+        if busy_time:
+            efficiency = self.useful_cpu_time / busy_time
+        return f'CPU: {self.context_switches} context switches, useful time {self.useful_cpu_time}, overhead {self.overhead_time}, efficiency {efficiency:.1%}'
 
     def process_priority_lower_than_queued_processes(self, process: Process):
+        if process.priority == ProcessPriority.REAL_TIME:
+            return self.real_time_scheduler.should_preempt(process)
+        if self.real_time_scheduler is not None and self.real_time_scheduler.number_ready_jobs:
+            # Real time jobs preempt every other priority
+            return True
         if process.priority == ProcessPriority.HIGH:
             return False
         elif process.priority == ProcessPriority.IO:
-            if self.ready_queue_HIGH_priority:
+            if self.has_runnable_process(ProcessPriority.HIGH):
                 return True
             else:
                 return False
         elif process.priority == ProcessPriority.LOW:
-            if self.ready_queue_IO_priority or self.ready_queue_HIGH_priority:
+            if self.has_runnable_process(ProcessPriority.IO) or self.has_runnable_process(ProcessPriority.HIGH):
                 return True
             else:
                 return False
 
+    def has_runnable_process(self, priority: ProcessPriority) -> bool:
+        '''True if the ready queue of the priority has a process that could run now. With groups, processes whose groups are throttled cannot.'''
+        if self.root_group is not None:
+            return self.root_group.select(priority.name, peek=True) is not None
+        return bool(self.ready_queue[priority.name])
+
     @property
     def unfinished_processes(self) -> bool:
         '''True if there are unfinished processes, else is false. Unfinished processes are processes that are not in the `self.finished_processes` collection'''
@@ -497,8 +1014,19 @@ class OperatingSystem:
             return True
         if self.blocked_processes:
             return True
+        if self.scheduled_arrivals:
+            return True
+        if self.real_time_scheduler is not None and (self.real_time_scheduler.releases_pending or self.real_time_scheduler.number_ready_jobs):
+            return True
         return False
 
+    @property
+    def memory_available(self) -> Memory:
+        '''The free physical memory, taken from the memory manager when paging'''
+        if self.memory_manager is not None:
+            return self.memory_manager.memory_available
+        return self.CPU.memory_available
+
     @property
     def number_ready_processes(self) -> int:
         number_of_ready_processes = 0
@@ -508,6 +1036,8 @@ class OperatingSystem:
             self.ready_queue_IO_priority)
         number_of_ready_processes += len(
             self.ready_queue_LOW_priority)
+        if self.real_time_scheduler is not None:
+            number_of_ready_processes += self.real_time_scheduler.number_ready_jobs
         return number_of_ready_processes
 
     @property
@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+# A patch is a JSON merge patch (RFC 7386), apart from two operations written as a single key object, so that `None` can be sent as a value and lists that only grow are not resent whole:
+# a key set to {'$delete': True} was removed, and a list set to {'$append': [...]} has had those items added to its end
+DELETE = '$delete'
+APPEND = '$append'
+
+
+def diff_states(old_state: dict, new_state: dict) -> dict:
+    '''Creates a patch that turns `old_state` into `new_state`. Lists that have only had items added to their end are sent as the items added, and other changed lists are replaced whole.'''
+    patch = {}
+    for key, new_value in new_state.items():
+        old_value = old_state.get(key)
+        if isinstance(new_value, dict) and isinstance(old_value, dict):
+            nested_patch = diff_states(old_value, new_value)
+            if nested_patch:
+                patch[key] = nested_patch
+        elif key not in old_state or old_value != new_value:
+            if isinstance(new_value, list) and isinstance(old_value, list) and len(new_value) > len(old_value) and new_value[:len(old_value)] == old_value:
+                patch[key] = {APPEND: new_value[len(old_value):]}
+            else:
+                patch[key] = new_value
+    for key in old_state:
+        if key not in new_state:
+            patch[key] = {DELETE: True}
+    return patch
+
+
+def apply_patch(state: dict, patch: dict) -> dict:
+    '''Applies a patch made by `diff_states` to `state` in place, and returns it'''
+    for key, value in patch.items():
+        if value == {DELETE: True}:
+            state.pop(key, None)
+        elif isinstance(value, dict) and len(value) == 1 and isinstance(value.get(APPEND), list) and isinstance(state.get(key), list):
+            state[key].extend(value[APPEND])
+        elif isinstance(value, dict):
+            if not isinstance(state.get(key), dict):
+                state[key] = {}
+            apply_patch(state[key], value)
+        else:
+            state[key] = value
+    return state
+
+
+class StateSubscriber:
+    '''A connected client. Only remembers the last state it was sent, so a slow client skips the states it missed and is sent a single patch to catch up, rather than a queue of updates building up.'''
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.update_ready = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self.sent_state: dict = {}
+        self.sent_version = 0
+        self.updates_merged = 0
+
+
+class StateStreamServer:
+    '''Streams the state of an os to clients over TCP as line delimited JSON. Clients get a full snapshot when they connect, then only the changes between cycles as patches made by `diff_states`.'''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765):
+        self.__host = host
+        self.__port = port
+        self.__server: asyncio.Server = None
+        self.__state: dict = {}
+        # Increases each time the state changes. The patch from the previous version is kept so up to date clients share it.
+        self.__state_version = 0
+        self.__latest_patch: dict = {}
+        self.__subscribers: list[StateSubscriber] = []
+        self.__closing = False
+        # The os last published, so its state can be recorded when a client connects
+        self.__operating_system = None
+
+    @property
+    def subscribers(self) -> list[StateSubscriber]:
+        return self.__subscribers
+
+    async def start(self) -> None:
+        self.__server = await asyncio.start_server(self.handle_subscriber, self.__host, self.__port)
+
+    async def close(self, timeout: float = 1) -> None:
+        '''Gives clients up to `timeout` seconds to recieve their pending updates, then disconnects them'''
+        self.__closing = True
+        subscribers = list(self.__subscribers)
+        for subscriber in subscribers:
+            subscriber.update_ready.set()
+        if subscribers:
+            await asyncio.wait([asyncio.create_task(subscriber.disconnected.wait()) for subscriber in subscribers], timeout=timeout)
+        for subscriber in subscribers:
+            subscriber.writer.close()
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+
+    def publish(self, operating_system) -> None:
+        '''Records the os state and lets each client know there is an update. Never waits on a client. Without clients, the state is not recorded until one connects.'''
+        self.__operating_system = operating_system
+        if self.__subscribers:
+            self.record_state()
+
+    def record_state(self) -> None:
+        new_state = self.__operating_system.state_snapshot()
+        patch = diff_states(self.__state, new_state)
+        if not patch:
+            return
+        self.__state = new_state
+        self.__state_version += 1
+        self.__latest_patch = patch
+        for subscriber in self.__subscribers:
+            subscriber.update_ready.set()
+
+    def patch_for(self, subscriber: StateSubscriber) -> dict:
+        '''The patch that brings the subscriber up to the current state'''
+        if subscriber.sent_version == self.__state_version - 1:
+            return self.__latest_patch
+        # Client fell behind, so merge the updates it missed into one
+        subscriber.updates_merged += self.__state_version - \
+            subscriber.sent_version - 1
+        return diff_states(subscriber.sent_state, self.__state)
+
+    async def handle_subscriber(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''Sends a snapshot to the new client, then sends a patch whenever the client is ready and the state has changed'''
+        subscriber = StateSubscriber(writer)
+        self.__subscribers.append(subscriber)
+        if self.__operating_system is not None:
+            # Nothing was recorded while there were no clients
+            self.record_state()
+        try:
+            subscriber.sent_state = self.__state
+            subscriber.sent_version = self.__state_version
+            writer.write((json.dumps({'type': 'snapshot', 'state': self.__state}) + '\n').encode())
+            await writer.drain()
+            while not writer.is_closing():
+                if subscriber.sent_version == self.__state_version:
+                    if self.__closing:
+                        break
+                    await subscriber.update_ready.wait()
+                    subscriber.update_ready.clear()
+                    continue
+                patch = self.patch_for(subscriber)
+                subscriber.sent_state = self.__state
+                subscriber.sent_version = self.__state_version
+                writer.write((json.dumps({'type': 'diff', 'patch': patch}) + '\n').encode())
+                await writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass
+        finally:
+            self.__subscribers.remove(subscriber)
+            writer.close()
+            subscriber.disconnected.set()
+
+
+async def watch(host: str = '127.0.0.1', port: int = 8765) -> dict:
+    '''A small terminal client. Rebuilds the os state from the stream and prints a summary line for each update. Returns the final state.'''
+    reader, writer = await asyncio.open_connection(host, port)
+    state = {}
+    while line := await reader.readline():
+        message = json.loads(line)
+        if message['type'] == 'snapshot':
+            state = message['state']
+        else:
+            apply_patch(state, message['patch'])
+        if not state:
+            continue
+        ready_queue = ' '.join(
+            f'{priority}:{len(processes)}' for priority, processes in state['ready'].items())
+        print(
+            f"{state['time']}  running: {state.get('running')}  ready: {ready_queue}  blocked: {len(state['blocked'])}  finished: {len(state['finished'])}  memory: {state['memory_available']}")
+    writer.close()
+    return state
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Watches the state of a running simulation')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    arguments = parser.parse_args()
+    asyncio.run(watch(arguments.host, arguments.port))
@@ -0,0 +1,308 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Union
+from enums import ProcessPriority, PreemptReason, WaitQueueOrder, LockProtocol
+from process import Process
+
+
+class SynchronisationPrimitive(ABC):
+    '''The wait queue and contention accounting shared by mutexes, semaphores and conditions. Processes use a primitive at points in their cpu timeline, through `PreemptReason.ACQUIRE` and `PreemptReason.RELEASE` preemptions whose blocked functions carry out the operation.'''
+
+    def __init__(self, name: str, wait_queue_order: WaitQueueOrder = WaitQueueOrder.FIFO):
+        self.__name = name
+        self.__wait_queue_order = wait_queue_order
+        self.wait_queue: list[Process] = []
+        # The processes currently holding the primitive (at most one for a mutex)
+        self.holders: list[Process] = []
+        # Contention accounting
+        self.attempts = 0
+        self.acquisitions = 0
+        self.contended_acquisitions = 0
+        self.total_wait_time = timedelta(seconds=0)
+        self.max_wait_time = timedelta(seconds=0)
+        self.total_hold_time = timedelta(seconds=0)
+        self.max_wait_queue_length = 0
+        self.__time_waiting_started: dict[Process, datetime] = {}
+        # The times each holder was granted each unit it holds, earliest first
+        self.__time_acquired: dict[Process, list[datetime]] = {}
+
+    def __repr__(self) -> str:
+        return self.__name
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def wait_queue_order(self) -> WaitQueueOrder:
+        return self.__wait_queue_order
+
+    @abstractmethod
+    def available(self) -> bool:
+        '''True if a process could acquire the primitive without waiting'''
+
+    def acquire_function(self, process: Process) -> callable:
+        '''Returns a blocked function for a `PreemptReason.ACQUIRE` preemption. Acquires the primitive, or joins the wait queue and keeps the process blocked until it is granted.'''
+        def acquire():
+            self.attempts += 1
+            if self.available():
+                self.grant(process)
+                yield False
+                return
+            self.enqueue(process)
+            while process not in self.holders:
+                yield True
+            yield False
+        return acquire
+
+    def release_function(self, process: Process) -> callable:
+        '''Returns a blocked function for a `PreemptReason.RELEASE` preemption, that releases the primitive'''
+        def release():
+            self.release(process)
+            yield False
+        return release
+
+    def enqueue(self, process: Process) -> None:
+        self.wait_queue.append(process)
+        process.waiting_on = self
+        self.__time_waiting_started[process] = process.clock.now()
+        self.contended_acquisitions += 1
+        self.max_wait_queue_length = max(
+            self.max_wait_queue_length, len(self.wait_queue))
+
+    def dequeue(self, index: int) -> Process:
+        '''Removes the process from the wait queue, recording how long it waited'''
+        process = self.wait_queue.pop(index)
+        process.waiting_on = None
+        wait_time = process.clock.now() - self.__time_waiting_started.pop(process)
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        return process
+
+    def index_of_next_waiter(self) -> int:
+        '''The first process in the wait queue, or the one with the highest priority (first come first served between equals)'''
+        if self.__wait_queue_order == WaitQueueOrder.PRIORITY:
+            return min(range(len(self.wait_queue)), key=lambda index: self.wait_queue[index].priority.value)
+        return 0
+
+    def grant(self, process: Process) -> None:
+        self.holders.append(process)
+        process.held_primitives.append(self)
+        self.__time_acquired.setdefault(process, []).append(process.clock.now())
+        self.acquisitions += 1
+
+    def release(self, process: Process) -> None:
+        '''Releases the primitive held by the process, and grants it to waiting processes while it is available'''
+        if process in self.holders:
+            self.holders.remove(process)
+            process.held_primitives.remove(self)
+            times_acquired = self.__time_acquired[process]
+            self.total_hold_time += process.clock.now() - times_acquired.pop(0)
+            if not times_acquired:
+                del self.__time_acquired[process]
+        self.wake_waiters()
+
+    def wake_waiters(self) -> None:
+        while self.wait_queue and self.available():
+            self.grant(self.dequeue(self.index_of_next_waiter()))
+
+    def abandon(self, process: Process) -> None:
+        '''Removes a process being terminated from the wait queue, and releases every unit of the primitive it holds'''
+        if process in self.wait_queue:
+            self.dequeue(self.wait_queue.index(process))
+        while process in self.holders:
+            self.release(process)
+
+    @property
+    def contention_ratio(self) -> float:
+        '''The fraction of attempts to acquire (or wait) that had to wait'''
+        if not self.attempts:
+            return 0
+        return self.contended_acquisitions / self.attempts
+
+    def report(self) -> str:
+        '''A summary of lock contention'''
+        mean_wait_time = self.total_wait_time / \
+            self.contended_acquisitions if self.contended_acquisitions else timedelta(seconds=0)
+        return f'{self} ({type(self).__name__}, {self.__wait_queue_order.name}): {self.attempts} attempts, {self.acquisitions} acquired, {self.contention_ratio:.1%} contended, mean wait {mean_wait_time}, max wait {self.max_wait_time}, total hold {self.total_hold_time}, max queue {self.max_wait_queue_length}'
+
+
+class Mutex(SynchronisationPrimitive):
+    '''A lock held by one process at a time.
+    With priority inheritance, the holder runs at the highest priority of the processes waiting for it (passed along chains of mutexes). With a priority ceiling, the holder runs at `ceiling` while it holds the mutex.
+    Only real time jobs run at `ProcessPriority.REAL_TIME`, so other processes are raised to at most `ProcessPriority.HIGH`.'''
+
+    def __init__(self, name: str, wait_queue_order: WaitQueueOrder = WaitQueueOrder.FIFO, protocol: LockProtocol = LockProtocol.NONE, ceiling: ProcessPriority = ProcessPriority.HIGH):
+        super().__init__(name, wait_queue_order)
+        self.__protocol = protocol
+        self.__ceiling = ceiling
+
+    @property
+    def protocol(self) -> LockProtocol:
+        return self.__protocol
+
+    @property
+    def owner(self) -> Union[Process, None]:
+        return self.holders[0] if self.holders else None
+
+    def available(self) -> bool:
+        return not self.holders
+
+    def boost(self, process: Process, priority: ProcessPriority) -> None:
+        if priority == ProcessPriority.REAL_TIME and process.base_priority != ProcessPriority.REAL_TIME:
+            priority = ProcessPriority.HIGH
+        process.priority_boosts[self] = priority
+
+    def grant(self, process: Process) -> None:
+        super().grant(process)
+        if self.__protocol == LockProtocol.PRIORITY_CEILING:
+            self.boost(process, self.__ceiling)
+        self.update_inheritance()
+
+    def release(self, process: Process) -> None:
+        if process not in self.holders:
+            raise ValueError(f'{process} released {self} without holding it')
+        process.priority_boosts.pop(self, None)
+        super().release(process)
+
+    def enqueue(self, process: Process) -> None:
+        super().enqueue(process)
+        self.update_inheritance()
+
+    def abandon(self, process: Process) -> None:
+        process.priority_boosts.pop(self, None)
+        super().abandon(process)
+        self.update_inheritance()
+
+    def update_inheritance(self, mutexes_updated: set = None) -> None:
+        '''Raises the owner to the highest priority of its waiters, and passes the raise on to the mutex the owner is waiting on. `mutexes_updated` stops deadlocked chains looping forever.'''
+        if self.__protocol != LockProtocol.PRIORITY_INHERITANCE or self.owner is None:
+            return
+        if mutexes_updated is None:
+            mutexes_updated = set()
+        if self in mutexes_updated:
+            return
+        mutexes_updated.add(self)
+        owner = self.owner
+        if self.wait_queue:
+            self.boost(owner, min([waiter.priority for waiter in self.wait_queue],
+                       key=lambda priority: priority.value))
+        else:
+            owner.priority_boosts.pop(self, None)
+        if isinstance(owner.waiting_on, Mutex):
+            owner.waiting_on.update_inheritance(mutexes_updated)
+
+
+class Semaphore(SynchronisationPrimitive):
+    '''A counting semaphore. Any process may release it, including ones that never acquired it.'''
+
+    def __init__(self, name: str, count: int, wait_queue_order: WaitQueueOrder = WaitQueueOrder.FIFO):
+        super().__init__(name, wait_queue_order)
+        self.__count = count
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    def available(self) -> bool:
+        return self.__count > 0
+
+    def grant(self, process: Process) -> None:
+        self.__count -= 1
+        super().grant(process)
+
+    def release(self, process: Process) -> None:
+        self.__count += 1
+        super().release(process)
+
+
+class Condition(SynchronisationPrimitive):
+    '''A condition variable used with `mutex`. Waiting releases the mutex until the process is signalled, then reacquires it before the process runs again. Signals with no waiters are lost.'''
+
+    def __init__(self, name: str, mutex: Mutex, wait_queue_order: WaitQueueOrder = WaitQueueOrder.FIFO):
+        super().__init__(name, wait_queue_order)
+        self.__mutex = mutex
+        self.signals = 0
+        self.lost_signals = 0
+
+    @property
+    def mutex(self) -> Mutex:
+        return self.__mutex
+
+    def available(self) -> bool:
+        return False
+
+    def acquire_function(self, process: Process) -> callable:
+        '''Returns a blocked function for a `PreemptReason.ACQUIRE` preemption that waits on the condition'''
+        def wait():
+            self.attempts += 1
+            self.__mutex.release(process)
+            self.enqueue(process)
+            while process in self.wait_queue:
+                yield True
+            # The mutex is reacquired through an acquire preemption, so the os checks the wait for deadlock like any other
+            process.add_preemption(PreemptReason.ACQUIRE, timedelta(
+                seconds=0), self.__mutex.acquire_function(process))
+            yield False
+        return wait
+
+    def release_function(self, process: Process, broadcast: bool = False) -> callable:
+        '''Returns a blocked function for a `PreemptReason.RELEASE` preemption that signals one waiting process, or all of them if `broadcast`'''
+        def signal():
+            self.signal(broadcast)
+            yield False
+        return signal
+
+    def signal(self, broadcast: bool = False) -> None:
+        self.signals += 1
+        if not self.wait_queue:
+            self.lost_signals += 1
+        while self.wait_queue:
+            self.dequeue(self.index_of_next_waiter())
+            if not broadcast:
+                break
+
+    def report(self) -> str:
+        return f'{super().report()}, {self.signals} signals ({self.lost_signals} lost)'
+
+
+def add_critical_section(process: Process, primitive: SynchronisationPrimitive, start: timedelta, duration: timedelta) -> None:
+    '''Makes the process acquire the primitive after `start` of cpu time, and release it `duration` later. Critical sections must be added in the order they start.'''
+    process.add_preemption(PreemptReason.ACQUIRE, start,
+                           primitive.acquire_function(process))
+    process.add_preemption(PreemptReason.RELEASE, start + duration,
+                           primitive.release_function(process))
+
+
+def add_condition_wait(process: Process, condition: Condition, time_till_wait: timedelta) -> None:
+    '''Makes the process wait on the condition after `time_till_wait` of cpu time. It must hold the condition's mutex at that point.'''
+    process.add_preemption(PreemptReason.ACQUIRE, time_till_wait,
+                           condition.acquire_function(process))
+
+
+def add_condition_signal(process: Process, condition: Condition, time_till_signal: timedelta, broadcast: bool = False) -> None:
+    '''Makes the process signal the condition after `time_till_signal` of cpu time'''
+    process.add_preemption(PreemptReason.RELEASE, time_till_signal,
+                           condition.release_function(process, broadcast))
+
+
+def find_wait_for_cycle(process: Process) -> Union[list[Process], None]:
+    '''Searches the wait-for graph (waiting process to the holders of the primitive it waits on) from the process. Returns the processes in a cycle through the process, or `None` if there is no deadlock.'''
+    path: list[Process] = [process]
+    # Depth first search, with a stack of iterators over each process' holders
+    stack = [iter(process.waiting_on.holders if process.waiting_on is not None else [])]
+    visited = {process}
+    while stack:
+        holder = next(stack[-1], None)
+        if holder is None:
+            stack.pop()
+            path.pop()
+            continue
+        if holder is process:
+            return list(path)
+        if holder in visited:
+            continue
+        visited.add(holder)
+        path.append(holder)
+        stack.append(iter(holder.waiting_on.holders if holder.waiting_on is not None else []))
+    return None
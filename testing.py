@@ -1,24 +1,35 @@
 from simulation import CentralProcessingUnit, OperatingSystem, pygame
+from clock import SimulatedClock
+from recording import FrameRecorder
+from state_stream import StateStreamServer
 from datetime import timedelta
 from memory import Memory, MemoryUnits
-from enums import ProcessPriority, PreemptReason
-from random import random, randint
+from enums import ProcessPriority, PreemptReason, DeviceType, DeviceSchedulingDiscipline
+from devices import Device, uniform_service_time, exponential_service_time
+from random import random, randint, choice
+from contextlib import suppress
 import asyncio
+import argparse
+from os import environ
 from process import Process
 
 
-def create_process(time_to_complete: timedelta, memory_required: Memory, priority: ProcessPriority) -> Process:
+def create_process(time_to_complete: timedelta, memory_required: Memory, priority: ProcessPriority, devices: list[Device] = None) -> Process:
     new_process = Process(time_to_complete, memory_required, priority)
     # Decide whether process should have blocked preemption or not
     blocked_probability = 0.6 if priority == ProcessPriority.IO else 0.1
     random_number = 1 - random()
     if blocked_probability > random_number:
-        turns_blocked = randint(3, 7)
+        if devices:
+            # Process is blocked until a device services its request
+            blocked_func = choice(devices).blocked_function(new_process)
+        else:
+            turns_blocked = randint(3, 7)
 
-        def blocked_func():
-            for i in range(turns_blocked):
-                yield True
-            yield False
+            def blocked_func():
+                for i in range(turns_blocked):
+                    yield True
+                yield False
 
         time_to_blocked = random() * time_to_complete
 
@@ -28,72 +39,102 @@ def create_process(time_to_complete: timedelta, memory_required: Memory, priorit
 
 
 async def add_process_later(os):
-    await asyncio.sleep(17)
+    await os.clock.sleep(timedelta(seconds=17))
+    devices = os.devices
     processes = [create_process(timedelta(seconds=1), Memory(
-        200, MemoryUnits.MB), ProcessPriority.HIGH)]
+        200, MemoryUnits.MB), ProcessPriority.HIGH, devices)]
     processes.append(create_process(timedelta(seconds=1),
-                     Memory(2, MemoryUnits.MB), ProcessPriority.HIGH))
+                     Memory(2, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=1),
-                     Memory(2, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(2, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=1), Memory(
-        7.8, MemoryUnits.MB), ProcessPriority.HIGH))
+        7.8, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=2),
-                     Memory(10, MemoryUnits.MB), ProcessPriority.HIGH))
+                     Memory(10, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=1),
-                     Memory(200, MemoryUnits.MB), ProcessPriority.LOW))
+                     Memory(200, MemoryUnits.MB), ProcessPriority.LOW, devices))
     processes.append(create_process(timedelta(seconds=1.2),
-                     Memory(15, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(15, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=3),
-                     Memory(6, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(6, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=2),
-                     Memory(8, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(8, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=1),
-                     Memory(78, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(78, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=2),
-                     Memory(200, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(200, MemoryUnits.MB), ProcessPriority.IO, devices))
     os.add_new_processes(*processes)
     os.admit_processes()
     print('Extra processes added')
 
 
-async def main():
+async def main(headless: bool = False, record_directory: str = None, stream_port: int = None):
+    if headless:
+        # Lets pygame run without a display. Must be set before pygame is initialised.
+        environ.setdefault('SDL_VIDEODRIVER', 'dummy')
     pygame.init()
 
     # Create a CPU with a certain memory size (mb) and the operating system (that uses the cpu)
     cpu = CentralProcessingUnit(4000)
-    os = OperatingSystem(cpu)
+    # Headless runs use simulated time so they do not have to wait
+    os = OperatingSystem(cpu, clock=SimulatedClock() if headless else None)
+
+    # Create the I/O devices that blocked processes wait on
+    devices = [Device('Disk1', DeviceType.DISK, uniform_service_time(timedelta(seconds=0.2), timedelta(seconds=0.8)), discipline=DeviceSchedulingDiscipline.ELEVATOR),
+               Device('NIC1', DeviceType.NIC, exponential_service_time(timedelta(seconds=0.3)), queue_depth=4)]
+    os.add_devices(*devices)
 
     # Create processes - time to complete, memory taken, priority
     processes = [create_process(timedelta(seconds=1), Memory(
-        200, MemoryUnits.MB), ProcessPriority.LOW)]
+        200, MemoryUnits.MB), ProcessPriority.LOW, devices)]
     processes.append(create_process(timedelta(seconds=1),
-                     Memory(2, MemoryUnits.MB), ProcessPriority.LOW))
+                     Memory(2, MemoryUnits.MB), ProcessPriority.LOW, devices))
     processes.append(create_process(timedelta(seconds=4),
-                     Memory(2, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(2, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=1.7),
-                     Memory(7.8, MemoryUnits.MB), ProcessPriority.HIGH))
+                     Memory(7.8, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=3),
-                     Memory(10, MemoryUnits.MB), ProcessPriority.HIGH))
+                     Memory(10, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=2), Memory(
-        200, MemoryUnits.MB), ProcessPriority.HIGH))
+        200, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=2),
-                     Memory(15, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(15, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=4),
-                     Memory(6, MemoryUnits.MB), ProcessPriority.LOW))
+                     Memory(6, MemoryUnits.MB), ProcessPriority.LOW, devices))
     processes.append(create_process(timedelta(seconds=3),
-                     Memory(8, MemoryUnits.MB), ProcessPriority.HIGH))
+                     Memory(8, MemoryUnits.MB), ProcessPriority.HIGH, devices))
     processes.append(create_process(timedelta(seconds=2),
-                     Memory(78, MemoryUnits.MB), ProcessPriority.IO))
+                     Memory(78, MemoryUnits.MB), ProcessPriority.IO, devices))
     processes.append(create_process(timedelta(seconds=1),
-                     Memory(200, MemoryUnits.MB), ProcessPriority.LOW))
+                     Memory(200, MemoryUnits.MB), ProcessPriority.LOW, devices))
 
     os.add_new_processes(*processes)
 
-    task1 = asyncio.create_task(os.run())
+    frame_recorder = None
+    if record_directory is not None:
+        frame_recorder = FrameRecorder(record_directory, animated=True)
+
+    state_stream = None
+    if stream_port is not None:
+        state_stream = StateStreamServer(port=stream_port)
+
+    task1 = asyncio.create_task(os.run(headless, frame_recorder, state_stream))
     task2 = asyncio.create_task(add_process_later(os))
 
     await task1
-    await task2
+    # The os stops once it has no unfinished processes. Under a simulated clock time then stops too, so a pending sleep would never end.
+    task2.cancel()
+    with suppress(asyncio.CancelledError):
+        await task2
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(
+        description='Simulates how the OS process scheduler works')
+    parser.add_argument('--headless', action='store_true',
+                        help='run in simulated time without opening a window')
+    parser.add_argument('--record', metavar='DIRECTORY',
+                        help='save frames of the simulation to DIRECTORY')
+    parser.add_argument('--stream', metavar='PORT', type=int,
+                        help='stream changes in state as line delimited JSON on PORT')
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.headless, arguments.record, arguments.stream))
@@ -0,0 +1,218 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import timedelta
+from itertools import product, repeat
+from math import ceil
+from typing import TypedDict, Union
+from enums import ProcessPriority, PageReplacementPolicy
+from clock import SimulatedClock
+from paging import PagedMemoryManager
+from simulation import CentralProcessingUnit, OperatingSystem
+from workload import ProcessSpecification, generate_workload, schedule_workload
+import argparse
+import os
+
+
+class TunerConfiguration(TypedDict):
+    round_robin_timing: timedelta
+    memory_mb: int
+    # `None` runs without paging, so processes are only admitted if they fit in memory
+    page_replacement_policy: Union[PageReplacementPolicy, None]
+
+
+class HardwareCosts(TypedDict):
+    '''Costs set by the cpu rather than the scheduler, so they are given to the tuner rather than searched'''
+    context_switch_cost: timedelta
+    cache_warmup_penalty: timedelta
+
+
+class SimulationResult(TypedDict):
+    configuration: TunerConfiguration
+    horizon: timedelta
+    processes_finished: int
+    # Processes finished per second of simulated time
+    throughput: float
+    # 99th percentile time from arrival until first run, for each priority
+    p99_response_times: dict[ProcessPriority, timedelta]
+    # Time spent in the new process and ready queues by finished processes, for each priority
+    mean_waiting_times: dict[ProcessPriority, timedelta]
+    p99_waiting_times: dict[ProcessPriority, timedelta]
+    mean_turnaround_time: timedelta
+
+
+class TuningResult(TypedDict):
+    best: SimulationResult
+    # The results of the first round, when every configuration is simulated for the same time, that are not beaten on both throughput and the objective, by throughput
+    trade_off_curve: list[SimulationResult]
+    # Every simulation run, including those stopped early
+    history: list[SimulationResult]
+
+
+DEFAULT_SEARCH_SPACE = {
+    'round_robin_timing': [timedelta(seconds=seconds) for seconds in (0.05, 0.1, 0.25, 0.5, 1)],
+    'memory_mb': [500, 1000, 4000],
+    'page_replacement_policy': [None, PageReplacementPolicy.CLOCK]
+}
+
+DEFAULT_HARDWARE_COSTS: HardwareCosts = {
+    'context_switch_cost': timedelta(milliseconds=5),
+    'cache_warmup_penalty': timedelta(milliseconds=10)
+}
+
+
+# How far simulated time moves each cycle of the os. Estimates of a configuration must use the same step, as cpu bursts are rounded up to it.
+SIMULATION_STEP = timedelta(seconds=0.05)
+
+
+def percentile(values: list, fraction: float):
+    '''Nearest rank percentile of `values`, or `None` if there are no values'''
+    if not values:
+        return None
+    ordered_values = sorted(values)
+    return ordered_values[max(0, ceil(fraction * len(ordered_values)) - 1)]
+
+
+def simulate(configuration: TunerConfiguration, workload: list[ProcessSpecification], horizon: timedelta, step: timedelta = SIMULATION_STEP, hardware_costs: HardwareCosts = DEFAULT_HARDWARE_COSTS) -> SimulationResult:
+    '''Runs a headless simulation of the workload in simulated time until every process finishes or `horizon` is reached'''
+    clock = SimulatedClock(step)
+    memory_manager = None
+    if configuration['page_replacement_policy'] is not None:
+        memory_manager = PagedMemoryManager(
+            configuration['memory_mb'], policy=configuration['page_replacement_policy'], seed=0)
+    cpu = CentralProcessingUnit(configuration['memory_mb'], hardware_costs['context_switch_cost'],
+                                hardware_costs['cache_warmup_penalty'])
+    operating_system = OperatingSystem(
+        cpu, configuration['round_robin_timing'], memory_manager, clock)
+    # The os prints as it schedules, which is not wanted for headless runs
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        processes = schedule_workload(operating_system, workload)
+        while operating_system.unfinished_processes and clock.time_elapsed < horizon:
+            operating_system.tick()
+            clock.advance()
+    return measure_simulation(configuration, processes, clock)
+
+
+def measure_simulation(configuration: TunerConfiguration, processes: list, clock: SimulatedClock) -> SimulationResult:
+    '''Calculates throughput, response and turnaround times. Processes that have arrived but not yet run count as waiting until now.'''
+    now = clock.now()
+    response_times: dict[ProcessPriority, list[timedelta]] = {
+        priority: [] for priority in ProcessPriority}
+    waiting_times: dict[ProcessPriority, list[timedelta]] = {
+        priority: [] for priority in ProcessPriority}
+    turnaround_times = []
+    for process in processes:
+        if process.time_arrived is None:
+            continue
+        first_run = process.time_first_run if process.time_first_run is not None else now
+        response_times[process.base_priority].append(
+            first_run - process.time_arrived)
+        if process.time_finished is not None:
+            turnaround_times.append(
+                process.time_finished - process.time_arrived)
+            waiting_times[process.base_priority].append(process.time_waiting)
+    elapsed_seconds = clock.time_elapsed.total_seconds()
+    return {
+        'configuration': configuration,
+        'horizon': clock.time_elapsed,
+        'processes_finished': len(turnaround_times),
+        'throughput': len(turnaround_times) / elapsed_seconds if elapsed_seconds else 0,
+        'p99_response_times': {priority: percentile(times, 0.99) for priority, times in response_times.items()},
+        'mean_waiting_times': {priority: sum(times, timedelta(seconds=0)) / len(times) if times else None for priority, times in waiting_times.items()},
+        'p99_waiting_times': {priority: percentile(times, 0.99) for priority, times in waiting_times.items()},
+        'mean_turnaround_time': sum(turnaround_times, timedelta(seconds=0)) / len(turnaround_times) if turnaround_times else None
+    }
+
+
+def p99_high_priority_response_time(result: SimulationResult) -> float:
+    '''The default objective to minimise, in seconds'''
+    response_time = result['p99_response_times'][ProcessPriority.HIGH]
+    return response_time.total_seconds() if response_time is not None else 0
+
+
+def tune(workload: list[ProcessSpecification], search_space: dict[str, list] = None, objective: callable = p99_high_priority_response_time, throughput_floor: float = 0.5, min_horizon: timedelta = timedelta(seconds=10), max_horizon: timedelta = None, reduction_factor: int = 3, min_survivors: int = 3, max_workers: int = None, configurations: list[TunerConfiguration] = None, step: timedelta = SIMULATION_STEP, hardware_costs: HardwareCosts = DEFAULT_HARDWARE_COSTS) -> TuningResult:
+    '''Searches every combination in `search_space` (or the given `configurations`, such as those kept by `estimator.prune_configurations`) for the configuration that minimises `objective` while keeping throughput at or above `throughput_floor`.
+    Uses successive halving: every configuration is simulated for `min_horizon`, then only the best `1/reduction_factor` (but at least `min_survivors`) are simulated again for `reduction_factor` times as long, until `max_horizon`.
+    Every configuration is simulated with the same `hardware_costs`. The trade-off curve is taken from the first round, the only one every configuration is simulated in.'''
+    if not workload:
+        raise ValueError('Workload has no processes to tune for')
+    if search_space is None:
+        search_space = DEFAULT_SEARCH_SPACE
+    if max_horizon is None:
+        # Long enough for every process to arrive and, in most configurations, finish
+        max_horizon = workload[-1]['arrival_time'] + sum(
+            [specification['time_to_complete'] for specification in workload], timedelta(seconds=0))
+
+    def rank(result: SimulationResult) -> tuple:
+        # Configurations that meet the throughput floor come first, then the rest by how close they get to it
+        if result['throughput'] >= throughput_floor:
+            return (0, objective(result))
+        return (1, -result['throughput'])
+
+    if configurations is None:
+        configurations = [dict(zip(search_space.keys(), values))
+                          for values in product(*search_space.values())]
+    horizon = min(min_horizon, max_horizon)
+    history: list[SimulationResult] = []
+    first_round_results: list[SimulationResult] = None
+    with ProcessPoolExecutor(max_workers) as executor:
+        while True:
+            results = list(executor.map(
+                simulate, configurations, repeat(workload), repeat(horizon), repeat(step), repeat(hardware_costs)))
+            history.extend(results)
+            if first_round_results is None:
+                first_round_results = results[:]
+            results.sort(key=rank)
+            if len(results) == 1 or horizon >= max_horizon:
+                break
+            # Drop the worst configurations before simulating for longer
+            configurations = [result['configuration'] for result in results[:max(
+                min_survivors, len(results) // reduction_factor)]]
+            horizon = min(horizon * reduction_factor, max_horizon)
+    return {
+        'best': results[0],
+        'trade_off_curve': trade_off_curve(first_round_results, objective),
+        'history': history
+    }
+
+
+def trade_off_curve(results: list[SimulationResult], objective: callable) -> list[SimulationResult]:
+    '''The results not beaten on both throughput and the objective by any other result, ordered by throughput'''
+    curve = []
+    for result in sorted(results, key=lambda result: (-result['throughput'], objective(result))):
+        if not curve or objective(result) < objective(curve[-1]):
+            curve.append(result)
+    return list(reversed(curve))
+
+
+def describe_result(result: SimulationResult) -> str:
+    configuration = result['configuration']
+    policy = configuration['page_replacement_policy']
+    p99_response_times = ', '.join(
+        f'{priority.name} {time}' for priority, time in result['p99_response_times'].items() if time is not None)
+    return f"quantum {configuration['round_robin_timing']}, memory {configuration['memory_mb']}MB, paging {policy.name if policy is not None else 'off'}: throughput {result['throughput']:.3f}/s over {result['horizon']}, p99 response {p99_response_times}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Tunes the round robin quantum, memory size and paging policy for a generated workload')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=40)
+    parser.add_argument('--throughput-floor', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--context-switch-ms', type=float,
+                        default=DEFAULT_HARDWARE_COSTS['context_switch_cost'].total_seconds() * 1000)
+    parser.add_argument('--cache-warmup-ms', type=float,
+                        default=DEFAULT_HARDWARE_COSTS['cache_warmup_penalty'].total_seconds() * 1000)
+    arguments = parser.parse_args()
+    hardware_costs: HardwareCosts = {
+        'context_switch_cost': timedelta(milliseconds=arguments.context_switch_ms),
+        'cache_warmup_penalty': timedelta(milliseconds=arguments.cache_warmup_ms)
+    }
+    tuning_result = tune(generate_workload(arguments.seed, arguments.processes),
+                         throughput_floor=arguments.throughput_floor, max_workers=arguments.workers, hardware_costs=hardware_costs)
+    print(f'{len(tuning_result["history"])} simulations run')
+    print('Best configuration:')
+    print(f'  {describe_result(tuning_result["best"])}')
+    print(f'Trade-off curve after {tuning_result["trade_off_curve"][0]["horizon"]}:')
+    for result in tuning_result['trade_off_curve']:
+        print(f'  {describe_result(result)}')
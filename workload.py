@@ -0,0 +1,83 @@
+from datetime import timedelta
+from random import Random
+from typing import TypedDict, Union
+from enums import ProcessPriority, PreemptReason
+from memory import Memory, MemoryUnits
+from process import Process
+
+
+class ProcessSpecification(TypedDict):
+    '''Everything needed to recreate a process, so the same workload can be given to several simulations (or sent to other processes)'''
+    arrival_time: timedelta
+    time_to_complete: timedelta
+    memory_mb: float
+    priority: ProcessPriority
+    # CPU time recieved before the process blocks, or `None` if it never blocks
+    time_to_blocked: Union[timedelta, None]
+    # How many cycles of the os the process stays blocked for
+    turns_blocked: int
+
+
+def generate_workload(seed: int, number_of_processes: int = 40, arrivals_per_second: float = 1.5, priority_weights: dict[ProcessPriority, float] = None, mean_time_to_complete: timedelta = timedelta(seconds=1), memory_range_mb: tuple[float, float] = (2, 200)) -> list[ProcessSpecification]:
+    '''Generates a reproducible workload with Poisson arrivals and exponentially distributed cpu bursts. Processes block with the same probabilities as `testing.create_process`.'''
+    if priority_weights is None:
+        priority_weights = {ProcessPriority.HIGH: 0.3,
+                            ProcessPriority.IO: 0.4, ProcessPriority.LOW: 0.3}
+    random = Random(seed)
+    priorities = list(priority_weights.keys())
+    weights = list(priority_weights.values())
+    workload: list[ProcessSpecification] = []
+    arrival_time = timedelta(seconds=0)
+    for _ in range(number_of_processes):
+        priority = random.choices(priorities, weights)[0]
+        # Round to milliseconds so times print neatly
+        time_to_complete = timedelta(milliseconds=max(
+            100, round(random.expovariate(1) * mean_time_to_complete.total_seconds() * 1000)))
+        blocked_probability = 0.6 if priority == ProcessPriority.IO else 0.1
+        time_to_blocked = None
+        turns_blocked = 0
+        if random.random() < blocked_probability:
+            time_to_blocked = timedelta(milliseconds=round(
+                random.random() * time_to_complete.total_seconds() * 1000))
+            turns_blocked = random.randint(3, 7)
+        workload.append({
+            'arrival_time': arrival_time,
+            'time_to_complete': time_to_complete,
+            'memory_mb': round(random.uniform(*memory_range_mb), 1),
+            'priority': priority,
+            'time_to_blocked': time_to_blocked,
+            'turns_blocked': turns_blocked
+        })
+        arrival_time += timedelta(milliseconds=round(
+            random.expovariate(arrivals_per_second) * 1000))
+    return workload
+
+
+def create_process(specification: ProcessSpecification, identifier: str = None) -> Process:
+    '''Creates a new process from its specification'''
+    new_process = Process(specification['time_to_complete'], Memory(
+        specification['memory_mb'], MemoryUnits.MB), specification['priority'], identifier)
+    if specification['time_to_blocked'] is not None:
+        turns_blocked = specification['turns_blocked']
+
+        def blocked_func():
+            for i in range(turns_blocked):
+                yield True
+            yield False
+
+        new_process.add_preemption(
+            PreemptReason.BLOCKED, specification['time_to_blocked'], blocked_func)
+    return new_process
+
+
+def schedule_workload(operating_system, workload: list[ProcessSpecification]) -> list[Process]:
+    '''Creates the processes of a workload and schedules each to arrive at its arrival time. Returns the processes.
+    Processes are named by their position in the workload, so the same workload has the same names in every simulation.'''
+    processes = []
+    for index, specification in enumerate(workload):
+        new_process = create_process(
+            specification, 'Process' + str(index + 1))
+        operating_system.schedule_process(
+            new_process, specification['arrival_time'])
+        processes.append(new_process)
+    return processes